@@ -50,6 +50,26 @@ CATEGORIES_SHEET_NAME = os.getenv("CATEGORIES_SHEET_NAME", "Categories")
 CHECK_API_TOKEN = os.getenv("CHECK_API_TOKEN") 
 CHECK_API_URL = "https://proverkacheka.com/api/v1/check/get" 
 CHECK_API_TIMEOUT = 25 
+# Сколько хранить распознанные чеки в кэше (повторная отправка того же фото не вызывает API)
+RECEIPT_CACHE_TTL = 7 * 24 * 60 * 60
+# Очередь обработки чеков: число воркеров, максимум задач в очереди
+# и глобальный лимит одновременных запросов к API чеков
+RECEIPT_WORKERS = int(os.getenv("RECEIPT_WORKERS", "4"))
+RECEIPT_QUEUE_MAXSIZE = int(os.getenv("RECEIPT_QUEUE_MAXSIZE", "100"))
+CHECK_API_CONCURRENCY = int(os.getenv("CHECK_API_CONCURRENCY", "2"))
+# Справедливое планирование: сколько чеков одного пользователя обрабатывается одновременно
+# и сколько может ждать в очереди
+RECEIPT_USER_CONCURRENCY = 1
+RECEIPT_USER_QUEUE_LIMIT = 10
+# Чтение истории из Google Sheets: одновременные запросы (всего и на пользователя) и глубина очереди пользователя
+SHEETS_READ_CONCURRENCY = 2
+SHEETS_READ_USER_QUEUE_LIMIT = 3
+# Альбомы чеков: пауза после последнего фото, после которой альбом считается собранным (сек.),
+# и число чеков альбома, распознаваемых одновременно
+ALBUM_COLLECT_DELAY = 1.0
+ALBUM_CONCURRENCY = 3
+# Сколько помнить обработанные подтверждения (повторное нажатие «Подтвердить» или повторная доставка апдейта)
+IDEMPOTENCY_TTL = 24 * 60 * 60
 
 # --- Тайм-ауты и ограничения ---
 SHEET_WRITE_TIMEOUT = 15  # Таймаут для операций с Google Sheets
@@ -58,16 +78,14 @@ SHEET_WRITE_TIMEOUT = 15  # Таймаут для операций с Google She
 KEYWORDS_SPREADSHEET_ID = os.getenv("KEYWORDS_SPREADSHEET_ID", GOOGLE_SHEET_URL)
 KEYWORDS_SHEET_NAME = os.getenv("KEYWORDS_SHEET_NAME", "Keywords")
 
-# --- ХРАНИЛИЩЕ КАТЕГОРИЙ (замена глобальных переменных) ---
-class CategoryStorage:
-    def __init__(self):
-        self.expense = []
-        self.income = []
-        self.keywords = {}
-        self.last_loaded = None
+# --- ХРАНИЛИЩЕ КАТЕГОРИЙ (версионируемый реестр, см. models/category_registry.py) ---
+from models.category_registry import CategoryRegistry
+
+# Старое имя класса оставлено для совместимости
+CategoryStorage = CategoryRegistry
 
 # Единственный экземпляр для доступа ко всем категориям
-CATEGORY_STORAGE = CategoryStorage()
+CATEGORY_STORAGE = CategoryRegistry()
 
 
 # Проверка базовой конфигурации
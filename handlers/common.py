@@ -14,14 +14,16 @@ from aiogram import F
 from config import ALLOWED_USER_IDS, CATEGORY_STORAGE, logger
 from models.transaction import TransactionData, CheckData
 from dataclasses import dataclass
-from typing import Optional, Dict, Any
-from utils.exceptions import SheetWriteError, TransactionSaveError
+from typing import Optional, Dict, Any, Tuple
+from utils.exceptions import SheetWriteError, TransactionSaveError, SchedulerQueueFull
 from utils.service_wrappers import safe_answer, edit_or_send, clean_previous_kb
 from utils.keyboards import get_main_keyboard, get_history_keyboard, HistoryCallbackData
 from sheets.client import get_latest_transactions
 from services.repository import TransactionRepository
+from services.fair_scheduler import FairScheduler, fair_slot
 from services.transaction_service import TransactionService
 from services.transaction_service import TransactionService
+from services.receipt_reprocessor import reprocess_receipts
 from utils.messages import MSG
 from aiogram.filters import Command, or_f
 
@@ -107,6 +109,45 @@ async def test_sheets_handler(message: types.Message, transaction_service: Trans
         )
 
 
+# --- КОМАНДА /reprocess ---
+# ----------------------------------------------------------------------
+
+
+async def reprocess_command_handler(message: types.Message, transaction_service: TransactionService):
+    """
+    Обработчик команды /reprocess: заново классифицирует сохраненные чеки пользователя без обращения к API.
+    По умолчанию только показывает изменения; /reprocess apply обновляет категории транзакций, еще не
+    выгруженных в Google Sheets. Выгруженные строки не изменяются, классификатор на результатах не дообучается.
+    """
+    apply = (message.text or "").split()[1:2] == ["apply"]
+    status_msg = await message.answer(MSG.reprocess_started)
+
+    try:
+        report = await reprocess_receipts(
+            transaction_service.repository, transaction_service.classifier, message.from_user.id, apply=apply
+        )
+    except Exception as e:
+        logger.error(f"❌ Ошибка повторной обработки чеков: {e}")
+        await edit_or_send(message.bot, status_msg, text=MSG.reprocess_error.format(error=e))
+        return
+
+    text = MSG.reprocess_report.format(
+        mode=" (применено)" if apply else "",
+        checked=report.checked,
+        changed=report.changed,
+        synced=report.synced,
+        failed=report.failed,
+    )
+    if report.changes:
+        text += "\n\n" + "\n".join(
+            f"• {old} → {new}: {count}" for (old, new), count in report.changes.most_common(10)
+        )
+    if report.changed:
+        text += MSG.reprocess_applied_hint if apply else MSG.reprocess_dry_run_hint
+
+    await edit_or_send(message.bot, status_msg, text=text, parse_mode="Markdown")
+
+
 # --- КОМАНДА /undo ---
 # ----------------------------------------------------------------------
 
@@ -257,11 +298,35 @@ async def close_undo_handler(callback: types.CallbackQuery):
 # --- КОМАНДА ИСТОРИИ ТРАНЗАКЦИЙ ---
 # ----------------------------------------------------------------------
 
-async def history_command_handler(message: types.Message):
+async def load_history_page(user_id: str, offset: int, scheduler: Optional[FairScheduler], scheduler_key: int,
+                            on_queued=None) -> Tuple[list, bool]:
+    """
+    Читает страницу истории из Google Sheets через справедливую очередь чтения
+    и проверяет, есть ли следующая страница.
+    """
+    async with fair_slot(scheduler, scheduler_key, on_queued):
+        transactions = await get_latest_transactions(user_id=user_id, limit=5, offset=offset)
+        if not transactions:
+            return [], False
+        # Получаем транзакцию после текущей страницы, чтобы проверить, есть ли следующая страница
+        next_transactions = await get_latest_transactions(user_id=user_id, limit=1, offset=offset + 5)
+        return transactions, len(next_transactions) > 0
+
+
+async def history_command_handler(message: types.Message, sheets_scheduler: Optional[FairScheduler] = None):
     """Обработчик команды /history для просмотра последних транзакций."""
     # Получаем последние 5 транзакций с нулевым смещением
     user_id = message.from_user.username or str(message.from_user.id)
-    transactions = await get_latest_transactions(user_id=user_id, limit=5, offset=0)
+
+    async def notify_queued(position: int):
+        await message.answer(MSG.request_queued.format(position=position))
+
+    try:
+        transactions, has_next = await load_history_page(user_id, 0, sheets_scheduler, message.from_user.id, notify_queued)
+    except SchedulerQueueFull as e:
+        logger.warning(f"⚠️ Запрос истории отклонен: {e}")
+        await message.answer(MSG.request_queue_full)
+        return
     
     if not transactions:
         await message.answer("📋 У вас пока нет транзакций в истории.")
@@ -282,27 +347,36 @@ async def history_command_handler(message: types.Message):
             f"   Комментарий: {comment}\n\n"
         )
     
-    # Проверяем, есть ли следующие транзакции для пагинации
-    # Получаем 6-ю транзакцию, чтобы проверить, есть ли следующая страница
-    next_transactions = await get_latest_transactions(user_id=user_id, limit=1, offset=5)
-    has_next = len(next_transactions) > 0
-
     # Создаем клавиатуру с пагинацией
     keyboard = get_history_keyboard(offset=0, has_next=has_next)
 
     await message.answer(history_text, reply_markup=keyboard, parse_mode="Markdown")
 
 
-async def history_callback_handler(callback: types.CallbackQuery, callback_data: HistoryCallbackData):
+async def history_callback_handler(callback: types.CallbackQuery, callback_data: HistoryCallbackData,
+                                   sheets_scheduler: Optional[FairScheduler] = None):
     """Обработчик кнопок пагинации истории транзакций."""
-    await safe_answer(callback)  # Безопасно отвечаем на callback
-    
     offset = callback_data.offset
     direction = callback_data.direction
     
     # Получаем транзакции с новым смещением
     user_id = callback.from_user.username or str(callback.from_user.id)
-    transactions = await get_latest_transactions(user_id=user_id, limit=5, offset=offset)
+
+    answered = False
+
+    async def notify_queued(position: int):
+        # Ответ на callback сразу показывает позицию в очереди вместо «часиков»
+        nonlocal answered
+        answered = await safe_answer(callback, MSG.request_queued.format(position=position))
+
+    try:
+        transactions, has_next = await load_history_page(user_id, offset, sheets_scheduler, callback.from_user.id, notify_queued)
+    except SchedulerQueueFull as e:
+        logger.warning(f"⚠️ Запрос истории отклонен: {e}")
+        await safe_answer(callback, MSG.request_queue_full, show_alert=True)
+        return
+    if not answered:
+        await safe_answer(callback)  # Безопасно отвечаем на callback
     
     if not transactions:
         try:
@@ -331,11 +405,6 @@ async def history_callback_handler(callback: types.CallbackQuery, callback_data:
             f"   Комментарий: {comment}\n\n"
         )
     
-    # Проверяем, есть ли следующие транзакции для пагинации
-    # Получаем транзакцию после текущей страницы, чтобы проверить, есть ли следующая страница
-    next_transactions = await get_latest_transactions(user_id=user_id, limit=1, offset=offset + 5)
-    has_next = len(next_transactions) > 0
-
     # Проверяем, есть ли предыдущие транзакции для пагинации
     has_prev = offset > 0
 
@@ -392,6 +461,7 @@ def register_common_handlers(dp: Router):
     dp.message.register(command_start_handler, Command(commands=["start"]), AllowedUsersFilter())
     dp.message.register(test_sheets_handler, or_f(Command(commands=["test_sheets"]), F.text == "🧪 Проверить Sheets"), AllowedUsersFilter())
     dp.message.register(undo_command_handler, Command(commands=["undo"]), AllowedUsersFilter())
+    dp.message.register(reprocess_command_handler, Command(commands=["reprocess"]), AllowedUsersFilter())
     dp.message.register(history_command_handler, or_f(Command(commands=["history"]), F.text == "📜 История транзакций"), AllowedUsersFilter())
     
     # Регистрируем обработчики callback'ов для undo
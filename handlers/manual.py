@@ -18,11 +18,12 @@ from dataclasses import dataclass
 from typing import Optional, Dict, Any
 from utils.exceptions import SheetWriteError, TransactionSaveError
 from utils.service_wrappers import safe_answer, edit_or_send, clean_previous_kb
-from utils.keyboards import get_main_keyboard
+from utils.keyboards import get_main_keyboard, get_category_reply_keyboard
 from sheets.client import get_latest_transactions
 from services.repository import TransactionRepository
 from services.input_parser import InputParser
 from services.transaction_service import TransactionService
+from services.idempotency import IdempotencyGuard, claim_confirmation, confirmation_keys, new_draft_token, save_confirmed
 from utils.messages import MSG
 
 from aiogram.filters import Command, or_f
@@ -117,17 +118,7 @@ async def process_type_selection(message: types.Message, state: FSMContext):
     await state.update_data(transaction_type=transaction_type)
     
     # Показываем клавиатуру с категориями
-    categories = CATEGORY_STORAGE.income if transaction_type == "Доход" else CATEGORY_STORAGE.expense
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text=cat) for cat in categories[i:i + 2]]
-            for i in range(0, len(categories), 2)
-        ] + [
-            [KeyboardButton(text=MSG.btn_cancel)]
-        ],
-        resize_keyboard=True,
-        one_time_keyboard=True
-    )
+    keyboard = get_category_reply_keyboard(transaction_type)
     
     await message.answer(
         MSG.choose_category.format(type=transaction_type),
@@ -152,8 +143,7 @@ async def process_category_selection(message: types.Message, state: FSMContext):
     transaction_type = data.get('transaction_type')
     
     # Проверяем, что выбранная категория соответствует типу
-    valid_categories = CATEGORY_STORAGE.income if transaction_type == "Доход" else CATEGORY_STORAGE.expense
-    if user_input_raw not in valid_categories:
+    if not CATEGORY_STORAGE.snapshot.is_valid(user_input_raw, transaction_type):
         await message.answer(f"❌ Пожалуйста, выберите категорию из списка для типа **{transaction_type}**.")
         return
 
@@ -231,8 +221,8 @@ async def process_comment_input(message: types.Message, state: FSMContext):
         transaction_dt=datetime.now()
     )
     
-    # Сохраняем объект транзакции в FSM для последующего использования
-    await state.update_data(transaction_data=transaction_data)
+    # Сохраняем объект транзакции в FSM для последующего использования (с токеном черновика)
+    await state.update_data(transaction_data=transaction_data, draft_token=new_draft_token())
     
     # Показываем сводку и спрашиваем подтверждение
     summary = (f"📋 **Новая транзакция**\n\n"
@@ -258,7 +248,8 @@ async def process_comment_input(message: types.Message, state: FSMContext):
 # --- C. ОБРАБОТКА FSM (Подтверждение) ---
 # ----------------------------------------------------------------------
 
-async def confirm_manual_transaction(callback: types.CallbackQuery, state: FSMContext, transaction_service: TransactionService):
+async def confirm_manual_transaction(callback: types.CallbackQuery, state: FSMContext, transaction_service: TransactionService,
+                                     idempotency_guard: Optional[IdempotencyGuard] = None):
     """Подтверждает и записывает транзакцию."""
     
     await safe_answer(callback)
@@ -277,6 +268,11 @@ async def confirm_manual_transaction(callback: types.CallbackQuery, state: FSMCo
             )
             return
 
+        # Повторное нажатие или повторная доставка апдейта не записывает транзакцию второй раз
+        keys = confirmation_keys(callback, data)
+        if not await claim_confirmation(idempotency_guard, keys):
+            return
+
         # Получаем сервис для сохранения
         # Service injected
         service = transaction_service
@@ -284,7 +280,7 @@ async def confirm_manual_transaction(callback: types.CallbackQuery, state: FSMCo
 
         # Сохраняем транзакцию
         try:
-            await service.finalize_transaction(transaction_data)
+            await save_confirmed(idempotency_guard, keys, service.finalize_transaction(transaction_data))
             await edit_or_send(
                 callback.bot,
                 callback.message,
@@ -440,7 +436,8 @@ async def process_edit_comment(callback: types.CallbackQuery, state: FSMContext)
     )
 
 
-async def confirm_draft(callback: types.CallbackQuery, state: FSMContext, transaction_service: TransactionService):
+async def confirm_draft(callback: types.CallbackQuery, state: FSMContext, transaction_service: TransactionService,
+                        idempotency_guard: Optional[IdempotencyGuard] = None):
     """Подтверждение и запись черновика транзакции"""
     from utils.service_wrappers import safe_answer, edit_or_send
     # from services.global_service_locator import get_transaction_service # Removed
@@ -462,6 +459,11 @@ async def confirm_draft(callback: types.CallbackQuery, state: FSMContext, transa
                 parse_mode="Markdown"
             )
             return
+
+        # Повторное нажатие или повторная доставка апдейта не записывает транзакцию второй раз
+        keys = confirmation_keys(callback, data)
+        if not await claim_confirmation(idempotency_guard, keys):
+            return
         
         # Создаем объект транзакции
         transaction_data = TransactionData(
@@ -484,7 +486,7 @@ async def confirm_draft(callback: types.CallbackQuery, state: FSMContext, transa
         
         # Сохраняем транзакцию
         try:
-            await service.finalize_transaction(transaction_data)
+            await save_confirmed(idempotency_guard, keys, service.finalize_transaction(transaction_data))
             await edit_or_send(
                 callback.bot,
                 callback.message,
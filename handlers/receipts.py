@@ -2,6 +2,7 @@
 # handlers/receipts.py
 import asyncio
 import re
+import uuid
 from datetime import datetime
 from aiogram import Router, types
 from aiogram.filters import BaseFilter
@@ -12,20 +13,27 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram import F
 
 # Импорты из нашей структуры
-from config import ALLOWED_USER_IDS, CATEGORY_STORAGE, logger, SHEET_WRITE_TIMEOUT
+from config import ALLOWED_USER_IDS, CATEGORY_STORAGE, logger, SHEET_WRITE_TIMEOUT, ALBUM_CONCURRENCY
 from models.transaction import TransactionData, CheckData
 from dataclasses import dataclass
-from typing import Optional, Dict, Any
-from utils.exceptions import SheetWriteError, CheckApiTimeout, CheckApiRecognitionError, TransactionSaveError
-from utils.service_wrappers import safe_answer, edit_or_send, clean_previous_kb
-from utils.keyboards import get_main_keyboard
+from typing import Optional, Dict, Any, Awaitable, Callable
+from utils.exceptions import SheetWriteError, CheckApiTimeout, CheckApiRecognitionError, TransactionSaveError, ReceiptDownloadError, SchedulerQueueFull, UserQueueLimit, DuplicateReceiptError
+from utils.service_wrappers import safe_answer, edit_or_send, edit_reply_markup, clean_previous_kb
+from utils.keyboards import get_main_keyboard, get_category_inline_keyboard, parse_category_callback
+from utils.split_keyboards import (
+    full_mask, get_categories_inline_keyboard, get_items_page_keyboard, mask_count, mask_indices, mask_sum, page_count,
+)
 from sheets.client import get_latest_transactions
 from services.repository import TransactionRepository
 from services.input_parser import InputParser
 from services.transaction_service import TransactionService
+from services.album_collector import AlbumCollector
+from services.idempotency import IdempotencyGuard, claim_confirmation, confirmation_keys, new_draft_token, save_confirmed
+from services.receipt_queue import (
+    ReceiptJob, ReceiptJobQueue, new_job_id, run_receipt_job, STAGE_TEXT, STAGE_DOWNLOADING, STAGE_RECOGNIZING, STAGE_CLASSIFYING,
+)
 from utils.messages import MSG
 from aiogram.filters import Command
-import aiohttp
 
 
 # --- A. ФИЛЬТР И FSM ---
@@ -59,8 +67,12 @@ from utils.states import TransactionStates
 # --- D. ХЕНДЛЕР ЧЕКОВ (СЛОЖНЫЙ) ---
 # ----------------------------------------------------------------------
 
-async def handle_photo(message: types.Message, state: FSMContext, transaction_service: TransactionService):
-    await state.clear()
+async def handle_photo(message: types.Message, state: FSMContext, transaction_service: TransactionService,
+                       receipt_queue: Optional[ReceiptJobQueue] = None, album_collector: Optional[AlbumCollector] = None):
+    # Фото альбома приходят отдельными апдейтами: состояние сбрасывается один раз, когда альбом собран
+    in_album = album_collector is not None and message.media_group_id is not None
+    if not in_album:
+        await state.clear()
     
     try:
         # Определяем файл для скачивания
@@ -79,30 +91,126 @@ async def handle_photo(message: types.Message, state: FSMContext, transaction_se
         else:
             return
 
-        status_msg = await message.answer(MSG.receipt_sending_to_api)
-        
+        if in_album:
+            async def submit_album(file_objects: list):
+                await state.clear()
+                await submit_receipt_job(
+                    message, receipt_queue, MSG.album_queued, len(file_objects),
+                    lambda job, status_msg: process_album_job(job, message, state, transaction_service, file_objects, status_msg)
+                )
+
+            album_collector.add(message.media_group_id, file_object, submit_album)
+            return
+
+        await submit_receipt_job(
+            message, receipt_queue, MSG.receipt_queued, 1,
+            lambda job, status_msg: process_receipt_job(job, message, state, transaction_service, file_object, status_msg)
+        )
+    except Exception as e:
+        logger.error(f"Неожиданная ошибка в handle_photo: {e}")
+        try:
+            await message.answer(f"❌ **Критическая ошибка при обработке чека:** {e}")
+        except Exception:
+            logger.error(f"Не удалось отправить сообщение об ошибке в handle_photo: {e}")
+
+
+async def submit_receipt_job(message: types.Message, receipt_queue: Optional[ReceiptJobQueue], queued_text: str,
+                             count: int, process: Callable[[ReceiptJob, types.Message], Awaitable[None]]):
+    """
+    Отправляет статусное сообщение с номером задачи и ставит задачу в очередь.
+    process(job, status_msg) выполняется воркером очереди; без очереди — сразу.
+    """
+    job_id = new_job_id()
+    try:
+        position = receipt_queue.position(message.from_user.id) if receipt_queue is not None else 1
+    except UserQueueLimit as e:
+        logger.warning(f"⚠️ Задача пользователя {message.from_user.id} отклонена: {e}")
+        await message.answer(MSG.receipt_user_queue_full)
+        return
+    except SchedulerQueueFull as e:
+        logger.warning(f"⚠️ Очередь чеков переполнена, задача пользователя {message.from_user.id} отклонена: {e}")
+        await message.answer(MSG.receipt_queue_full)
+        return
+    status_msg = await message.answer(queued_text.format(job_id=job_id, position=position, count=count), parse_mode="Markdown")
+
+    async def run(job: ReceiptJob):
+        await process(job, status_msg)
+
+    async def report_stage(job: ReceiptJob, stage: str):
+        await edit_or_send(message.bot, status_msg, MSG.receipt_job_stage.format(job_id=job.job_id, stage=STAGE_TEXT[stage]),
+                           parse_mode="Markdown")
+
+    # Альбом стоит столько, сколько в нем фото: при справедливом планировании он не обгоняет одиночные чеки других
+    job = ReceiptJob(user_id=message.from_user.id, run=run, on_stage=report_stage, job_id=job_id, cost=count)
+
+    if receipt_queue is None:
+        # Без очереди обрабатываем чек сразу
+        await run_receipt_job(job)
+        return
+
+    # Хендлер сразу возвращается: чек обрабатывается, когда планировщик выдаст слот
+    try:
+        receipt_queue.submit(job)
+    except SchedulerQueueFull as e:
+        logger.warning(f"⚠️ Очередь чеков переполнена, задача {job.job_id} отклонена: {e}")
+        await edit_or_send(message.bot, status_msg, MSG.receipt_queue_full)
+
+
+def make_fetch_image(bot: Bot, service: TransactionService, file_object, job: Optional[ReceiptJob] = None):
+    """
+    Скачивание файла чека из Telegram (вызывается, только если чека нет в кэше).
+    Если передана задача, она переводится на этапы скачивания и распознавания.
+    """
+    async def fetch_image() -> bytes:
+        if job is not None:
+            await job.set_stage(STAGE_DOWNLOADING)
+        try:
+            file_info = await bot.get_file(file_object.file_id)
+            file_url = f"https://api.telegram.org/file/bot{bot.token}/{file_info.file_path}"
+            # Общий сеанс сервиса переиспользует соединение с api.telegram.org
+            image_bytes = await service.download_file(file_url)
+        except Exception as e:
+            raise ReceiptDownloadError(str(e)) from e
+        if job is not None:
+            await job.set_stage(STAGE_RECOGNIZING)
+        return image_bytes
+
+    return fetch_image
+
+
+def duplicate_receipt_text(error: DuplicateReceiptError) -> str:
+    """Ответ «чек уже записан»: кем и когда"""
+    details = []
+    if error.username:
+        details.append(error.username)
+    if error.recorded_at:
+        details.append(datetime.fromtimestamp(error.recorded_at).strftime('%d.%m.%Y %H:%M'))
+    return MSG.receipt_already_recorded.format(details=f" ({', '.join(details)})" if details else "")
+
+
+async def process_receipt_job(job: ReceiptJob, message: types.Message, state: FSMContext,
+                              transaction_service: TransactionService, file_object, status_msg: types.Message):
+    """
+    Обработка чека в воркере очереди: скачивание, распознавание, классификация и показ результата.
+    """
+    try:
         # 0. Загружаем категории из Google Sheets с кэшированием, чтобы использовать актуальные ключевые слова
         # Загрузка происходит с кэшированием, поэтому не будет частых обращений к API
-        # Service injected
         service = transaction_service
-        # Checks removed
         await service.load_categories()
         
-        file_info = await message.bot.get_file(file_object.file_id)
-        file_url = f"https://api.telegram.org/file/bot{message.bot.token}/{file_info.file_path}"
-        
-        # 1. Скачивание файла
+        # 1. Скачивание файла (только если чека нет в кэше)
+        fetch_image = make_fetch_image(message.bot, service, file_object, job)
+
+        # 2. Распознавание чека через TransactionService (с кэшем по file_unique_id и содержимому)
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(file_url) as response:
-                    image_bytes = await response.read()
-        except Exception as e:
+            parsed_data: CheckData = await service.recognize_receipt(file_object.file_unique_id, fetch_image)
+        except DuplicateReceiptError as e:
+            await edit_or_send(message.bot, status_msg, duplicate_receipt_text(e))
+            return
+        except ReceiptDownloadError as e:
             await edit_or_send(message.bot, status_msg, f"❌ Ошибка скачивания файла: {e}")
             return
-
-        # 2. Обработка изображения чека через TransactionService
-        try:
-            parsed_data: CheckData = await service.create_transaction_from_check(image_bytes)
         except (CheckApiTimeout, CheckApiRecognitionError) as e:
             await edit_or_send(message.bot, status_msg, f"❌ {MSG.receipt_processing_failed} {e}\nПопробуйте ввести вручную: /new_transaction")
             return
@@ -110,9 +218,11 @@ async def handle_photo(message: types.Message, state: FSMContext, transaction_se
             await edit_or_send(message.bot, status_msg, f"❌ {e}. Введите вручную: /new_transaction")
             return
 
+        await job.set_stage(STAGE_CLASSIFYING)
+
         # 3. Обработка данных чека через TransactionService
         try:
-            transaction = await service.process_check_data(parsed_data, message.from_user.username or message.from_user.full_name, message.from_user.id)
+            transaction, classification = await service.process_check_data(parsed_data, message.from_user.username or message.from_user.full_name, message.from_user.id)
         except Exception as e:
             await edit_or_send(message.bot, status_msg, f"❌ Ошибка обработки данных чека: {e}")
             return
@@ -122,6 +232,8 @@ async def handle_photo(message: types.Message, state: FSMContext, transaction_se
         fsm_data = parsed_data.model_dump()
         # Добавляем объект datetime для дальнейшей записи
         fsm_data['transaction_dt'] = parsed_data.transaction_datetime
+        # Токен черновика: повторное подтверждение этого чека не записывает его второй раз
+        fsm_data['draft_token'] = new_draft_token()
         await state.update_data(**fsm_data)
         
         # --- Форматирование предпросмотра ---
@@ -137,27 +249,30 @@ async def handle_photo(message: types.Message, state: FSMContext, transaction_se
             items_preview = "**Позиции:**\n" + "\n".join([f"• {item}" for item in items_parts])
             
         check_date_preview = f"Дата операции: **{parsed_data.transaction_datetime.strftime('%d.%m.%Y %H:%M')}**\n"
-        fallback_category = CATEGORY_STORAGE.expense[-1] if CATEGORY_STORAGE.expense else "Прочее Расход"
+        fallback_category = CATEGORY_STORAGE.fallback_expense
         # -----------------------------------
 
         # Используем обработанную транзакцию
         predicted_category = transaction.category
-        # Используем уверенность из обработки, но для этого нужно получить её из сервиса
-        temp_transaction = TransactionData(
-            type=parsed_data.type,
-            category=parsed_data.category,
-            amount=parsed_data.amount,
-            comment=parsed_data.comment,
-            username=message.from_user.username or message.from_user.full_name,
-            user_id=message.from_user.id,
-            retailer_name=parsed_data.retailer_name,
-            items_list=parsed_data.items_list,
-            payment_info=parsed_data.payment_info,
-            transaction_dt=parsed_data.transaction_datetime
-        )
-        
-        # Получаем уверенность из классификатора
-        _, confidence = service.classifier.predict_category(temp_transaction)
+        # Уверенность берем из результата классификации, повторное предсказание не требуется
+        confidence = classification.confidence
+
+        # Предложение разделить чек по категориям позиций (все позиции классифицируются одним пакетом
+        # в рабочем потоке, чтобы длинный чек не блокировал event loop)
+        split_preview = ""
+        split_row = []
+        try:
+            split_proposal = await asyncio.to_thread(service.propose_split, parsed_data, parsed_data.category)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось классифицировать позиции чека: {e}")
+            split_proposal = []
+        if split_proposal:
+            await state.update_data(split_proposal=split_proposal)
+            split_preview = "\n\n✂️ **Предлагаемое разделение:**\n" + "\n".join(
+                f"• {group['category']}: **{group['amount']:.2f}** руб." for group in split_proposal
+            )
+            split_row = [types.InlineKeyboardButton(
+                text=f"✂️ Принять разделение ({len(split_proposal)})", callback_data="accept_split")]
         
         # Вместо предложения новой категории, используем только существующие категории
         if parsed_data.category == fallback_category or confidence < 0.5:
@@ -165,21 +280,18 @@ async def handle_photo(message: types.Message, state: FSMContext, transaction_se
             # --- ЛОГИКА 1: КАТЕГОРИЯ НЕ ОПРЕДЕЛЕНА, ЗАПРАШИВАЕМ РУЧНОЙ ВВОД (С ОБУЧЕНИЕМ) ---
             await state.set_state(TransactionStates.choosing_category_after_check)
             
-            buttons = [
-                types.InlineKeyboardButton(text=cat, callback_data=f"checkcat_{cat}")
-                for cat in CATEGORY_STORAGE.expense
-            ]
-            
-            keyboard = types.InlineKeyboardMarkup(
-                inline_keyboard=[buttons[i:i + 2] for i in range(0, len(buttons), 2)]
-            )
+            keyboard = get_category_inline_keyboard("Расход", prefix="checkcat")
+            if split_row:
+                # Кэшированная клавиатура не изменяется: строка предложения добавляется в новую разметку
+                keyboard = types.InlineKeyboardMarkup(inline_keyboard=[split_row] + keyboard.inline_keyboard)
             
             summary = (f"🔍 **Чек распознан, но категория не определена!**\n\n"
                        f"Сумма: **{parsed_data.amount}** руб.\n"
                        f"{check_date_preview}"
                        f"Продавец: *{parsed_data.retailer_name}*\n\n"
                        f"{items_preview}\n\n"
-                       f"⚠️ **Внимание:** Выберите категорию, чтобы бот **запомнил** продавца и товары для будущих чеков.")
+                       f"⚠️ **Внимание:** Выберите категорию, чтобы бот **запомнил** продавца и товары для будущих чеков."
+                       f"{split_preview}")
                       
             await edit_or_send(message.bot, status_msg, summary, reply_markup=keyboard, parse_mode="Markdown")
 
@@ -201,7 +313,7 @@ async def handle_photo(message: types.Message, state: FSMContext, transaction_se
                         types.InlineKeyboardButton(text="✂️ Разделить чек", callback_data="split_check"),
                         types.InlineKeyboardButton(text="❌ Отменить", callback_data="cancel_check")
                     ]
-                ]
+                ] + ([split_row] if split_row else [])
             )
             
             summary = (f"🧾 **Чек успешно распознан**\n\n"
@@ -209,16 +321,79 @@ async def handle_photo(message: types.Message, state: FSMContext, transaction_se
                        f"{check_date_preview}"
                        f"Продавец: *{parsed_data.retailer_name}*\n"
                        f"Категория: **{predicted_category}** (_{confidence:.0%}_)\n\n"
-                       f"{items_preview}")
+                       f"{items_preview}"
+                       f"{split_preview}")
             
             await edit_or_send(message.bot, status_msg, summary, reply_markup=keyboard, parse_mode="Markdown")
     except Exception as e:
-        logger.error(f"Неожиданная ошибка в handle_photo: {e}")
+        logger.error(f"Неожиданная ошибка при обработке чека {job.job_id}: {e}")
         try:
             await message.answer(f"❌ **Критическая ошибка при обработке чека:** {e}")
         except Exception:
             # Если даже ответить не получилось, просто логируем
-            logger.error(f"Не удалось отправить сообщение об ошибке в handle_photo: {e}")
+            logger.error(f"Не удалось отправить сообщение об ошибке обработки чека {job.job_id}: {e}")
+
+
+async def process_album_job(job: ReceiptJob, message: types.Message, state: FSMContext,
+                            transaction_service: TransactionService, file_objects: list, status_msg: types.Message):
+    """
+    Обработка альбома чеков в воркере очереди: чеки распознаются параллельно (не более ALBUM_CONCURRENCY
+    одновременно), затем показывается одна общая сводка с подтверждением всех чеков сразу.
+    """
+    service = transaction_service
+    await service.load_categories()
+    await job.set_stage(STAGE_RECOGNIZING)
+
+    username = message.from_user.username or message.from_user.full_name
+    limit = asyncio.Semaphore(ALBUM_CONCURRENCY)
+
+    async def recognize(file_object) -> TransactionData:
+        async with limit:
+            parsed_data = await service.recognize_receipt(
+                file_object.file_unique_id, make_fetch_image(message.bot, service, file_object)
+            )
+            transaction, _ = await service.process_check_data(parsed_data, username, message.from_user.id)
+            return transaction
+
+    results = await asyncio.gather(*[recognize(file_object) for file_object in file_objects], return_exceptions=True)
+
+    transactions = []
+    lines = []
+    receipt_keys = set()
+    for number, result in enumerate(results, start=1):
+        if isinstance(result, DuplicateReceiptError):
+            lines.append(f"{number}. ℹ️ уже записан")
+            continue
+        if isinstance(result, Exception):
+            logger.warning(f"⚠️ Чек {number} альбома {job.job_id} не распознан: {result}")
+            lines.append(f"{number}. ❌ не распознан: {result}")
+            continue
+        # Два фото одного чека в альбоме записываются один раз
+        if result.receipt_key and result.receipt_key in receipt_keys:
+            lines.append(f"{number}. ℹ️ повтор чека из этого альбома")
+            continue
+        receipt_keys.add(result.receipt_key)
+        transactions.append(result)
+        lines.append(f"{number}. {result.retailer_name or 'Продавец не указан'} — **{result.amount:.2f}** руб., {result.category}")
+
+    if not transactions:
+        await edit_or_send(message.bot, status_msg,
+                           MSG.album_failed.format(job_id=job.job_id, details="\n".join(lines)), parse_mode="Markdown")
+        return
+
+    await state.update_data(album_transactions=[transaction.model_dump() for transaction in transactions],
+                            draft_token=new_draft_token())
+    await state.set_state(TransactionStates.confirming_album)
+
+    keyboard = types.InlineKeyboardMarkup(inline_keyboard=[[
+        types.InlineKeyboardButton(text=f"✅ Записать все ({len(transactions)})", callback_data="confirm_album"),
+        types.InlineKeyboardButton(text="❌ Отменить", callback_data="cancel_check"),
+    ]])
+    summary = MSG.album_recognized.format(
+        job_id=job.job_id, recognized=len(transactions), count=len(file_objects),
+        details="\n".join(lines), total=sum(transaction.amount for transaction in transactions)
+    )
+    await edit_or_send(message.bot, status_msg, summary, reply_markup=keyboard, parse_mode="Markdown")
 
 
 # --- E. ХЕНДЛЕРЫ FSM (Ввод данных) ---
@@ -229,8 +404,13 @@ async def process_category_choice_after_check(callback: types.CallbackQuery, sta
     await safe_answer(callback) # <--- ИСПОЛЬЗУЕМ ОБЕРТКУ safe_answer
     
     try:
-        new_category = callback.data.split('_')[1]
         data = await state.get_data()
+        new_category = parse_category_callback(callback.data)
+        if new_category is None:
+            # Кнопка ссылается на категорию, удаленную из таблицы: показываем актуальный список
+            await edit_or_send(bot, callback.message, "❌ Категория не найдена, список категорий обновился. Выберите снова.",
+                               reply_markup=get_category_inline_keyboard(data.get('type', 'Расход'), prefix="checkcat"))
+            return
         
         # Сохраняем новую категорию и переходим в состояние подтверждения
         await state.update_data(category=new_category)
@@ -290,18 +470,11 @@ async def process_edit_category(callback: types.CallbackQuery, state: FSMContext
     try:
         data = await state.get_data()
         transaction_type = data.get('type', 'Расход')
-        category_list = CATEGORY_STORAGE.expense if transaction_type == "Расход" else CATEGORY_STORAGE.income
         
         # Переходим в состояние выбора категории
         await state.set_state(TransactionStates.choosing_category_after_check)
         
-        buttons = [
-            types.InlineKeyboardButton(text=cat, callback_data=f"checkcat_{cat}")
-            for cat in category_list
-        ]
-        keyboard = types.InlineKeyboardMarkup(
-            inline_keyboard=[buttons[i:i + 2] for i in range(0, len(buttons), 2)]
-        )
+        keyboard = get_category_inline_keyboard(transaction_type, prefix="checkcat")
         
         await edit_or_send(
             bot,
@@ -337,7 +510,8 @@ async def process_cancel_check(callback: types.CallbackQuery, state: FSMContext,
          logger.error(f"Не удалось отправить сообщение об отмене чека: {e}")
 
 
-async def process_confirm_check(callback: types.CallbackQuery, state: FSMContext, bot: Bot, transaction_service: TransactionService):
+async def process_confirm_check(callback: types.CallbackQuery, state: FSMContext, bot: Bot, transaction_service: TransactionService,
+                                idempotency_guard: Optional[IdempotencyGuard] = None):
     """Подтверждает и записывает транзакцию из чека после выбора категории вручную."""
     await safe_answer(callback)
     
@@ -355,12 +529,19 @@ async def process_confirm_check(callback: types.CallbackQuery, state: FSMContext
             retailer_name=data.get('retailer_name', ''),
             items_list=data.get('items_list', ''),
             payment_info=data.get('payment_info', ''),
-            transaction_dt=data.get('transaction_dt') or datetime.now()
+            transaction_dt=data.get('transaction_dt') or datetime.now(),
+            receipt_key=data.get('receipt_key')
         )
         
+        # Повторное нажатие или повторная доставка апдейта не записывает чек второй раз
+        keys = confirmation_keys(callback, data)
+        if not await claim_confirmation(idempotency_guard, keys):
+            return
+
         service = transaction_service
         try:
-            result = await service.finalize_transaction(transaction_data)
+            # При ошибке записи (любой) ключи освобождаются, и подтверждение можно повторить
+            result = await save_confirmed(idempotency_guard, keys, service.finalize_transaction(transaction_data))
             
             await edit_or_send(
                 bot,
@@ -380,6 +561,9 @@ async def process_confirm_check(callback: types.CallbackQuery, state: FSMContext
                     data.get('items_list', '')
                 )
             await state.clear()
+        except DuplicateReceiptError as e:
+            await edit_or_send(bot, callback.message, duplicate_receipt_text(e), reply_markup=get_main_keyboard())
+            await state.clear()
         except TransactionSaveError as e:
             await edit_or_send(
                 bot,
@@ -393,7 +577,8 @@ async def process_confirm_check(callback: types.CallbackQuery, state: FSMContext
         await edit_or_send(bot, callback.message, f"❌ **Ошибка:** {e}")
 
 
-async def process_confirm_auto_check(callback: types.CallbackQuery, state: FSMContext, bot: Bot, transaction_service: TransactionService):
+async def process_confirm_auto_check(callback: types.CallbackQuery, state: FSMContext, bot: Bot, transaction_service: TransactionService,
+                                     idempotency_guard: Optional[IdempotencyGuard] = None):
     """Подтверждает и записывает автоматически распознанный чек."""
     await safe_answer(callback)
     
@@ -411,12 +596,19 @@ async def process_confirm_auto_check(callback: types.CallbackQuery, state: FSMCo
             retailer_name=data.get('retailer_name', ''),
             items_list=data.get('items_list', ''),
             payment_info=data.get('payment_info', ''),
-            transaction_dt=data.get('transaction_dt') or datetime.now()
+            transaction_dt=data.get('transaction_dt') or datetime.now(),
+            receipt_key=data.get('receipt_key')
         )
         
+        # Повторное нажатие или повторная доставка апдейта не записывает чек второй раз
+        keys = confirmation_keys(callback, data)
+        if not await claim_confirmation(idempotency_guard, keys):
+            return
+
         service = transaction_service
         try:
-            result = await service.finalize_transaction(transaction_data)
+            # При ошибке записи (любой) ключи освобождаются, и подтверждение можно повторить
+            result = await save_confirmed(idempotency_guard, keys, service.finalize_transaction(transaction_data))
             
             await edit_or_send(
                 bot,
@@ -429,6 +621,9 @@ async def process_confirm_auto_check(callback: types.CallbackQuery, state: FSMCo
                 reply_markup=get_main_keyboard()
             )
             await state.clear()
+        except DuplicateReceiptError as e:
+            await edit_or_send(bot, callback.message, duplicate_receipt_text(e), reply_markup=get_main_keyboard())
+            await state.clear()
         except TransactionSaveError as e:
             await edit_or_send(
                 bot,
@@ -442,6 +637,55 @@ async def process_confirm_auto_check(callback: types.CallbackQuery, state: FSMCo
         await edit_or_send(bot, callback.message, f"❌ **Ошибка:** {e}")
 
 
+async def process_confirm_album(callback: types.CallbackQuery, state: FSMContext, bot: Bot, transaction_service: TransactionService,
+                                idempotency_guard: Optional[IdempotencyGuard] = None):
+    """Записывает все распознанные чеки альбома одной пакетной записью."""
+    await safe_answer(callback)
+
+    data = await state.get_data()
+    album = data.get('album_transactions')
+    if not album:
+        await edit_or_send(bot, callback.message, "❌ Данные альбома устарели. Отправьте чеки заново.")
+        return
+
+    keys = confirmation_keys(callback, data)
+    if not await claim_confirmation(idempotency_guard, keys):
+        return
+
+    transactions = []
+    for item in album:
+        transaction = TransactionData(**item)
+        transaction.comment = transaction.comment.replace('|', '\n• ')
+        transactions.append(transaction)
+
+    # Чеки, записанные после распознавания альбома (например, другим членом семьи), пропускаются
+    skipped = 0
+    while True:
+        try:
+            result = await save_confirmed(idempotency_guard, keys, transaction_service.finalize_transactions(transactions))
+            break
+        except DuplicateReceiptError as e:
+            skipped += 1
+            transactions = [t for t in transactions if t.receipt_key != e.receipt_key]
+            if not transactions:
+                await state.clear()
+                await edit_or_send(bot, callback.message, duplicate_receipt_text(e), reply_markup=get_main_keyboard())
+                return
+        except TransactionSaveError as e:
+            await edit_or_send(bot, callback.message, f"❌ **Ошибка записи:** {e}", parse_mode="Markdown")
+            return
+        except Exception as e:
+            logger.error(f"Ошибка в process_confirm_album: {e}")
+            await edit_or_send(bot, callback.message, f"❌ **Ошибка:** {e}")
+            return
+
+    summary = result['summary']
+    if skipped:
+        summary += MSG.album_duplicates_skipped.format(count=skipped)
+    await state.clear()
+    await edit_or_send(bot, callback.message, summary, parse_mode="Markdown", reply_markup=get_main_keyboard())
+
+
 # --- E. ЛОГИКА РАЗДЕЛЕНИЯ ЧЕКА (SPLIT) ---
 # ----------------------------------------------------------------------
 
@@ -455,132 +699,106 @@ async def start_splitting_check(callback: types.CallbackQuery, state: FSMContext
         await edit_or_send(callback.bot, callback.message, "❌ Ошибка: данные чека отсутствуют.")
         return
 
-    # Восстанавливаем объекты CheckItem из словарей, если они там есть
     items_raw = data.get('items', [])
     if not items_raw:
         await edit_or_send(callback.bot, callback.message, "❌ Ошибка: в чеке нет списка товаров для разделения.")
         return
 
-    # Если items_raw - это список словарей, преобразуем обратно в объекты (для удобства типизации, хоть и не обязательно)
-    # Но в FSM мы будем хранить индексы.
-    
-    # Инициализируем сессию разделения
-    split_session = {
-        'original_items': items_raw, # Список всех товаров (dict)
-        'remaining_indices': list(range(len(items_raw))), # Индексы доступных товаров
-        'current_selection': [], # Индексы, выбранные для текущей группы
-        'completed_groups': [] # Список сформированных транзакций (dict: sum, items, category)
-    }
-    
-    await state.update_data(split_session=split_session)
+    # Инициализируем сессию разделения. Товары остаются в data['items'] (без копии),
+    # распределенные и выбранные товары хранятся битовыми масками — при каждом нажатии
+    # в FSM меняется одно число, а не весь список.
+    await state.update_data(
+        split_id=uuid.uuid4().hex[:12],             # Ключ кэша страниц клавиатуры
+        split_remaining=full_mask(len(items_raw)),  # Товары, еще не попавшие в группы
+        split_selected=0,                           # Товары текущей группы
+        split_page=0,
+        split_groups=[]                             # Сформированные группы (category, amount, items_str)
+    )
     await state.set_state(TransactionStates.splitting_items)
     
     await show_splitting_ui(callback, state)
 
 
+def _split_page_keyboard(data: Dict[str, Any]):
+    """Клавиатура текущей страницы разделения по данным FSM"""
+    return get_items_page_keyboard(
+        data['items'], data['split_remaining'], data['split_selected'], data.get('split_page', 0), data.get('split_id', '')
+    )
+
+
 async def show_splitting_ui(callback: types.CallbackQuery, state: FSMContext):
-    """Отображает интерфейс выбора товаров."""
-    from utils.split_keyboards import get_items_keyboard
-    from models.transaction import CheckItem
-    
+    """Отображает интерфейс выбора товаров (текст и текущую страницу товаров)."""
     data = await state.get_data()
-    session = data.get('split_session')
-    items_raw = session['original_items']
-    remaining_indices = session['remaining_indices']
-    current_selection = set(session['current_selection'])
-    
-    # Формируем список оставшихся товаров для отображения
-    # Нам нужно отобразить только те, что в remaining_indices
-    # Но callback должен знать реальный индекс в original_items
-    
-    # Чтобы не усложнять, покажем ВСЕ товары, но те что уже распределены (не в remaining), будут скрыты или помечены
-    # Проще: показываем только remaining items.
-    
-    display_items = []
-    # Картируем локальный индекс списка display_items на реальный индекс original_items
-    display_map = {} 
-    
-    for real_idx in remaining_indices:
-        item_dict = items_raw[real_idx]
-        item = CheckItem(**item_dict) 
-        display_items.append(item)
-        display_map[len(display_items)-1] = real_idx
-        
-    await state.update_data(display_map=display_map)
-    
-    # Выбранные индексы для отображения (локальные)
-    local_selected = set()
-    for local_idx, real_idx in display_map.items():
-        if real_idx in current_selection:
-            local_selected.add(local_idx)
-
-    keyboard = get_items_keyboard(display_items, local_selected)
+    items_raw = data['items']
+    remaining = data['split_remaining']
     
-    total_left = sum(items_raw[i]['sum'] for i in remaining_indices)
-    current_sum = sum(items_raw[i]['sum'] for i in session['current_selection'])
+    total_left = mask_sum(items_raw, remaining)
+    pages = page_count(remaining)
+    page_info = f" (стр. {data.get('split_page', 0) + 1} из {pages})" if pages > 1 else ""
     
     text = (f"✂️ **Разделение чека**\n"
-            f"Всего осталось: **{total_left:.2f}** руб.\n"
-            f"Выбрано сейчас: **{current_sum:.2f}** руб.\n\n"
-            f"👇 Отметьте товары для **Группы {len(session['completed_groups']) + 1}**:")
+            f"Всего осталось: **{total_left:.2f}** руб. ({mask_count(remaining)} поз.)\n\n"
+            f"👇 Отметьте товары для **Группы {len(data['split_groups']) + 1}**{page_info}:")
             
-    await edit_or_send(callback.bot, callback.message, text, reply_markup=keyboard, parse_mode="Markdown")
+    await edit_or_send(callback.bot, callback.message, text, reply_markup=_split_page_keyboard(data), parse_mode="Markdown")
 
 
 async def toggle_split_item(callback: types.CallbackQuery, state: FSMContext):
-    """Переключает выбор товара."""
-    # Получаем локальный индекс из callback data: toggle_item_0
+    """Переключает выбор товара; обновляется только клавиатура текущей страницы."""
+    # Реальный индекс товара из callback data: toggle_item_0
     try:
-        local_idx = int(callback.data.split('_')[-1])
+        index = int(callback.data.split('_')[-1])
     except ValueError:
         return
 
     data = await state.get_data()
-    display_map = data.get('display_map', {})
-    # display_map ключи - строки, так как из JSON
-    real_idx = display_map.get(str(local_idx))
-    
-    if real_idx is None:
-        if isinstance(display_map, dict): # попробуем int ключи
-             real_idx = display_map.get(local_idx)
-    
-    if real_idx is None:
-        await safe_answer(callback, "Ошибка индекса")
+    remaining = data.get('split_remaining', 0)
+    if not remaining >> index & 1:
+        await safe_answer(callback, "Товар уже распределен")
         return
 
-    session = data.get('split_session')
-    current_selection = set(session['current_selection'])
+    data['split_selected'] = data.get('split_selected', 0) ^ (1 << index)
+    await state.update_data(split_selected=data['split_selected'])
     
-    if real_idx in current_selection:
-        current_selection.remove(real_idx)
-    else:
-        current_selection.add(real_idx)
-        
-    session['current_selection'] = list(current_selection)
-    await state.update_data(split_session=session)
-    
-    # Обновляем UI без ответа (просто перерисовка)
+    if not await edit_reply_markup(callback.bot, callback.message, _split_page_keyboard(data)):
+        await show_splitting_ui(callback, state)
+    await safe_answer(callback)
+
+
+async def change_split_page(callback: types.CallbackQuery, state: FSMContext):
+    """Переключает страницу списка товаров."""
+    try:
+        page = int(callback.data.split('_')[-1])
+    except ValueError:
+        return
+
+    data = await state.get_data()
+    page = min(max(page, 0), page_count(data.get('split_remaining', 0)) - 1)
+    if page == data.get('split_page', 0):
+        await safe_answer(callback)
+        return
+
+    await state.update_data(split_page=page)
     await show_splitting_ui(callback, state)
     await safe_answer(callback)
 
 
 async def confirm_split_group_items(callback: types.CallbackQuery, state: FSMContext):
     """Переход к выбору категории для группы."""
-    await safe_answer(callback)
     data = await state.get_data()
-    session = data.get('split_session')
+    selected = data.get('split_selected', 0)
     
-    if not session['current_selection']:
+    if not selected:
         await safe_answer(callback, "Выберите хотя бы один товар!", show_alert=True)
         return
+    await safe_answer(callback)
 
     # Переходим к выбору категории
-    from utils.split_keyboards import get_categories_inline_keyboard
-    keyboard = get_categories_inline_keyboard(CATEGORY_STORAGE.expense)
+    keyboard = get_categories_inline_keyboard()
     
-    current_sum = sum(session['original_items'][i]['sum'] for i in session['current_selection'])
+    current_sum = mask_sum(data['items'], selected)
     
-    text = (f"📂 **Группа {len(session['completed_groups']) + 1}** сформирована.\n"
+    text = (f"📂 **Группа {len(data['split_groups']) + 1}** сформирована.\n"
             f"Сумма: **{current_sum:.2f}** руб.\n"
             f"Выберите категорию:")
             
@@ -588,49 +806,66 @@ async def confirm_split_group_items(callback: types.CallbackQuery, state: FSMCon
     await state.set_state(TransactionStates.splitting_choose_category)
 
 
-async def process_split_category_choice(callback: types.CallbackQuery, state: FSMContext, transaction_service: TransactionService):
+async def process_split_category_choice(callback: types.CallbackQuery, state: FSMContext, transaction_service: TransactionService,
+                                        idempotency_guard: Optional[IdempotencyGuard] = None):
     """Обрабатывает выбор категории для группы сплита."""
     await safe_answer(callback)
-    category = callback.data.split('_', 1)[1]
+    category = parse_category_callback(callback.data)
+    if category is None:
+        await edit_or_send(callback.bot, callback.message, "❌ Категория не найдена, список категорий обновился. Выберите снова.",
+                           reply_markup=get_categories_inline_keyboard())
+        return
     
     data = await state.get_data()
-    session = data.get('split_session')
     
     # 1. Сохраняем группу
-    selected_indices = session['current_selection']
-    original_items = session['original_items']
-    
-    group_items = [original_items[i] for i in selected_indices]
-    group_sum = sum(item['sum'] for item in group_items)
-    group_items_str = " | ".join([item['name'] for item in group_items])
+    selected = data['split_selected']
+    group_items = [data['items'][i] for i in mask_indices(selected)]
     
-    session['completed_groups'].append({
+    groups = data['split_groups'] + [{
         'category': category,
-        'amount': group_sum,
-        'items': group_items,
-        'items_str': group_items_str
-    })
+        'amount': sum(item['sum'] for item in group_items),
+        'items_str': " | ".join(item['name'] for item in group_items)
+    }]
     
-    # 2. Удаляем выбранные из оставшихся
-    session['remaining_indices'] = [i for i in session['remaining_indices'] if i not in selected_indices]
-    session['current_selection'] = [] # Очищаем выбор
+    # 2. Удаляем выбранные из оставшихся и очищаем выбор
+    remaining = data['split_remaining'] & ~selected
+    page = min(data.get('split_page', 0), page_count(remaining) - 1)
     
-    await state.update_data(split_session=session)
+    await state.update_data(split_groups=groups, split_remaining=remaining, split_selected=0, split_page=page)
     
     # 3. Проверяем, осталось ли что-то
-    if not session['remaining_indices']:
+    if not remaining:
         # ВСЕ РАСПРЕДЕЛЕНО - ФИНАЛИЗАЦИЯ
-        await finalize_split_transactions(callback, state, transaction_service)
+        await finalize_split_transactions(callback, state, transaction_service, idempotency_guard)
     else:
         # ЕЩЕ ЕСТЬ ТОВАРЫ - ПРОДОЛЖАЕМ
         await state.set_state(TransactionStates.splitting_items)
         await show_splitting_ui(callback, state)
 
 
-async def finalize_split_transactions(callback: types.CallbackQuery, state: FSMContext, transaction_service: TransactionService):
+async def accept_split_proposal(callback: types.CallbackQuery, state: FSMContext, transaction_service: TransactionService,
+                                idempotency_guard: Optional[IdempotencyGuard] = None):
+    """Принимает предложенное разделение чека по категориям позиций одним нажатием."""
+    await safe_answer(callback)
+    data = await state.get_data()
+    proposal = data.get('split_proposal')
+    if not proposal:
+        await edit_or_send(callback.bot, callback.message, "❌ Предложение разделения устарело. Разделите чек вручную.")
+        return
+
+    await state.update_data(split_groups=proposal)
+    await finalize_split_transactions(callback, state, transaction_service, idempotency_guard)
+
+
+async def finalize_split_transactions(callback: types.CallbackQuery, state: FSMContext, transaction_service: TransactionService,
+                                      idempotency_guard: Optional[IdempotencyGuard] = None):
     """Сохраняет все транзакции из сплита."""
     data = await state.get_data()
-    session = data.get('split_session')
+
+    keys = confirmation_keys(callback, data)
+    if not await claim_confirmation(idempotency_guard, keys):
+        return
     
     check_data_raw = data
     from models.transaction import CheckData
@@ -649,10 +884,10 @@ async def finalize_split_transactions(callback: types.CallbackQuery, state: FSMC
             
     check_base = SimpleCheckBase(check_data_raw) 
     
-    count = 0
+    transactions = []
     errors = []
     
-    for group in session['completed_groups']:
+    for group in data.get('split_groups', []):
         try:
             # Создаем транзакцию
             transaction = TransactionData(
@@ -665,14 +900,29 @@ async def finalize_split_transactions(callback: types.CallbackQuery, state: FSMC
                 retailer_name=check_base.retailer_name,
                 items_list=group['items_str'],
                 payment_info=check_base.payment_info,
-                transaction_dt=check_base.transaction_datetime
+                transaction_dt=check_base.transaction_datetime,
+                receipt_key=check_data_raw.get('receipt_key')
             )
-            
-            await transaction_service.finalize_transaction(transaction)
-            count += 1
+            transactions.append(transaction)
         except Exception as e:
             errors.append(f"{group['category']}: {e}")
 
+    # Все части чека записываются одной пакетной записью (один раз отмечая чек как записанный)
+    count = 0
+    if transactions:
+        try:
+            result = await save_confirmed(idempotency_guard, keys, transaction_service.finalize_transactions(transactions))
+            count = result['count']
+        except DuplicateReceiptError as e:
+            await edit_or_send(callback.bot, callback.message, duplicate_receipt_text(e), reply_markup=get_main_keyboard())
+            await state.clear()
+            return
+        except TransactionSaveError as e:
+            errors.append(str(e))
+        except Exception as e:
+            logger.error(f"Ошибка в finalize_split_transactions: {e}")
+            errors.append(str(e))
+
     # Итог
     if not errors:
         await edit_or_send(callback.bot, callback.message, 
@@ -701,6 +951,9 @@ def register_receipt_handlers(dp: Router):
     dp.callback_query.register(process_confirm_check, F.data == "confirm_check", TransactionStates.confirming_check, AllowedUsersFilter())
     dp.callback_query.register(process_cancel_check, F.data == "cancel_check", AllowedUsersFilter())
     
+    # Callback для альбома чеков
+    dp.callback_query.register(process_confirm_album, F.data == "confirm_album", TransactionStates.confirming_album, AllowedUsersFilter())
+    
     # Callback для авто-чека
     dp.callback_query.register(process_confirm_auto_check, F.data == "confirm_auto_check", TransactionStates.confirming_auto_check, AllowedUsersFilter())
     dp.callback_query.register(process_edit_category, F.data == "change_category", TransactionStates.confirming_auto_check, AllowedUsersFilter())
@@ -708,7 +961,9 @@ def register_receipt_handlers(dp: Router):
     
     # NEW: Split handlers
     dp.callback_query.register(start_splitting_check, F.data == "split_check", AllowedUsersFilter())
+    dp.callback_query.register(accept_split_proposal, F.data == "accept_split", AllowedUsersFilter())
     dp.callback_query.register(toggle_split_item, F.data.startswith("toggle_item_"), TransactionStates.splitting_items, AllowedUsersFilter())
+    dp.callback_query.register(change_split_page, F.data.startswith("split_page_"), TransactionStates.splitting_items, AllowedUsersFilter())
     dp.callback_query.register(confirm_split_group_items, F.data == "split_next_step", TransactionStates.splitting_items, AllowedUsersFilter())
     dp.callback_query.register(process_split_category_choice, F.data.startswith("splitcat_"), TransactionStates.splitting_choose_category, AllowedUsersFilter())
     dp.callback_query.register(process_confirm_auto_check, F.data == "comment_none", TransactionStates.confirming_auto_check, AllowedUsersFilter())
\ No newline at end of file
@@ -7,6 +7,7 @@ from aiogram import Router, types
 from aiogram.filters import BaseFilter
 from aiogram.fsm.context import FSMContext
 from aiogram import F
+from typing import Optional
 
 # Импорты из нашей структуры
 from config import ALLOWED_USER_IDS, logger
@@ -15,6 +16,7 @@ from services.input_parser import InputParser
 from services.transaction_service import TransactionService
 from utils.messages import MSG
 from utils.exceptions import TransactionSaveError
+from services.idempotency import IdempotencyGuard, claim_confirmation, confirmation_keys, new_draft_token, save_confirmed
 from services.transaction_service import TransactionService
 from utils.service_wrappers import safe_answer, edit_or_send
 from utils.keyboards import get_main_keyboard
@@ -94,8 +96,8 @@ async def process_smart_input(message: types.Message, state: FSMContext, transac
         transaction_data.category = "Прочее"
         confidence_text = "Низкая уверенность"
     
-    # Сохраняем объект транзакции в FSM для последующего использования
-    await state.update_data(transaction_data=transaction_data)
+    # Сохраняем объект транзакции в FSM для последующего использования (с токеном черновика)
+    await state.update_data(transaction_data=transaction_data, draft_token=new_draft_token())
 
     # Показываем сводку и спрашиваем подтверждение
     summary = (f"📋 **Новая транзакция**\n\n"
@@ -118,7 +120,8 @@ async def process_smart_input(message: types.Message, state: FSMContext, transac
     await state.set_state(TransactionStates.waiting_for_confirmation)
 
 
-async def confirm_smart_transaction(callback: types.CallbackQuery, state: FSMContext, transaction_service: TransactionService):
+async def confirm_smart_transaction(callback: types.CallbackQuery, state: FSMContext, transaction_service: TransactionService,
+                                    idempotency_guard: Optional[IdempotencyGuard] = None):
     """Подтверждает и записывает транзакцию из умного ввода."""
     
     await safe_answer(callback)
@@ -137,13 +140,18 @@ async def confirm_smart_transaction(callback: types.CallbackQuery, state: FSMCon
             )
             return
 
+        # Повторное нажатие или повторная доставка апдейта не записывает транзакцию второй раз
+        keys = confirmation_keys(callback, data)
+        if not await claim_confirmation(idempotency_guard, keys):
+            return
+
         # Service injected
         service = transaction_service
         # Checks removed
 
         # Сохраняем транзакцию
         try:
-            result = await service.finalize_transaction(transaction_data)
+            result = await save_confirmed(idempotency_guard, keys, service.finalize_transaction(transaction_data))
             await edit_or_send(
                 callback.bot,
                 callback.message,
@@ -4,12 +4,23 @@ from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
 
 # Импортируем из нашей новой структуры
-from config import BOT_TOKEN, logger
+from config import BOT_TOKEN, logger, SHEETS_READ_CONCURRENCY, SHEETS_READ_USER_QUEUE_LIMIT
 from handlers import register_all_handlers
 from services.transaction_service import TransactionService
 from services.repository import TransactionRepository
 from sheets.client import load_categories_from_sheet, write_transaction
 from services.sync_worker import start_sync_worker
+from services.training_worker import start_training_worker
+from services.usage_stats_worker import start_usage_stats_worker
+from services.keyword_sync_worker import start_keyword_sync_worker
+from utils.category_classifier import bootstrap_classifier
+from services.http_client import create_http_session
+from services.receipt_cache import ReceiptCache
+from services.receipt_queue import ReceiptJobQueue
+from services.fair_scheduler import FairScheduler
+from services.album_collector import AlbumCollector
+from services.idempotency import IdempotencyGuard
+from utils.image_preprocessing import shutdown_preprocess_pool
 
 
 async def main():
@@ -21,6 +32,10 @@ async def main():
     transaction_repository = TransactionRepository()
     await transaction_repository.init_db()
 
+    # Прогрев классификатора: словарь ключевых слов загружается из локальной SQLite,
+    # затем сверяется с листом Keywords (зеркало)
+    classifier = await bootstrap_classifier(keyword_store=transaction_repository)
+
     # Попытка загрузки категорий из Google Sheets
     logger.info("Загрузка категорий из Google Sheets...")
     try:
@@ -29,15 +44,51 @@ async def main():
     except Exception as e:
         logger.error(f"⚠️ Ошибка при обращении к Google Sheets: {e}. Бот продолжает запуск.")
 
+    # Очередь фонового обучения классификатора
+    training_queue = asyncio.Queue()
+
+    # Общий HTTP-клиент: пул соединений для скачивания фото и запросов к API чеков
+    http_session = create_http_session()
+
+    # Кэш распознанных чеков (SQLite, с TTL)
+    receipt_cache = ReceiptCache(transaction_repository)
+    await receipt_cache.purge_expired()
+
+    # Защита от повторных подтверждений (двойное нажатие, повторная доставка апдейта)
+    idempotency_guard = IdempotencyGuard(transaction_repository)
+    await idempotency_guard.purge_expired()
+
     # Создаем TransactionService с внедренным репозиторием
-    transaction_service = TransactionService(repository=transaction_repository)
+    transaction_service = TransactionService(
+        repository=transaction_repository,
+        training_queue=training_queue,
+        classifier=classifier,
+        http_session=http_session,
+        receipt_cache=receipt_cache
+    )
+
+    # Очередь обработки чеков (фото обрабатываются в фоне, слоты выдаются пользователям по очереди)
+    receipt_queue = ReceiptJobQueue()
+    # Справедливая очередь чтения истории из Google Sheets
+    sheets_scheduler = FairScheduler(
+        "sheets", capacity=SHEETS_READ_CONCURRENCY, per_user_limit=1, max_queued_per_user=SHEETS_READ_USER_QUEUE_LIMIT
+    )
+    # Сбор фото альбомов: альбом чеков обрабатывается одной задачей
+    album_collector = AlbumCollector()
 
     # Создаем диспетчер с хранилищем состояний
     storage = MemoryStorage()
     dp = Dispatcher(storage=storage)
     
     # Внедрение зависимостей
-    dp.workflow_data.update({"transaction_service": transaction_service})
+    dp.workflow_data.update({
+        "transaction_service": transaction_service,
+        "http_session": http_session,
+        "receipt_queue": receipt_queue,
+        "album_collector": album_collector,
+        "sheets_scheduler": sheets_scheduler,
+        "idempotency_guard": idempotency_guard,
+    })
 
     # Регистрируем обработчики
     register_all_handlers(dp)
@@ -57,11 +108,33 @@ async def main():
     )
     logger.info("🔄 Фоновая синхронизация запущена.")
 
+    # Запускаем фоновое обучение классификатора
+    training_task = asyncio.create_task(
+        start_training_worker(transaction_service.classifier, training_queue)
+    )
+    logger.info("🧠 Фоновое обучение классификатора запущено.")
+
+    # Запускаем сброс статистики ключевых слов в SQLite
+    usage_stats_task = asyncio.create_task(
+        start_usage_stats_worker(classifier.keyword_dict, transaction_repository)
+    )
+    logger.info("📊 Сохранение статистики ключевых слов запущено.")
+
+    # Запускаем зеркалирование словаря ключевых слов в Google Sheets
+    keyword_sync_task = asyncio.create_task(
+        start_keyword_sync_worker(classifier.keyword_dict, transaction_repository)
+    )
+    logger.info("🔁 Синхронизация ключевых слов с Google Sheets запущена.")
+
     # Запускаем polling
     try:
         await dp.start_polling(bot)
     finally:
-        # Закрываем соединение с базой данных при завершении
+        # Останавливаем обработку чеков до закрытия HTTP-сеанса, которым она пользуется
+        await receipt_queue.close()
+        # Закрываем HTTP-сеанс, пул предобработки изображений и соединение с базой данных при завершении
+        await http_session.close()
+        shutdown_preprocess_pool()
         await transaction_repository.close()
 
 
@@ -0,0 +1,243 @@
+"""
+Модуль реестра категорий.
+Категории публикуются неизменяемыми снимками (CategorySnapshot): читатели берут ссылку на
+текущий снимок и работают с ним без блокировок, загрузка из Sheets собирает новый снимок
+и подменяет его одной операцией. Каждая категория получает целочисленный id (для компактных
+callback_data), вычисляемый по названию (CRC32): он не меняется ни между перезагрузками листа,
+ни между перезапусками бота, поэтому кнопки в старых сообщениях продолжают работать.
+Id нигде не сохраняется (словарь ключевых слов и модель классификатора хранят названия).
+Подписчики уведомляются об изменениях и могут точечно сбросить свои кэши.
+"""
+import logging
+import threading
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime
+from types import MappingProxyType
+from typing import Callable, Dict, FrozenSet, Iterable, List, Mapping, Optional, Tuple
+
+EXPENSE_TYPE = "Расход"
+INCOME_TYPE = "Доход"
+DEFAULT_EXPENSE_CATEGORY = "Прочее Расход"
+
+logger = logging.getLogger(__name__)
+
+
+def _empty_mapping() -> Mapping:
+    return MappingProxyType({})
+
+
+def category_id_for(name: str, salt: int = 0) -> int:
+    """Детерминированный id категории по названию (при коллизии — с солью)"""
+    key = name if not salt else f"{name}#{salt}"
+    return zlib.crc32(key.encode('utf-8'))
+
+
+@dataclass(frozen=True)
+class CategorySnapshot:
+    """Неизменяемое состояние реестра категорий одной версии"""
+    version: int = 0
+    expense: Tuple[str, ...] = ()
+    income: Tuple[str, ...] = ()
+    # Категория расхода -> кортеж ключевых слов
+    keywords: Mapping[str, Tuple[str, ...]] = field(default_factory=_empty_mapping)
+    # Название категории -> id, вычисленный по названию
+    ids: Mapping[str, int] = field(default_factory=_empty_mapping)
+    # Увеличивается только при изменении списков категорий / ключевых слов
+    categories_version: int = 0
+    keywords_version: int = 0
+    last_loaded: Optional[datetime] = None
+    expense_set: FrozenSet[str] = field(init=False)
+    income_set: FrozenSet[str] = field(init=False)
+    names: Mapping[int, str] = field(init=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, 'expense_set', frozenset(self.expense))
+        object.__setattr__(self, 'income_set', frozenset(self.income))
+        object.__setattr__(self, 'names', MappingProxyType({cid: name for name, cid in self.ids.items()}))
+
+    def categories_for(self, transaction_type: str) -> Tuple[str, ...]:
+        """Категории для типа транзакции ("Доход" или "Расход")"""
+        return self.income if transaction_type == INCOME_TYPE else self.expense
+
+    def is_valid(self, category: str, transaction_type: str = EXPENSE_TYPE) -> bool:
+        """Проверка принадлежности категории типу транзакции за O(1)"""
+        return category in (self.income_set if transaction_type == INCOME_TYPE else self.expense_set)
+
+    def id_of(self, category: str) -> Optional[int]:
+        return self.ids.get(category)
+
+    def name_of(self, category_id: int) -> Optional[str]:
+        return self.names.get(category_id)
+
+    @property
+    def fallback_expense(self) -> str:
+        """Категория расхода по умолчанию (последняя в списке, как в таблице)"""
+        return self.expense[-1] if self.expense else DEFAULT_EXPENSE_CATEGORY
+
+
+@dataclass(frozen=True)
+class CategoryChange:
+    """Описание изменения реестра для подписчиков"""
+    old: CategorySnapshot
+    new: CategorySnapshot
+    added: FrozenSet[str]
+    removed: FrozenSet[str]
+
+    @property
+    def categories_changed(self) -> bool:
+        return self.old.categories_version != self.new.categories_version
+
+    @property
+    def keywords_changed(self) -> bool:
+        return self.old.keywords_version != self.new.keywords_version
+
+
+Listener = Callable[[CategoryChange], None]
+
+
+class CategoryRegistry:
+    """
+    Версионируемый реестр категорий.
+    Атрибуты expense/income/keywords/last_loaded/keywords_version оставлены для совместимости
+    и читают текущий снимок; для нескольких обращений подряд лучше взять snapshot один раз.
+    """
+
+    def __init__(self):
+        self._snapshot = CategorySnapshot()
+        # Все когда-либо опубликованные названия -> id (id удаленной категории не достается другой)
+        self._ids: Dict[str, int] = {}
+        self._taken: Dict[int, str] = {}
+        self._listeners: List[Listener] = []
+        self._lock = threading.RLock()
+
+    @property
+    def snapshot(self) -> CategorySnapshot:
+        return self._snapshot
+
+    # --- Совместимость со старым CategoryStorage ---
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    @property
+    def expense(self) -> Tuple[str, ...]:
+        return self._snapshot.expense
+
+    @property
+    def income(self) -> Tuple[str, ...]:
+        return self._snapshot.income
+
+    @property
+    def expense_set(self) -> FrozenSet[str]:
+        return self._snapshot.expense_set
+
+    @property
+    def income_set(self) -> FrozenSet[str]:
+        return self._snapshot.income_set
+
+    @property
+    def keywords(self) -> Mapping[str, Tuple[str, ...]]:
+        return self._snapshot.keywords
+
+    @property
+    def keywords_version(self) -> int:
+        return self._snapshot.keywords_version
+
+    @property
+    def last_loaded(self) -> Optional[datetime]:
+        return self._snapshot.last_loaded
+
+    @property
+    def fallback_expense(self) -> str:
+        return self._snapshot.fallback_expense
+
+    def id_of(self, category: str) -> Optional[int]:
+        return self._snapshot.id_of(category)
+
+    def name_of(self, category_id: int) -> Optional[str]:
+        return self._snapshot.name_of(category_id)
+
+    # --- Подписки ---
+    def subscribe(self, listener: Listener) -> Callable[[], None]:
+        """Регистрирует обработчик изменений; возвращает функцию отписки"""
+        with self._lock:
+            self._listeners.append(listener)
+
+        def unsubscribe():
+            with self._lock:
+                if listener in self._listeners:
+                    self._listeners.remove(listener)
+        return unsubscribe
+
+    # --- Публикация ---
+    def publish(
+        self,
+        expense: Iterable[str],
+        income: Iterable[str],
+        keywords: Mapping[str, Iterable[str]],
+        loaded_at: Optional[datetime] = None,
+    ) -> CategorySnapshot:
+        """Собирает новый снимок и атомарно подменяет текущий"""
+        expense = tuple(dict.fromkeys(expense))
+        income = tuple(dict.fromkeys(income))
+        frozen_keywords = {category: tuple(words) for category, words in keywords.items()}
+        with self._lock:
+            old = self._snapshot
+            for name in expense + income:
+                if name not in self._ids:
+                    self._assign_id(name)
+            categories_changed = (expense, income) != (old.expense, old.income)
+            keywords_changed = frozen_keywords != dict(old.keywords)
+            new = CategorySnapshot(
+                version=old.version + 1,
+                expense=expense,
+                income=income,
+                keywords=MappingProxyType(frozen_keywords),
+                ids=MappingProxyType({name: self._ids[name] for name in expense + income}),
+                categories_version=old.categories_version + (1 if categories_changed else 0),
+                keywords_version=old.keywords_version + (1 if keywords_changed else 0),
+                last_loaded=loaded_at or datetime.now(),
+            )
+            self._snapshot = new
+            listeners = list(self._listeners)
+        self._notify(listeners, old, new)
+        return new
+
+    def _assign_id(self, name: str):
+        salt = 0
+        category_id = category_id_for(name)
+        # Коллизия CRC32 маловероятна; при ней id зависит от порядка появления названий
+        while category_id in self._taken:
+            salt += 1
+            category_id = category_id_for(name, salt)
+        if salt:
+            logger.warning(f"⚠️ Коллизия id категории '{name}' с '{self._taken[category_id_for(name)]}'")
+        self._ids[name] = category_id
+        self._taken[category_id] = name
+
+    def add_keywords(self, category: str, keywords: Iterable[str]) -> CategorySnapshot:
+        """Публикует снимок с новыми ключевыми словами категории (без дубликатов)"""
+        with self._lock:
+            current = self._snapshot
+            existing = current.keywords.get(category, ())
+            new_words = [k for k in dict.fromkeys(keywords) if k not in existing]
+            if not new_words:
+                return current
+            updated = dict(current.keywords)
+            updated[category] = existing + tuple(new_words)
+            return self.publish(current.expense, current.income, updated, loaded_at=current.last_loaded)
+
+    def _notify(self, listeners: List[Listener], old: CategorySnapshot, new: CategorySnapshot):
+        if not listeners or (old.categories_version == new.categories_version
+                             and old.keywords_version == new.keywords_version):
+            return
+        old_names = old.expense_set | old.income_set
+        new_names = new.expense_set | new.income_set
+        change = CategoryChange(old=old, new=new, added=new_names - old_names, removed=old_names - new_names)
+        for listener in listeners:
+            try:
+                listener(change)
+            except Exception:
+                # Ошибка подписчика не должна мешать публикации и остальным подписчикам
+                logger.exception("❌ Ошибка обработчика изменения категорий")
@@ -1,28 +1,289 @@
 import re
+import sys
+import time
+import asyncio
 from collections import defaultdict, Counter
 from datetime import datetime
-from typing import Dict, List, Tuple, Optional, Set
-from dataclasses import dataclass, field
-
-try:
-    from pymorphy3 import MorphAnalyzer
-except ImportError:
-    MorphAnalyzer = None
+from typing import Dict, Iterable, List, Tuple, Optional, Set, Union
+from difflib import SequenceMatcher
 
 from config import logger
 from sheets.client import GoogleSheetsClient
-from utils.lemmatizer import Lemmatizer
+from models.keyword_usage import KeywordUsageStats
+from utils.lemmatizer import get_lemmatizer
+from utils.text_analysis import AnalyzedText, analyze_text
+
+FUZZY_MATCH_THRESHOLD = 0.8  # Минимальная схожесть для поиска с опечатками
+FUZZY_MIN_WORD_LENGTH = 4  # Короткие слова не ищем нечетко: слишком много ложных совпадений
+
+
+class _Interner:
+    """Таблица интернирования: одинаковые значения хранятся один раз и получают компактный id"""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def id_of(self, value: str) -> int:
+        value_id = self._ids.get(value)
+        if value_id is None:
+            value = sys.intern(value)
+            value_id = len(self.values)
+            self._ids[value] = value_id
+            self.values.append(value)
+        return value_id
+
+
+# Общая для процесса таблица категорий: KeywordEntry хранит только id категории
+CATEGORY_IDS = _Interner()
 
 
-@dataclass
 class KeywordEntry:
-    """Класс для хранения информации о ключевом слове"""
-    keyword: str
-    category: str
-    confidence: float
-    usage_count: int = 0
-    last_used: Optional[datetime] = None
-    created_at: datetime = field(default_factory=datetime.now)
+    """
+    Класс для хранения информации о ключевом слове.
+    Компактное представление: __slots__ вместо __dict__, категория хранится как id в CATEGORY_IDS,
+    время создания — число, общее для всех записей одной загрузки.
+    """
+    __slots__ = ('keyword', 'category_id', 'confidence', 'usage_count', '_last_used', '_created_at')
+
+    def __init__(
+        self,
+        keyword: str,
+        category: str,
+        confidence: float,
+        usage_count: int = 0,
+        last_used: Optional[datetime] = None,
+        created_at: Optional[float] = None
+    ):
+        self.keyword = keyword
+        self.category_id = CATEGORY_IDS.id_of(category)
+        self.confidence = confidence
+        self.usage_count = usage_count
+        self.last_used = last_used
+        self._created_at = time.time() if created_at is None else created_at
+
+    @property
+    def category(self) -> str:
+        return CATEGORY_IDS.values[self.category_id]
+
+    @category.setter
+    def category(self, value: str):
+        self.category_id = CATEGORY_IDS.id_of(value)
+
+    @property
+    def last_used(self) -> Optional[datetime]:
+        return datetime.fromtimestamp(self._last_used) if self._last_used is not None else None
+
+    @last_used.setter
+    def last_used(self, value: Union[datetime, float, None]):
+        self._last_used = value.timestamp() if isinstance(value, datetime) else value
+
+    @property
+    def created_at(self) -> datetime:
+        return datetime.fromtimestamp(self._created_at)
+
+    def copy(self, category: str, confidence: float) -> "KeywordEntry":
+        """Копия записи с новой категорией и уверенностью (статистика сохраняется)"""
+        entry = KeywordEntry(self.keyword, category, confidence, self.usage_count, None, self._created_at)
+        entry._last_used = self._last_used
+        return entry
+
+    def __eq__(self, other):
+        if not isinstance(other, KeywordEntry):
+            return NotImplemented
+        return (self.keyword, self.category_id, self.confidence, self.usage_count, self._last_used, self._created_at) == \
+            (other.keyword, other.category_id, other.confidence, other.usage_count, other._last_used, other._created_at)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return (f"KeywordEntry(keyword={self.keyword!r}, category={self.category!r}, "
+                f"confidence={self.confidence!r}, usage_count={self.usage_count!r})")
+
+
+def _char_trigrams(text: str) -> Set[str]:
+    """Символьные триграммы текста с пробелами по краям (учитывают начало и конец слова)"""
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _keyword_words(keyword: str) -> List[str]:
+    """Слова ключевой фразы; строки интернируются, так как одни и те же слова встречаются во многих фразах"""
+    return [sys.intern(word) for word in keyword.split()]
+
+
+def _keyword_bigrams(words: List[str]) -> List[str]:
+    return [f"{words[i]} {words[i + 1]}" for i in range(len(words) - 1)]
+
+
+class KeywordIndex:
+    """
+    Снимок индексов словаря ключевых слов.
+    Собирается целиком в стороне и публикуется в KeywordDictionary одной подменой ссылки;
+    после публикации структура индексов не изменяется (меняется только статистика в KeywordEntry).
+    """
+
+    def __init__(self, version: int = 0):
+        self.version = version
+        # Основной словарь: категория -> список ключевых слов
+        self.category_keywords: Dict[str, List[KeywordEntry]] = defaultdict(list)
+        # Обратный индекс: ключевое слово -> категория
+        self.keyword_to_category: Dict[str, KeywordEntry] = {}
+        # Индекс биграмм: биграмма -> категория
+        self.bigram_to_category: Dict[str, KeywordEntry] = {}
+        # Индекс униграмм (отдельных слов) для быстрого поиска
+        self.unigram_to_categories: Dict[str, List[KeywordEntry]] = defaultdict(list)
+        # Инвертированный индекс символьных триграмм: триграмма -> ключевые слова
+        # (списки вместо множеств: ключевое слово попадает в список триграммы один раз)
+        self.trigram_index: Dict[str, List[str]] = defaultdict(list)
+        self.trigram_keyword_count = 0
+
+    @classmethod
+    def build(cls, entries: Iterable[KeywordEntry], version: int) -> "KeywordIndex":
+        """Полная сборка индекса по списку записей"""
+        index = cls(version)
+        for entry in entries:
+            index._insert(entry)
+        return index
+
+    def _insert(self, entry: KeywordEntry):
+        """Добавление записи во все индексы (только пока индекс не опубликован)"""
+        if not isinstance(entry, KeywordEntry):
+            raise TypeError(f"Entry для ключа '{entry}' должен быть KeywordEntry, но является {type(entry)}")
+        self.keyword_to_category[entry.keyword] = entry
+        self.category_keywords[entry.category].append(entry)
+        words = _keyword_words(entry.keyword)
+        for word in words:
+            self.unigram_to_categories[word].append(entry)
+        for bigram in _keyword_bigrams(words):
+            self.bigram_to_category[bigram] = entry
+        self.index_trigrams(entry.keyword)
+
+    def index_trigrams(self, keyword: str):
+        """Добавление ключевого слова в триграммный индекс"""
+        self.trigram_keyword_count += 1
+        for trigram in _char_trigrams(keyword):
+            self.trigram_index[trigram].append(keyword)
+
+    def with_rebuilt_trigrams(self, version: int) -> "KeywordIndex":
+        """
+        Новый индекс с заново собранным триграммным индексом; остальные индексы общие с текущим.
+        Опубликованный индекс не изменяется: параллельный поиск не увидит пустой или частичный индекс.
+        """
+        new = KeywordIndex(version)
+        new.category_keywords = self.category_keywords
+        new.keyword_to_category = self.keyword_to_category
+        new.bigram_to_category = self.bigram_to_category
+        new.unigram_to_categories = self.unigram_to_categories
+        for keyword in list(self.keyword_to_category):
+            new.index_trigrams(keyword)
+        return new
+
+    def rows_get(self, keyword: str) -> Optional[Tuple[str, float]]:
+        """Строка таблицы для одного ключевого слова: (категория, уверенность) или None"""
+        entry = self.keyword_to_category.get(keyword)
+        return (entry.category, entry.confidence) if entry is not None else None
+
+    def rows(self) -> Dict[str, Tuple[str, float]]:
+        """Содержимое индекса в виде строк таблицы: ключевое слово -> (категория, уверенность)"""
+        return {keyword: (entry.category, entry.confidence) for keyword, entry in self.keyword_to_category.items()}
+
+    def with_changes(self, upserts: Dict[str, Tuple[str, float]], removals: Iterable[str], version: int) -> "KeywordIndex":
+        """
+        Новый индекс с примененными изменениями; текущий индекс не изменяется.
+        Копируются верхние словари (O(размера словаря) на уровне C) и затронутые списки,
+        поэтому изменения нужно применять пакетом, а не по одному слову.
+        Если ничего не меняется, возвращается текущий индекс (версия не увеличивается).
+        """
+        # Удаление слова, которое одновременно обновляется, не выполняется: побеждает обновление
+        removed_keywords = {keyword for keyword in removals if keyword in self.keyword_to_category and keyword not in upserts}
+        upserts = {keyword: row for keyword, row in upserts.items() if self.rows_get(keyword) != row}
+        if not upserts and not removed_keywords:
+            return self
+
+        new = KeywordIndex(version)
+        new.category_keywords = defaultdict(list, self.category_keywords)
+        new.keyword_to_category = dict(self.keyword_to_category)
+        new.bigram_to_category = dict(self.bigram_to_category)
+        new.unigram_to_categories = defaultdict(list, self.unigram_to_categories)
+        new.trigram_index = defaultdict(list, self.trigram_index)
+        new.trigram_keyword_count = self.trigram_keyword_count
+
+        copied_lists: Set[Tuple[str, str]] = set()
+
+        def own_list(table: Dict[str, list], name: str, key: str) -> list:
+            # Список копируется при первом изменении, чтобы не затронуть опубликованный индекс
+            if (name, key) not in copied_lists:
+                copied_lists.add((name, key))
+                table[key] = list(table.get(key, ()))
+            return table[key]
+
+        touched_bigrams: Set[str] = set()
+        replaced: Dict[str, KeywordEntry] = {}
+
+        for keyword in removed_keywords | set(upserts):
+            old = new.keyword_to_category.pop(keyword, None)
+            if old is None:
+                continue
+            replaced[keyword] = old
+            entries = own_list(new.category_keywords, 'category', old.category)
+            entries[:] = [e for e in entries if e is not old]
+            if not entries:
+                del new.category_keywords[old.category]
+            words = old.keyword.split()
+            for word in words:
+                entries = own_list(new.unigram_to_categories, 'unigram', word)
+                entries[:] = [e for e in entries if e is not old]
+                if not entries:
+                    del new.unigram_to_categories[word]
+            for bigram in _keyword_bigrams(words):
+                if new.bigram_to_category.get(bigram) is old:
+                    del new.bigram_to_category[bigram]
+                    touched_bigrams.add(bigram)
+
+        for keyword in removed_keywords:
+            if keyword in replaced:
+                new.trigram_keyword_count -= 1
+                for trigram in _char_trigrams(keyword):
+                    keywords = own_list(new.trigram_index, 'trigram', trigram)
+                    keywords[:] = [k for k in keywords if k != keyword]
+                    if not keywords:
+                        del new.trigram_index[trigram]
+
+        # Биграммы удаленных записей переходят к последней оставшейся записи с такой биграммой
+        for bigram in touched_bigrams:
+            first_word = bigram.split(' ', 1)[0]
+            for entry in new.unigram_to_categories.get(first_word, ()):
+                if bigram in _keyword_bigrams(entry.keyword.split()):
+                    new.bigram_to_category[bigram] = entry
+
+        # Одна отметка времени создания на весь пакет изменений
+        created_at = time.time()
+        for keyword, (category, confidence) in upserts.items():
+            old = replaced.get(keyword)
+            if old is not None:
+                # Сохраняем статистику использования при изменении категории или уверенности
+                entry = old.copy(category, confidence)
+            else:
+                entry = KeywordEntry(keyword=keyword, category=category, confidence=confidence, created_at=created_at)
+            new.keyword_to_category[keyword] = entry
+            own_list(new.category_keywords, 'category', category).append(entry)
+            words = _keyword_words(keyword)
+            for word in words:
+                own_list(new.unigram_to_categories, 'unigram', word).append(entry)
+            for bigram in _keyword_bigrams(words):
+                new.bigram_to_category[bigram] = entry
+            if keyword not in replaced:
+                new.trigram_keyword_count += 1
+                for trigram in _char_trigrams(keyword):
+                    own_list(new.trigram_index, 'trigram', trigram).append(entry.keyword)
+
+        return new
+
+
+def _index_attribute(name: str, doc: str) -> property:
+    """Свойство, читающее индекс из текущей опубликованной версии KeywordIndex"""
+    return property(lambda self: getattr(self._index, name), doc=doc)
 
 
 class KeywordDictionary:
@@ -30,8 +291,17 @@ class KeywordDictionary:
     Класс для системы словаря ключевых слов с категориями и уровнями уверенности.
     Поддерживает хранение ключевых слов по категориям с весами, обратный индекс для быстрого поиска,
     статистику использования и биграммы.
+    Индексы хранятся в KeywordIndex, который перестраивается в стороне и публикуется атомарно,
+    поэтому поиск во время перезагрузки всегда видит целостный индекс.
     """
     
+    category_keywords = _index_attribute('category_keywords', "Основной словарь: категория -> список ключевых слов")
+    keyword_to_category = _index_attribute('keyword_to_category', "Обратный индекс: ключевое слово -> категория")
+    bigram_to_category = _index_attribute('bigram_to_category', "Индекс биграмм: биграмма -> категория")
+    unigram_to_categories = _index_attribute('unigram_to_categories', "Индекс униграмм (отдельных слов)")
+    trigram_index = _index_attribute('trigram_index', "Индекс символьных триграмм: триграмма -> ключевые слова")
+    version = _index_attribute('version', "Версия словаря: увеличивается при каждой публикации индекса")
+    
     def __init__(self, spreadsheet_id: str, sheet_name: str):
         """
         Инициализация словаря ключевых слов
@@ -44,160 +314,181 @@ class KeywordDictionary:
         self.sheet_name = sheet_name
         self.sheets_client = GoogleSheetsClient()
         
-        # Основной словарь: категория -> список ключевых слов
-        self.category_keywords: Dict[str, List[KeywordEntry]] = defaultdict(list)
-        
-        # Обратный индекс: ключевое слово -> категория
-        self.keyword_to_category: Dict[str, KeywordEntry] = {}
-        
-        # Индекс биграмм: биграмма -> категория
-        self.bigram_to_category: Dict[str, KeywordEntry] = {}
+        # Текущая опубликованная версия индексов
+        self._index = KeywordIndex()
         
-        # Индекс униграмм (отдельных слов) для быстрого поиска
-        self.unigram_to_categories: Dict[str, List[KeywordEntry]] = defaultdict(list)
+        # Локальное хранилище ключевых слов (SQLite, см. attach_store) и очередь записи в него
+        self.store = None
+        self._pending_store: List[Tuple[str, str, float, bool, bool]] = []
+        self._store_flush_task: Optional[asyncio.Task] = None
+        # Записи из листа категорий (ключевое слово -> строка): только в индексе, в SQLite не пишутся
+        self._sheet_rows: Dict[str, Tuple[str, float]] = {}
         
-        # Статистика использования
-        self.usage_stats: Counter = Counter()
+        # Статистика использования (счетчики в массивах, сбрасываются в SQLite пачками)
+        self.usage = KeywordUsageStats()
         
         # Дата последнего обновления
         self.last_update: Optional[datetime] = None
         
-        # Инициализация Lemmatizer для лемматизации
-        self.lemmatizer = Lemmatizer()
+        # Общий для процесса Lemmatizer (один MorphAnalyzer и кэш лемм)
+        self.lemmatizer = get_lemmatizer()
     
     def _initialize_morph_analyzer(self):
         """Метод для инициализации morph_analyzer, который можно вызывать отдельно"""
         # Этот метод больше не используется, так как лемматизация вынесена в отдельный класс
         pass
     
-    def load_from_sheets(self):
+    @staticmethod
+    def _parse_rows(data: List[List[str]]) -> Dict[str, Tuple[str, float]]:
+        """
+        Разбор строк листа ключевых слов: ключевое слово -> (категория, уверенность).
+        При повторах ключевого слова побеждает последняя строка.
+        """
+        rows: Dict[str, Tuple[str, float]] = {}
+        for row in data:
+            if len(row) >= 3:  # Убедимся, что есть все необходимые столбцы
+                keyword = row[0].strip().lower()
+                category = row[1].strip()
+                try:
+                    confidence = float(row[2])
+                except ValueError:
+                    confidence = 0.5  # Значение по умолчанию при ошибке
+                rows[keyword] = (category, confidence)
+        return rows
+    
+    def _build_index(self, rows: Dict[str, Tuple[str, float]], incremental: bool = True) -> KeywordIndex:
+        """
+        Сборка нового индекса по строкам таблицы, не затрагивая опубликованный.
+        В инкрементальном режиме применяются только изменившиеся строки (O(изменений)),
+        иначе индекс собирается заново с сохранением статистики неизменившихся записей.
+        """
+        current = self._index
+        version = current.version + 1
+        
+        if incremental and current.keyword_to_category:
+            old_rows = current.rows()
+            upserts = {keyword: row for keyword, row in rows.items() if old_rows.get(keyword) != row}
+            removals = [keyword for keyword in old_rows if keyword not in rows]
+            return current.with_changes(upserts, removals, version)
+        
+        entries = []
+        created_at = time.time()
+        for keyword, (category, confidence) in rows.items():
+            old = current.keyword_to_category.get(keyword)
+            if old is not None and (old.category, old.confidence) == (category, confidence):
+                entries.append(old)
+            elif old is not None:
+                entries.append(old.copy(category, confidence))
+            else:
+                entries.append(KeywordEntry(keyword=keyword, category=category, confidence=confidence, created_at=created_at))
+        return KeywordIndex.build(entries, version)
+    
+    def _publish(self, index: KeywordIndex):
+        """Атомарная публикация новой версии индекса"""
+        self._index = index
+        self.last_update = datetime.now()
+    
+    def load_from_sheets(self, incremental: bool = True):
         """Загрузка данных из Google Sheets"""
         try:
             # Получаем данные из Google Sheets (один batch-запрос)
             data = self.sheets_client.get_sheet_data(self.spreadsheet_id, self.sheet_name)
             
-            # Очищаем текущие данные
-            self.category_keywords.clear()
-            self.keyword_to_category.clear()
-            self.bigram_to_category.clear()
-            self.unigram_to_categories.clear()
-            
-            # Обрабатываем полученные данные (все в памяти, без дополнительных API-вызовов)
-            for row in data:
-                if len(row) >= 3:  # Убедимся, что есть все необходимые столбцы
-                    keyword = row[0].strip().lower()
-                    category = row[1].strip()
-                    try:
-                        confidence = float(row[2])
-                    except ValueError:
-                        confidence = 0.5  # Значение по умолчанию при ошибке
-                    
-                    # Создаем новый или обновляем существующий элемент
-                    if keyword in self.keyword_to_category:
-                       # Обновляем существующий элемент
-                       entry = self.keyword_to_category[keyword]
-                       self._validate_keyword_entry(entry, f" при обновлении из таблицы для ключа '{keyword}'")
-                       entry.category = category
-                       entry.confidence = confidence
-                    else:
-                       # Создаем новый элемент
-                       entry = KeywordEntry(
-                           keyword=keyword,
-                           category=category,
-                           confidence=confidence
-                       )
-                       self.keyword_to_category[keyword] = entry
-                    
-                    # Добавляем в категорию
-                    self.category_keywords[category].append(entry)
-                    
-                    # Добавляем в индекс униграмм
-                    words = keyword.split()
-                    for word in words:
-                        if word not in self.unigram_to_categories:
-                            self.unigram_to_categories[word] = []
-                        self._validate_keyword_entry(entry, f" при добавлении в униграммы из таблицы для слова '{word}'")
-                        self.unigram_to_categories[word].append(entry)
-                    
-                    # Добавляем биграммы, если слов в фразе больше одного
-                    if len(words) > 1:
-                        for i in range(len(words) - 1):
-                            bigram = f"{words[i]} {words[i + 1]}"
-                            self._validate_keyword_entry(entry, f" при добавлении в биграммы из таблицы '{bigram}'")
-                            self.bigram_to_category[bigram] = entry
-            
-            self.last_update = datetime.now()
+            # Новый индекс собирается в стороне и публикуется одной подменой ссылки
+            self._publish(self._build_index(self._parse_rows(data), incremental))
             
         except Exception as e:
             print(f"Ошибка при загрузке данных из Google Sheets: {e}")
 
-    async def async_load_from_sheets(self):
-        """Асинхронная загрузка данных из Google Sheets с использованием кэширования"""
+    async def async_load_from_sheets(self, incremental: bool = True):
+        """
+        Асинхронная загрузка данных из Google Sheets с использованием кэширования.
+        Индекс собирается в отдельном потоке; до публикации поиск использует предыдущую версию.
+        """
         try:
             # Импортируем асинхронный клиент
             from sheets.client import get_sheet_data_with_cache
             # Получаем данные с использованием кэширования
             data = await get_sheet_data_with_cache(self.sheet_name)
             
-            # Очищаем текущие данные
-            self.category_keywords.clear()
-            self.keyword_to_category.clear()
-            self.bigram_to_category.clear()
-            self.unigram_to_categories.clear()
-            
-            # Обрабатываем полученные данные (все в памяти, без дополнительных API-вызовов)
-            for row in data:
-                if len(row) >= 3:  # Убедимся, что есть все необходимые столбцы
-                    keyword = row[0].strip().lower()
-                    category = row[1].strip()
-                    try:
-                        confidence = float(row[2])
-                    except ValueError:
-                        confidence = 0.5  # Значение по умолчанию при ошибке
-                    
-                    # Создаем новый или обновляем существующий элемент
-                    if keyword in self.keyword_to_category:
-                       # Обновляем существующий элемент
-                       entry = self.keyword_to_category[keyword]
-                       self._validate_keyword_entry(entry, f" при асинхронном обновлении из таблицы для ключа '{keyword}'")
-                       entry.category = category
-                       entry.confidence = confidence
-                    else:
-                       # Создаем новый элемент
-                       entry = KeywordEntry(
-                           keyword=keyword,
-                           category=category,
-                           confidence=confidence
-                       )
-                       self.keyword_to_category[keyword] = entry
-                    
-                    # Добавляем в категорию
-                    self.category_keywords[category].append(entry)
-                    
-                    # Добавляем в индекс униграмм
-                    words = keyword.split()
-                    for word in words:
-                        if word not in self.unigram_to_categories:
-                            self.unigram_to_categories[word] = []
-                        self._validate_keyword_entry(entry, f" при добавлении в униграммы при асинхронной загрузке для слова '{word}'")
-                        self.unigram_to_categories[word].append(entry)
-                    
-                    # Добавляем биграммы, если слов в фразе больше одного
-                    if len(words) > 1:
-                        for i in range(len(words) - 1):
-                            bigram = f"{words[i]} {words[i + 1]}"
-                            self._validate_keyword_entry(entry, f" при добавлении в биграммы при асинхронной загрузке '{bigram}'")
-                            self.bigram_to_category[bigram] = entry
-            
-            self.last_update = datetime.now()
+            rows = self._parse_rows(data)
+            if self.store is not None:
+                # Лист — зеркало: переносим из него только правки, не перетирая локальные изменения
+                await self._merge_mirror_rows(rows)
+            else:
+                index = await asyncio.to_thread(self._build_index, rows, incremental)
+                self._publish(index)
             
             # Убедимся, что лемматизатор инициализирован
             if not hasattr(self, 'lemmatizer'):
-                self.lemmatizer = Lemmatizer()
+                self.lemmatizer = get_lemmatizer()
             
         except Exception as e:
             print(f"Ошибка при асинхронной загрузке данных из Google Sheets: {e}")
 
+    async def attach_store(self, store) -> int:
+        """
+        Подключает локальное хранилище ключевых слов (SQLite) и прогревает индекс из него.
+        После подключения хранилище — источник истины, а лист Keywords — зеркало.
+        
+        Returns:
+            Количество загруженных ключевых слов
+        """
+        self.store = store
+        started = time.perf_counter()
+        rows = {keyword: (category, confidence) for keyword, category, confidence, _ in await store.get_keywords()}
+        if rows:
+            self._publish(await asyncio.to_thread(self._build_index, rows, False))
+        logger.info(f"📂 Словарь ключевых слов загружен из SQLite: {len(rows)} слов за {(time.perf_counter() - started) * 1000:.0f} мс")
+        return len(rows)
+    
+    async def _merge_mirror_rows(self, rows: Dict[str, Tuple[str, float]]):
+        """
+        Сверка с листом Keywords: строки, добавленные или измененные в таблице вручную,
+        переносятся в SQLite и индекс. Локальные изменения, еще не попавшие в таблицу, имеют приоритет.
+        """
+        await self.flush_store()
+        unsynced = {keyword for keyword, _, _ in await self.store.get_unsynced_keywords()}
+        current = self._index
+        changed = {
+            keyword: row for keyword, row in rows.items()
+            if keyword not in unsynced and current.rows_get(keyword) != row
+        }
+        if not changed:
+            return
+        await self.store.upsert_keywords([
+            (keyword, category, confidence, False, True) for keyword, (category, confidence) in changed.items()
+        ])
+        # Индекс мог измениться, пока шла запись в SQLite, поэтому берем актуальную версию
+        current = self._index
+        self._publish(current.with_changes(changed, (), current.version + 1))
+        logger.info(f"🔄 Из листа Keywords перенесено {len(changed)} изменений")
+    
+    def _queue_store_rows(self, rows: List[Tuple[str, str, float, bool, bool]]):
+        """Ставит строки в очередь записи в SQLite и запускает запись, если есть event loop"""
+        self._pending_store.extend(rows)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Без event loop строки будут записаны при следующем flush_store()
+            return
+        if self._store_flush_task is None or self._store_flush_task.done():
+            self._store_flush_task = asyncio.create_task(self.flush_store())
+    
+    async def flush_store(self) -> int:
+        """Записывает накопленные изменения ключевых слов в SQLite одним пакетом"""
+        if self.store is None or not self._pending_store:
+            return 0
+        rows, self._pending_store = self._pending_store, []
+        try:
+            await self.store.upsert_keywords(rows)
+        except Exception as e:
+            # Возвращаем строки в очередь: следующая попытка запишет их
+            self._pending_store = rows + self._pending_store
+            logger.error(f"❌ Не удалось сохранить ключевые слова в SQLite: {e}")
+            return 0
+        return len(rows)
+    
     def update_from_sheets(self):
         """Обновление данных из Google Sheets - теперь вызывает асинхронный метод
         Метод изменен, чтобы избежать использования asyncio.run() внутри синхронной функции
@@ -222,60 +513,69 @@ class KeywordDictionary:
         """Метод для обновления словаря - теперь асинхронный"""
         await self.async_load_from_sheets()
     
-    def get_category_by_keyword(self, keyword: str) -> Optional[Tuple[str, float]]:
+    def get_category_by_keyword(
+        self, keyword: Union[str, AnalyzedText], record_usage: bool = True
+    ) -> Optional[Tuple[str, float]]:
         """
         Получение категории по ключевому слову
         
         Args:
-            keyword: Ключевое слово для поиска
+            keyword: Ключевое слово для поиска или уже проанализированный текст
+            record_usage: Учитывать ли использование в статистике (False — служебные поиски,
+                например повторная обработка старых чеков; такой поиск безопасен вне event loop)
             
         Returns:
             Кортеж (категория, уверенность) или None, если не найдено
         """
-        keyword_lower = keyword.strip().lower()
+        analyzed = analyze_text(keyword)
+        # Фиксируем текущую версию индекса: перезагрузка не влияет на уже начатый поиск
+        index = self._index
+        # Одна отметка времени на весь поиск
+        now = time.time()
+        keyword_lower = analyzed.normalized
         
         # Пробуем найти точное совпадение
-        if keyword_lower in self.keyword_to_category:
-            entry = self.keyword_to_category[keyword_lower]
+        if keyword_lower in index.keyword_to_category:
+            entry = index.keyword_to_category[keyword_lower]
             self._validate_keyword_entry(entry, f" для ключа '{keyword_lower}'")
-            self._update_usage_stats(entry)
+            if record_usage:
+                self._update_usage_stats(entry, now)
             return entry.category, entry.confidence
         
         # Пробуем найти по биграммам
-        words = keyword_lower.split()
+        words = analyzed.words
         if len(words) >= 2:
-            for i in range(len(words) - 1):
-                bigram = f"{words[i]} {words[i + 1]}"
-                if bigram in self.bigram_to_category:
-                    entry = self.bigram_to_category[bigram]
+            for bigram in analyzed.bigrams:
+                if bigram in index.bigram_to_category:
+                    entry = index.bigram_to_category[bigram]
                     self._validate_keyword_entry(entry, f" для биграммы '{bigram}'")
-                    self._update_usage_stats(entry)
+                    if record_usage:
+                        self._update_usage_stats(entry, now)
                     return entry.category, entry.confidence
         
         # Пробуем найти по отдельным словам (униграммам)
         max_confidence = 0.0
         best_category = None
         
+        best_entry = None
+        
         for word in words:
-            if word in self.unigram_to_categories:
-                for entry in self.unigram_to_categories[word]:
+            if word in index.unigram_to_categories:
+                for entry in index.unigram_to_categories[word]:
                     self._validate_keyword_entry(entry, f" для униграммы '{word}'")
                     if entry.confidence > max_confidence:
                         max_confidence = entry.confidence
                         best_category = entry.category
+                        best_entry = entry
         
         if best_category:
-            # Создаем фиктивную запись для обновления статистики
-            fake_entry = KeywordEntry(
-                keyword=keyword_lower,
-                category=best_category,
-                confidence=max_confidence
-            )
-            self._update_usage_stats(fake_entry)
+            # Учитываем использование ключевого слова, давшего лучший результат
+            if record_usage:
+                self._update_usage_stats(best_entry, now)
             return best_category, max_confidence
         
         # Если обычный поиск не дал результата, пробуем найти по лемме
-        lemma_result = self._find_by_lemma(keyword)
+        lemma_result = self._find_by_lemma(analyzed, index, now, record_usage)
         if lemma_result:
             return lemma_result
         
@@ -286,66 +586,83 @@ class KeywordDictionary:
         if not isinstance(entry, KeywordEntry):
             raise TypeError(f"Entry{context} должен быть KeywordEntry, но является {type(entry)}")
     
-    def _update_usage_stats(self, entry: KeywordEntry):
-        """Обновление статистики использования для элемента"""
+    def _update_usage_stats(self, entry: KeywordEntry, now: float):
+        """
+        Обновление статистики использования для элемента.
+        Увеличивает счетчик в массивах KeywordUsageStats; KeywordEntry не изменяется до сброса.
+        """
         self._validate_keyword_entry(entry, " для обновления статистики")
-        entry.usage_count += 1
-        entry.last_used = datetime.now()
-        self.usage_stats[entry.keyword] += 1
+        self.usage.record(entry.keyword, now)
     
-    def get_categories_by_text(self, text: str) -> List[Tuple[str, float]]:
+    @property
+    def usage_stats(self) -> Counter:
+        """Статистика использования: ключевое слово -> число использований"""
+        return self.usage.as_counter()
+    
+    def drain_usage(self) -> List[Tuple[str, int, float]]:
+        """
+        Забирает накопленные изменения статистики для записи в SQLite
+        и переносит итоговые значения в KeywordEntry текущего индекса.
+        """
+        rows = self.usage.drain()
+        index = self._index
+        for keyword, _, last_used in rows:
+            entry = index.keyword_to_category.get(keyword)
+            if entry is not None:
+                entry.usage_count = self.usage.count(keyword)
+                entry.last_used = last_used
+        return rows
+    
+    def get_categories_by_text(self, text: Union[str, AnalyzedText]) -> List[Tuple[str, float]]:
         """
         Получение потенциальных категорий по тексту с учетом биграмм
         
         Args:
-            text: Текст для анализа
+            text: Текст для анализа или уже проанализированный текст
             
         Returns:
             Список кортежей (категория, уверенность)
         """
         results = []
-        text_lower = text.strip().lower()
-        words = text_lower.split()
+        analyzed = analyze_text(text)
+        index = self._index
+        now = time.time()
+        text_lower = analyzed.normalized
+        words = analyzed.words
         
         # Проверяем точные совпадения
-        if text_lower in self.keyword_to_category:
-            entry = self.keyword_to_category[text_lower]
+        if text_lower in index.keyword_to_category:
+            entry = index.keyword_to_category[text_lower]
             self._validate_keyword_entry(entry, f" для точного совпадения '{text_lower}'")
-            self._update_usage_stats(entry)
+            self._update_usage_stats(entry, now)
             results.append((entry.category, entry.confidence))
         
         # Проверяем биграммы
-        for i in range(len(words) - 1):
-            bigram = f"{words[i]} {words[i + 1]}"
-            if bigram in self.bigram_to_category:
-                entry = self.bigram_to_category[bigram]
+        for bigram in analyzed.bigrams:
+            if bigram in index.bigram_to_category:
+                entry = index.bigram_to_category[bigram]
                 self._validate_keyword_entry(entry, f" для биграммы '{bigram}'")
-                self._update_usage_stats(entry)
+                self._update_usage_stats(entry, now)
                 results.append((entry.category, entry.confidence))
         
         # Проверяем отдельные слова
         for word in words:
-            if word in self.unigram_to_categories:
-                for entry in self.unigram_to_categories[word]:
+            if word in index.unigram_to_categories:
+                for entry in index.unigram_to_categories[word]:
                     self._validate_keyword_entry(entry, f" для униграммы '{word}'")
                     # Избегаем дубликатов
                     if (entry.category, entry.confidence) not in results:
-                        self._update_usage_stats(entry)
+                        self._update_usage_stats(entry, now)
                         results.append((entry.category, entry.confidence))
         
         # Если не нашли результатов по обычному тексту, пробуем использовать лемматизацию
         if not results:
-            lemma_results = self._find_by_lemma(text)
+            lemma_results = self._find_by_lemma(analyzed, index, now)
             if lemma_results:
                 category, confidence = lemma_results
                 # Проверяем, не является ли уже этот результат дубликатом
+                # (использование уже учтено в _find_by_lemma)
                 if (category, confidence) not in results:
-                    fake_entry = KeywordEntry(
-                        keyword=self.lemmatize_text(text),
-                        category=category,
-                        confidence=confidence
-                    )
-                    self._update_usage_stats(fake_entry)
                     results.append((category, confidence))
         
         # Сортируем по уверенности
@@ -363,83 +680,99 @@ class KeywordDictionary:
             confidence: Уверенность (0.0-1.0)
             save_to_sheet: Сохранять ли ключевое слово в Google Sheets (по умолчанию True)
         """
-        # Нормализуем ключевое слово: приводим к нижнему регистру и убираем лишние пробелы
-        keyword_normalized = self.normalize_text(keyword)
-        
-        # Лемматизируем ключевое слово
-        keyword_lemmatized = self.lemmatizer.lemmatize_text(keyword)
-        
-        # Добавляем нормализованное слово
-        if keyword_normalized in self.keyword_to_category:
-            # Обновляем существующий элемент
-            entry = self.keyword_to_category[keyword_normalized]
-            self._validate_keyword_entry(entry, f" при добавлении нового ключевого слова для ключа '{keyword_normalized}'")
-            entry.category = category
-            entry.confidence = confidence
-        else:
-            # Создаем новый элемент
-            entry = KeywordEntry(
-                keyword=keyword_normalized,
-                category=category,
-                confidence=confidence
-            )
-            self.keyword_to_category[keyword_normalized] = entry
-        
-        # Добавляем в категорию
-        self.category_keywords[category].append(entry)
-        
-        # Обновляем индекс униграмм
-        words = keyword_normalized.split()
-        for word in words:
-            if word not in self.unigram_to_categories:
-                self.unigram_to_categories[word] = []
-            self._validate_keyword_entry(entry, f" при добавлении в униграммы при ручном добавлении для слова '{word}'")
-            self.unigram_to_categories[word].append(entry)
+        self.add_keywords([(keyword, category, confidence)], save_to_sheet=save_to_sheet)
+
+    def _expand_rows(
+        self, rows: Iterable[Tuple[str, str, float]], current: KeywordIndex, replaceable: Dict[str, Tuple[str, float]]
+    ) -> Tuple[Dict[str, Tuple[str, float]], Set[str]]:
+        """
+        Нормализованные ключевые слова и их леммы: (слово -> (категория, уверенность), множество лемм).
+        Лемма не перезаписывает существующее слово, если его нет в replaceable.
+        """
+        upserts: Dict[str, Tuple[str, float]] = {}
+        lemmas: Set[str] = set()
+        for keyword, category, confidence in rows:
+            # Нормализуем ключевое слово: приводим к нижнему регистру и убираем лишние пробелы
+            keyword_normalized = self.normalize_text(keyword)
+            upserts[keyword_normalized] = (category, confidence)
+            lemmas.discard(keyword_normalized)
+            
+            # Лемматизируем ключевое слово
+            keyword_lemmatized = self.lemmatizer.lemmatize_text(keyword)
+            # Если лемматизированное слово отличается от нормализованного, добавляем его тоже
+            if (keyword_lemmatized != keyword_normalized and keyword_lemmatized not in upserts
+                    and (keyword_lemmatized not in current.keyword_to_category or keyword_lemmatized in replaceable)):
+                upserts[keyword_lemmatized] = (category, confidence)
+                lemmas.add(keyword_lemmatized)
+        return upserts, lemmas
+
+    def add_keywords(self, rows: Iterable[Tuple[str, str, float]], save_to_sheet: bool = True) -> int:
+        """
+        Добавление пакета ключевых слов одной публикацией индекса
         
-        # Обновляем биграммы
-        if len(words) > 1:
-            for i in range(len(words) - 1):
-                bigram = f"{words[i]} {words[i + 1]}"
-                self._validate_keyword_entry(entry, f" при добавлении в биграммы при ручном добавлении '{bigram}'")
-                self.bigram_to_category[bigram] = entry
-        
-        # Если лемматизированное слово отличается от нормализованного, добавляем его тоже
-        if keyword_lemmatized != keyword_normalized:
-            if keyword_lemmatized not in self.keyword_to_category:
-                # Создаем новый элемент для леммы
-                lemma_entry = KeywordEntry(
-                    keyword=keyword_lemmatized,
-                    category=category,
-                    confidence=confidence
-                )
-                self._validate_keyword_entry(lemma_entry, f" при добавлении леммы для ключа '{keyword_lemmatized}'")
-                self.keyword_to_category[keyword_lemmatized] = lemma_entry
-                
-                # Добавляем лемму в категорию
-                self.category_keywords[category].append(lemma_entry)
-                
-                # Обновляем индекс униграмм для леммы
-                lemma_words = keyword_lemmatized.split()
-                for word in lemma_words:
-                    if word not in self.unigram_to_categories:
-                        self.unigram_to_categories[word] = []
-                    # Добавляем проверку типа перед добавлением в список
-                    self._validate_keyword_entry(lemma_entry, f" при добавлении в униграммы для слова '{word}'")
-                    self.unigram_to_categories[word].append(lemma_entry)
-                
-                # Обновляем биграммы для леммы
-                if len(lemma_words) > 1:
-                    for i in range(len(lemma_words) - 1):
-                        bigram = f"{lemma_words[i]} {lemma_words[i + 1]}"
-                        self._validate_keyword_entry(lemma_entry, f" при добавлении в биграммы '{bigram}'")
-                        self.bigram_to_category[bigram] = lemma_entry
-        
-        # Сохраняем в Google Sheets только если save_to_sheet=True
-        # Для асинхронного вызова используем отдельную функцию
-        if save_to_sheet:
-            self._async_add_keyword_to_sheet(keyword_normalized, category, confidence)
+        Args:
+            rows: Строки (ключевое слово, категория, уверенность)
+            save_to_sheet: Сохранять ли ключевые слова в Google Sheets (по умолчанию True)
+            
+        Returns:
+            Количество добавленных или измененных записей (включая леммы)
+        """
+        current = self._index
+        upserts, lemmas = self._expand_rows(rows, current, {})
+        
+        # Неизменившиеся записи не публикуются: версия словаря (и кэш автомата поиска) сохраняется
+        upserts = {word: row for word, row in upserts.items() if current.rows_get(word) != row}
+        if not upserts:
+            return 0
+        
+        # Изменения применяются к копии индекса и публикуются одной подменой ссылки
+        self._publish(current.with_changes(upserts, (), current.version + 1))
+        # Выученное слово больше не считается записью листа категорий
+        for word in upserts:
+            self._sheet_rows.pop(word, None)
+        
+        if self.store is not None:
+            # Источник истины — SQLite; в Google Sheets слово попадет при синхронизации зеркала
+            # (леммы и слова с save_to_sheet=False в таблицу не зеркалируются)
+            self._queue_store_rows([
+                (word, row_category, row_confidence, word in lemmas, not save_to_sheet or word in lemmas)
+                for word, (row_category, row_confidence) in upserts.items()
+            ])
+        elif save_to_sheet:
+            # Без локального хранилища сохраняем сразу в Google Sheets
+            for word, (row_category, row_confidence) in upserts.items():
+                if word not in lemmas:
+                    self._async_add_keyword_to_sheet(word, row_category, row_confidence)
+        return len(upserts)
+
+    def sync_sheet_keywords(self, rows: Iterable[Tuple[str, str, float]]) -> int:
+        """
+        Синхронизация с ключевыми словами листа категорий одной публикацией индекса.
+        Источник этих слов — лист, поэтому они хранятся только в индексе и не пишутся в SQLite
+        (иначе удаленное из листа слово возвращалось бы из хранилища после перезапуска).
+        Слова, пропавшие из листа, удаляются, если их не переопределили обучением или листом Keywords.
         
-        self.last_update = datetime.now()
+        Args:
+            rows: Все строки листа категорий (ключевое слово, категория, уверенность)
+            
+        Returns:
+            Количество добавленных, измененных и удаленных записей (включая леммы)
+        """
+        current = self._index
+        sheet_rows, _ = self._expand_rows(rows, current, self._sheet_rows)
+        stale = [
+            word for word, row in self._sheet_rows.items()
+            if word not in sheet_rows and current.rows_get(word) == row
+        ]
+        upserts = {word: row for word, row in sheet_rows.items() if current.rows_get(word) != row}
+        if not upserts and not stale:
+            return 0
+        
+        self._publish(current.with_changes(upserts, stale, current.version + 1))
+        for word in stale:
+            del self._sheet_rows[word]
+        self._sheet_rows.update(upserts)
+        return len(upserts) + len(stale)
 
     def _async_add_keyword_to_sheet(self, keyword: str, category: str, confidence: float):
         """Асинхронное добавление ключевого слова в Google Sheets
@@ -479,7 +812,10 @@ class KeywordDictionary:
         """
         return self.lemmatizer.lemmatize_text(text)
     
-    def _find_by_lemma(self, text: str) -> Optional[Tuple[str, float]]:
+    def _find_by_lemma(
+        self, text: Union[str, AnalyzedText], index: Optional[KeywordIndex] = None, now: Optional[float] = None,
+        record_usage: bool = True
+    ) -> Optional[Tuple[str, float]]:
         """
         Поиск категории по лемматизированному тексту
         """
@@ -487,46 +823,49 @@ class KeywordDictionary:
         if not hasattr(self, 'lemmatizer') or not self.lemmatizer.morph_analyzer:
             return None
             
-        # Лемматизируем входной текст
-        lemmatized_text = self.lemmatize_text(text)
+        # Леммы берутся из AnalyzedText (вычисляются один раз на текст)
+        analyzed = analyze_text(text)
+        index = index or self._index
+        now = now or time.time()
+        lemmatized_text = analyzed.lemmatized_text
         
         # Пробуем найти точное совпадение с лемматизированным текстом
-        if lemmatized_text in self.keyword_to_category:
-            entry = self.keyword_to_category[lemmatized_text]
+        if lemmatized_text in index.keyword_to_category:
+            entry = index.keyword_to_category[lemmatized_text]
             self._validate_keyword_entry(entry, f" для лемматизированного текста '{lemmatized_text}'")
-            self._update_usage_stats(entry)
+            if record_usage:
+                self._update_usage_stats(entry, now)
             return entry.category, entry.confidence
         
         # Проверяем биграммы в лемматизированном тексте
-        lemmatized_words = lemmatized_text.split()
-        for i in range(len(lemmatized_words) - 1):
-            bigram = f"{lemmatized_words[i]} {lemmatized_words[i + 1]}"
-            if bigram in self.bigram_to_category:
-                entry = self.bigram_to_category[bigram]
+        lemmatized_words = analyzed.lemmatized_words
+        for bigram in analyzed.lemmatized_bigrams:
+            if bigram in index.bigram_to_category:
+                entry = index.bigram_to_category[bigram]
                 self._validate_keyword_entry(entry, f" для биграммы '{bigram}'")
-                self._update_usage_stats(entry)
+                if record_usage:
+                    self._update_usage_stats(entry, now)
                 return entry.category, entry.confidence
         
         # Проверяем отдельные лемматизированные слова
         max_confidence = 0.0
         best_category = None
         
+        best_entry = None
+        
         for word in lemmatized_words:
-            if word in self.unigram_to_categories:
-                for entry in self.unigram_to_categories[word]:
+            if word in index.unigram_to_categories:
+                for entry in index.unigram_to_categories[word]:
                     self._validate_keyword_entry(entry, f" для униграммы '{word}'")
                     if entry.confidence > max_confidence:
                         max_confidence = entry.confidence
                         best_category = entry.category
+                        best_entry = entry
         
         if best_category:
-            # Создаем фиктивную запись для обновления статистики
-            fake_entry = KeywordEntry(
-                keyword=lemmatized_text,
-                category=best_category,
-                confidence=max_confidence
-            )
-            self._update_usage_stats(fake_entry)
+            # Учитываем использование ключевого слова, давшего лучший результат
+            if record_usage:
+                self._update_usage_stats(best_entry, now)
             return best_category, max_confidence
         
         return None
@@ -555,39 +894,83 @@ class KeywordDictionary:
         """Получение полной информации о ключевом слове"""
         return self.keyword_to_category.get(keyword.strip().lower())
     
+    def _ensure_trigram_index(self, index: KeywordIndex) -> KeywordIndex:
+        """
+        Индекс с актуальными триграммами: если keyword_to_category изменили в обход add_keyword/load,
+        публикуется новая версия с пересобранным триграммным индексом.
+        """
+        if index.trigram_keyword_count == len(index.keyword_to_category):
+            return index
+        rebuilt = index.with_rebuilt_trigrams(index.version + 1)
+        # Публикуем, только если за время пересборки не появилась более новая версия
+        if self._index is index:
+            self._publish(rebuilt)
+        return rebuilt
+    
     def search_similar_keywords(self, keyword: str, threshold: float = 0.8) -> List[KeywordEntry]:
         """
-        Поиск похожих ключевых слов по схожести
+        Поиск похожих ключевых слов по схожести.
+        Оцениваются только кандидаты, имеющие общие триграммы с запросом.
         
         Args:
             keyword: Ключевое слово для поиска
             threshold: Порог схожести (0.0-1.0)
             
         Returns:
-            Список похожих ключевых слов
+            Список похожих ключевых слов, от наиболее похожих
         """
+        return [entry for entry, _ in self._search_similar(keyword, threshold)]
+    
+    def _search_similar(self, keyword: str, threshold: float) -> List[Tuple[KeywordEntry, float]]:
         keyword_lower = keyword.strip().lower()
-        similar = []
+        if not keyword_lower:
+            return []
+        index = self._ensure_trigram_index(self._index)
+        
+        candidates = set()
+        for trigram in _char_trigrams(keyword_lower):
+            candidates.update(index.trigram_index.get(trigram, ()))
         
-        for stored_keyword in self.keyword_to_category:
+        similar = []
+        for stored_keyword in candidates:
             similarity = self._calculate_similarity(keyword_lower, stored_keyword)
             if similarity >= threshold:
-                similar.append(self.keyword_to_category[stored_keyword])
+                similar.append((index.keyword_to_category[stored_keyword], similarity))
         
+        similar.sort(key=lambda item: item[1], reverse=True)
         return similar
     
+    def find_fuzzy_category(self, text: Union[str, AnalyzedText], threshold: float = FUZZY_MATCH_THRESHOLD) -> Optional[Tuple[str, float]]:
+        """
+        Устойчивый к опечаткам поиск категории ("малоко" -> "молоко").
+        Уверенность записи умножается на схожесть.
+        
+        Returns:
+            Кортеж (категория, уверенность) или None, если похожих слов нет
+        """
+        best = None
+        for word in analyze_text(text).alpha_words:
+            if len(word) < FUZZY_MIN_WORD_LENGTH:
+                continue
+            for entry, similarity in self._search_similar(word, threshold)[:1]:
+                confidence = entry.confidence * similarity
+                if best is None or confidence > best[1]:
+                    best = (entry.category, confidence)
+        return best
+    
     def _calculate_similarity(self, s1: str, s2: str) -> float:
         """
-        Вычисление схожести между двумя строками (упрощенная версия)
+        Вычисление схожести между двумя строками
         
         Args:
             s1: Первая строка
             s2: Вторая строка
             
         Returns:
-            Коэффициент схожести (0.0-1.0)
+            Коэффициент схожести (0.0-1.0): максимум из схожести наборов слов
+            и посимвольной схожести (устойчива к опечаткам)
         """
-        # Простой алгоритм схожести - отношение длины пересечения к объединению
+        # Отношение пересечения наборов слов к объединению
         set1 = set(s1.split())
         set2 = set(s2.split())
         
@@ -599,4 +982,4 @@ class KeywordDictionary:
         intersection = set1.intersection(set2)
         union = set1.union(set2)
         
-        return len(intersection) / len(union)
\ No newline at end of file
+        return max(len(intersection) / len(union), SequenceMatcher(None, s1, s2).ratio())
@@ -0,0 +1,92 @@
+"""
+Модуль для учета популярности ключевых слов.
+Счетчики хранятся в компактных массивах по номеру слота ключевого слова: поиск лишь
+увеличивает число в массиве, без создания объектов. Накопленные изменения периодически
+сбрасываются пачкой в SQLite (см. services/usage_stats_worker.py).
+"""
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class KeywordUsageStats:
+    """Счетчики использования ключевых слов в массивах, индексируемых номером слота"""
+
+    def __init__(self):
+        self._slots: Dict[str, int] = {}
+        self._keywords: List[str] = []
+        # Всего использований (включая загруженные из SQLite)
+        self.counts = array('q')
+        # Использования, еще не сброшенные в SQLite
+        self.pending = array('q')
+        # Время последнего использования (Unix time, 0.0 — не использовалось)
+        self.last_used = array('d')
+        # Слоты с ненулевым pending (добавляются при переходе 0 -> 1)
+        self._dirty = array('q')
+
+    def slot(self, keyword: str) -> int:
+        """Номер слота ключевого слова (выделяется при первом обращении)"""
+        slot = self._slots.get(keyword)
+        if slot is None:
+            slot = len(self._keywords)
+            self._slots[keyword] = slot
+            self._keywords.append(keyword)
+            self.counts.append(0)
+            self.pending.append(0)
+            self.last_used.append(0.0)
+        return slot
+
+    def record(self, keyword: str, now: float):
+        """Учет одного использования; время передается вызывающим (одно на пакет поиска)"""
+        slot = self.slot(keyword)
+        self.counts[slot] += 1
+        if not self.pending[slot]:
+            self._dirty.append(slot)
+        self.pending[slot] += 1
+        self.last_used[slot] = now
+
+    def record_many(self, keywords: Iterable[str], now: float):
+        for keyword in keywords:
+            self.record(keyword, now)
+
+    def count(self, keyword: str) -> int:
+        slot = self._slots.get(keyword)
+        return self.counts[slot] if slot is not None else 0
+
+    def last_used_at(self, keyword: str) -> Optional[float]:
+        slot = self._slots.get(keyword)
+        if slot is None or not self.last_used[slot]:
+            return None
+        return self.last_used[slot]
+
+    @property
+    def has_pending(self) -> bool:
+        return len(self._dirty) > 0
+
+    def drain(self) -> List[Tuple[str, int, float]]:
+        """Забирает несброшенные изменения: (ключевое слово, прирост, время последнего использования)"""
+        rows = []
+        for slot in self._dirty:
+            rows.append((self._keywords[slot], self.pending[slot], self.last_used[slot]))
+            self.pending[slot] = 0
+        self._dirty = array('q')
+        return rows
+
+    def restore(self, rows: Iterable[Tuple[str, int, float]]):
+        """Возвращает изменения в очередь сброса (если запись в SQLite не удалась)"""
+        for keyword, delta, _ in rows:
+            slot = self.slot(keyword)
+            if not self.pending[slot]:
+                self._dirty.append(slot)
+            self.pending[slot] += delta
+
+    def load(self, persisted: Dict[str, Tuple[int, float]]):
+        """Добавляет к счетчикам значения, сохраненные в SQLite в прошлых запусках"""
+        for keyword, (count, last_used) in persisted.items():
+            slot = self.slot(keyword)
+            self.counts[slot] += count
+            if last_used and last_used > self.last_used[slot]:
+                self.last_used[slot] = last_used
+
+    def as_counter(self) -> Counter:
+        return Counter({keyword: self.counts[slot] for keyword, slot in self._slots.items() if self.counts[slot]})
@@ -26,6 +26,7 @@ class CheckData(BaseModel):
     items: list[CheckItem] = Field(default_factory=list) # Структурированный список товаров
     payment_info: str = ''
     check_datetime_str: Optional[str] = None # Дата в сыром виде из API
+    receipt_key: Optional[str] = None # Ключ сохраненного сырого ответа API (таблица raw_receipts)
 
     @property
     def transaction_datetime(self) -> datetime:
@@ -55,4 +56,5 @@ class TransactionData(BaseModel):
     retailer_name: str = ""
     items_list: str = ""
     payment_info: str = ""
-    transaction_dt: datetime = Field(default_factory=datetime.now)
\ No newline at end of file
+    transaction_dt: datetime = Field(default_factory=datetime.now)
+    receipt_key: Optional[str] = None # Ключ сырого ответа API чека, из которого создана транзакция
\ No newline at end of file
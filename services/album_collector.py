@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# services/album_collector.py
+"""
+Сбор альбомов (media group).
+Telegram присылает каждое фото альбома отдельным апдейтом с общим media_group_id.
+Коллектор накапливает их и, когда новые фото перестают приходить (ALBUM_COLLECT_DELAY),
+передает весь альбом одним вызовом — чеки альбома обрабатываются одной задачей.
+"""
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from config import logger, ALBUM_COLLECT_DELAY
+
+
+@dataclass
+class _PendingAlbum:
+    on_complete: Callable[[List[Any]], Awaitable[None]]
+    items: List[Any] = field(default_factory=list)
+    timer: Optional[asyncio.Task] = None
+
+
+class AlbumCollector:
+    """Накопитель фото альбомов с отложенной передачей (debounce по последнему фото)"""
+
+    def __init__(self, delay: float = ALBUM_COLLECT_DELAY):
+        self.delay = delay
+        self._pending: Dict[str, _PendingAlbum] = {}
+
+    def add(self, media_group_id: str, item: Any, on_complete: Callable[[List[Any]], Awaitable[None]]) -> bool:
+        """
+        Добавляет элемент альбома. on_complete первого элемента будет вызван со всеми элементами
+        альбома. Возвращает True для первого элемента альбома.
+        """
+        album = self._pending.get(media_group_id)
+        first = album is None
+        if first:
+            album = self._pending[media_group_id] = _PendingAlbum(on_complete)
+        album.items.append(item)
+
+        # Каждое новое фото откладывает передачу альбома
+        if album.timer is not None:
+            album.timer.cancel()
+        album.timer = asyncio.create_task(self._complete_later(media_group_id, album))
+        return first
+
+    async def _complete_later(self, media_group_id: str, album: _PendingAlbum):
+        await asyncio.sleep(self.delay)
+        if self._pending.get(media_group_id) is not album:
+            return
+        del self._pending[media_group_id]
+        logger.info(f"🖼️ Альбом {media_group_id} собран: {len(album.items)} фото")
+        try:
+            await album.on_complete(album.items)
+        except Exception as e:
+            logger.error(f"❌ Ошибка обработки альбома {media_group_id}: {e}")
+
+    def pending(self) -> int:
+        return len(self._pending)
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+# services/fair_scheduler.py
+"""
+Справедливое распределение дорогих операций между пользователями.
+Распознавание чеков и чтение истории из Google Sheets упираются в общие квоты внешних API;
+при обычной FIFO-очереди один пользователь с 30 фото задерживает всех остальных.
+FairScheduler выдает слоты выполнения по алгоритму Deficit Round Robin: пользователи с ожидающими
+запросами обслуживаются по кругу, каждый получает квант «стоимости» за проход (альбом из 10 фото
+стоит 10). Дополнительно ограничиваются одновременные операции одного пользователя и глубина его очереди.
+"""
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, Hashable, Optional
+
+from config import logger
+from utils.exceptions import SchedulerQueueFull, UserQueueLimit
+
+
+@dataclass(eq=False)
+class Ticket:
+    """Запрос в очереди планировщика; future завершается, когда выдан слот"""
+    user_id: Hashable
+    cost: int
+    future: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+
+class FairScheduler:
+    """Слоты выполнения с честной очередью по user_id (Deficit Round Robin)"""
+
+    def __init__(self, name: str, capacity: int, per_user_limit: int = 1,
+                 max_queued_per_user: int = 10, max_queued: int = 100, quantum: int = 1):
+        self.name = name
+        self.capacity = capacity
+        self.per_user_limit = per_user_limit
+        self.max_queued_per_user = max_queued_per_user
+        self.max_queued = max_queued
+        self.quantum = quantum
+
+        self._queues: Dict[Hashable, Deque[Ticket]] = {}
+        # Круг пользователей с ожидающими запросами
+        self._ring: Deque[Hashable] = deque()
+        self._deficit: Dict[Hashable, int] = {}
+        self._running: Dict[Hashable, int] = {}
+        self._running_total = 0
+        self._queued_total = 0
+
+    def position(self, user_id: Hashable) -> int:
+        """
+        Оценка позиции нового запроса пользователя (1 — выполнится следующим).
+        Если запрос не будет принят, выбрасывает UserQueueLimit или SchedulerQueueFull.
+        """
+        own = len(self._queues.get(user_id, ()))
+        if own >= self.max_queued_per_user:
+            raise UserQueueLimit(f"{self.name}: у пользователя уже {own} запросов в очереди")
+        if self._queued_total >= self.max_queued:
+            raise SchedulerQueueFull(f"{self.name}: в очереди уже {self._queued_total} запросов")
+        return self._estimate(user_id, own + 1)
+
+    def ticket_position(self, ticket: "Ticket") -> int:
+        """Оценка текущей позиции запроса в очереди (0 — слот уже выдан)"""
+        if ticket.future.done():
+            return 0
+        return self._estimate(ticket.user_id, self._queues[ticket.user_id].index(ticket) + 1)
+
+    def _estimate(self, user_id: Hashable, mine: int) -> int:
+        # При обслуживании по кругу перед mine-м запросом пользователя окажется не больше mine
+        # запросов каждого другого пользователя
+        others = sum(min(len(queue), mine) for uid, queue in self._queues.items() if uid != user_id)
+        return others + mine
+
+    def queued(self) -> int:
+        return self._queued_total
+
+    def running(self) -> int:
+        return self._running_total
+
+    def enqueue(self, user_id: Hashable, cost: int = 1) -> "Ticket":
+        """
+        Ставит запрос в очередь синхронно (лимиты учитываются сразу) и возвращает билет для hold().
+        Если запрос не принят, выбрасывает UserQueueLimit или SchedulerQueueFull.
+        """
+        self.position(user_id)
+        ticket = Ticket(user_id, max(1, cost))
+        if user_id not in self._queues:
+            self._queues[user_id] = deque()
+            self._ring.append(user_id)
+        self._queues[user_id].append(ticket)
+        self._queued_total += 1
+        self._dispatch()
+        return ticket
+
+    @asynccontextmanager
+    async def hold(self, ticket: "Ticket", on_queued: Optional[Callable[[int], Awaitable[None]]] = None):
+        """
+        Ожидает выдачи слота по билету и удерживает слот на время блока.
+        Если слот не выдан сразу, вызывается on_queued(позиция).
+        """
+        try:
+            if on_queued is not None and not ticket.future.done():
+                try:
+                    await on_queued(self.ticket_position(ticket))
+                except Exception as e:
+                    logger.warning(f"⚠️ Не удалось сообщить о позиции в очереди {self.name}: {e}")
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.future.done() and not ticket.future.cancelled():
+                # Слот уже выдан — возвращаем его
+                self._release(ticket.user_id)
+            else:
+                self._remove(ticket)
+            raise
+
+        try:
+            yield
+        finally:
+            self._release(ticket.user_id)
+
+    @asynccontextmanager
+    async def slot(self, user_id: Hashable, cost: int = 1):
+        """Ставит запрос в очередь, ожидает своей очереди и удерживает слот выполнения на время блока"""
+        async with self.hold(self.enqueue(user_id, cost)):
+            yield
+
+    def _remove(self, ticket: Ticket):
+        queue = self._queues.get(ticket.user_id)
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            self._queued_total -= 1
+            if not queue:
+                self._drop_user(ticket.user_id)
+
+    def _drop_user(self, user_id: Hashable):
+        del self._queues[user_id]
+        self._ring.remove(user_id)
+        self._deficit.pop(user_id, None)
+
+    def _release(self, user_id: Hashable):
+        self._running[user_id] -= 1
+        if not self._running[user_id]:
+            del self._running[user_id]
+        self._running_total -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Выдает свободные слоты ожидающим по кругу пользователей"""
+        while self._running_total < self.capacity:
+            ticket = self._next_ticket()
+            if ticket is None:
+                return
+            self._running[ticket.user_id] = self._running.get(ticket.user_id, 0) + 1
+            self._running_total += 1
+            ticket.future.set_result(None)
+
+    def _next_ticket(self):
+        # Пользователи, у которых уже выполняется per_user_limit операций, пропускаются
+        if not any(self._running.get(uid, 0) < self.per_user_limit for uid in self._ring):
+            return None
+
+        # Дефицит каждого подходящего пользователя растет на квант за проход, поэтому цикл конечен
+        while True:
+            user_id = self._ring[0]
+            if self._running.get(user_id, 0) >= self.per_user_limit:
+                self._ring.rotate(-1)
+                continue
+
+            queue = self._queues[user_id]
+            head = queue[0]
+            if self._deficit.get(user_id, 0) < head.cost:
+                self._deficit[user_id] = self._deficit.get(user_id, 0) + self.quantum
+                self._ring.rotate(-1)
+                continue
+
+            queue.popleft()
+            self._queued_total -= 1
+            self._deficit[user_id] -= head.cost
+            if queue:
+                # Следующий запрос этого пользователя — после остальных
+                self._ring.rotate(-1)
+            else:
+                self._drop_user(user_id)
+            logger.debug(f"{self.name}: слот выдан пользователю {user_id} (стоимость {head.cost})")
+            return head
+
+
+@asynccontextmanager
+async def fair_slot(scheduler: Optional[FairScheduler], user_id: Hashable,
+                    on_queued: Optional[Callable[[int], Awaitable[None]]] = None, cost: int = 1):
+    """
+    Слот планировщика для обработчика: если слот не выдан сразу, вызывает on_queued(позиция),
+    чтобы пользователь получил быстрый ответ «в очереди», а не молчаливое ожидание.
+    Без планировщика блок выполняется сразу.
+    """
+    if scheduler is None:
+        yield
+        return
+    async with scheduler.hold(scheduler.enqueue(user_id, cost), on_queued):
+        yield
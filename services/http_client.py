@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# services/http_client.py
+"""
+Общий HTTP-клиент приложения.
+Один aiohttp.ClientSession на все время работы бота: соединения с api.telegram.org и
+proverkacheka.com переиспользуются (keep-alive), DNS кэшируется, число соединений
+к одному хосту ограничено. Создается в main() и передается через dp.workflow_data.
+"""
+from typing import Optional
+
+import aiohttp
+
+# Всего соединений в пуле и на один хост
+HTTP_POOL_LIMIT = 20
+HTTP_LIMIT_PER_HOST = 8
+# Сколько держать открытым простаивающее соединение и кэшировать DNS (секунды)
+HTTP_KEEPALIVE_TIMEOUT = 60
+HTTP_DNS_CACHE_TTL = 300
+# Таймаут установки соединения; общий таймаут запроса задает вызывающий код
+HTTP_CONNECT_TIMEOUT = 10
+
+
+def create_http_session() -> aiohttp.ClientSession:
+    """Создает сеанс с пулом соединений (вызывать внутри запущенного event loop)"""
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=None, sock_connect=HTTP_CONNECT_TIMEOUT),
+    )
+
+
+async def download_bytes(url: str, session: Optional[aiohttp.ClientSession] = None) -> bytes:
+    """Скачивает файл целиком; без общего сеанса создает временный"""
+    if session is None:
+        async with aiohttp.ClientSession() as temporary_session:
+            return await download_bytes(url, temporary_session)
+
+    async with session.get(url) as response:
+        response.raise_for_status()
+        return await response.read()
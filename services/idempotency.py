@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+# services/idempotency.py
+"""
+Идемпотентность подтверждений.
+Двойное нажатие «✅ Подтвердить» или повторная доставка апдейта Telegram запускают хендлер
+подтверждения дважды, и транзакция записывается два раза (и дважды попадает в обучение).
+Перед записью хендлер «захватывает» ключи подтверждения: id callback-запроса (повторная доставка
+того же апдейта) и токен черновика из FSM (двойное нажатие дает разные callback-запросы,
+но один черновик). Повтор с уже захваченным ключом поглощается: сначала проверяется
+память процесса, затем таблица processed_confirmations с TTL (переживает перезапуск бота).
+"""
+import time
+import uuid
+from typing import Awaitable, Dict, Iterable, List, Optional, TypeVar
+
+from aiogram import types
+
+from config import logger, IDEMPOTENCY_TTL
+from utils.exceptions import DuplicateReceiptError
+
+T = TypeVar('T')
+
+# Размер памяти процесса, после которого из нее удаляются устаревшие ключи
+_MEMORY_PRUNE_SIZE = 1000
+
+
+def new_draft_token() -> str:
+    """Токен черновика: сохраняется в FSM (draft_token), когда пользователю показывается подтверждение"""
+    return uuid.uuid4().hex
+
+
+def confirmation_keys(callback: types.CallbackQuery, data: Dict) -> List[str]:
+    """Ключи подтверждения: id callback-запроса и токен черновика (если он есть)"""
+    keys = [f"callback:{callback.id}"]
+    if data.get('draft_token'):
+        keys.append(f"draft:{data['draft_token']}")
+    return keys
+
+
+class IdempotencyGuard:
+    """Однократное выполнение подтверждений по ключам (память процесса + таблица SQLite с TTL)"""
+
+    def __init__(self, repository, ttl: float = IDEMPOTENCY_TTL):
+        self.repository = repository
+        self.ttl = ttl
+        # Ключ -> время истечения
+        self._recent: Dict[str, float] = {}
+
+    async def claim(self, keys: Iterable[str]) -> bool:
+        """
+        Захватывает ключи. Возвращает False, если хотя бы один ключ уже захвачен (повтор),
+        и True, если операцию нужно выполнить.
+        """
+        keys = list(keys)
+        now = time.time()
+        # Проверка и отметка в памяти выполняются без await: одновременный повтор отсекается здесь
+        if any(self._recent.get(key, 0) > now for key in keys):
+            return False
+        for key in keys:
+            self._recent[key] = now + self.ttl
+        self._prune(now)
+
+        try:
+            claimed = await self.repository.claim_idempotency_keys(keys, now, now - self.ttl)
+        except Exception as e:
+            # Без таблицы защита работает только в пределах процесса
+            logger.warning(f"⚠️ Не удалось сохранить ключи идемпотентности: {e}")
+            return True
+        if not claimed:
+            logger.info(f"♻️ Повторное подтверждение пропущено ({', '.join(keys)})")
+        return claimed
+
+    async def release(self, keys: Iterable[str]):
+        """Освобождает ключи после неудачной операции, чтобы ее можно было повторить"""
+        keys = list(keys)
+        for key in keys:
+            self._recent.pop(key, None)
+        try:
+            await self.repository.release_idempotency_keys(keys)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось освободить ключи идемпотентности: {e}")
+
+    def _prune(self, now: float):
+        if len(self._recent) > _MEMORY_PRUNE_SIZE:
+            self._recent = {key: expires for key, expires in self._recent.items() if expires > now}
+
+    async def purge_expired(self) -> int:
+        """Удаляет устаревшие ключи из таблицы (вызывается при старте)"""
+        try:
+            return await self.repository.purge_idempotency_keys(time.time() - self.ttl)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось очистить ключи идемпотентности: {e}")
+            return 0
+
+
+async def claim_confirmation(guard: Optional[IdempotencyGuard], keys: List[str]) -> bool:
+    """Захват ключей подтверждения для хендлера; без guard подтверждение выполняется всегда"""
+    if guard is None:
+        return True
+    return await guard.claim(keys)
+
+
+async def release_confirmation(guard: Optional[IdempotencyGuard], keys: List[str]):
+    """Освобождение ключей после ошибки записи, чтобы пользователь мог подтвердить снова"""
+    if guard is not None:
+        await guard.release(keys)
+
+
+async def save_confirmed(guard: Optional[IdempotencyGuard], keys: List[str], save: Awaitable[T]) -> T:
+    """
+    Запись под захваченными ключами: при любой ошибке записи ключи освобождаются, чтобы
+    подтверждение можно было повторить; после успешной записи захват сохраняется
+    (ошибка при показе результата не должна разрешать повторную запись).
+    Повтор чека (DuplicateReceiptError) захват не снимает: ничего не записано, но и повторять нечего.
+    """
+    try:
+        return await save
+    except DuplicateReceiptError:
+        raise
+    except Exception:
+        await release_confirmation(guard, keys)
+        raise
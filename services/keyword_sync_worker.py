@@ -0,0 +1,43 @@
+import asyncio
+import logging
+
+from .repository import TransactionRepository
+from sheets.client import add_keyword_rows_to_sheet
+
+
+logger = logging.getLogger(__name__)
+
+KEYWORD_SYNC_INTERVAL = 60  # Период синхронизации зеркала ключевых слов в Google Sheets (секунды)
+
+
+async def sync_keywords_to_sheet(keyword_dict, repository: TransactionRepository) -> int:
+    """
+    Дописывает в лист Keywords ключевые слова, сохраненные локально, но еще не зеркалированные.
+    Строки помечаются синхронизированными только после успешной записи в таблицу.
+    """
+    await keyword_dict.flush_store()
+    unsynced = await repository.get_unsynced_keywords()
+    if not unsynced:
+        return 0
+    if not await add_keyword_rows_to_sheet([list(row) for row in unsynced]):
+        return 0
+    await repository.mark_keywords_synced(unsynced)
+    return len(unsynced)
+
+
+async def start_keyword_sync_worker(keyword_dict, repository: TransactionRepository, interval: float = KEYWORD_SYNC_INTERVAL):
+    """Фоновый воркер: локальная SQLite — источник истины, лист Keywords догоняет ее асинхронно"""
+    logger.info("Keyword sync worker started.")
+    while True:
+        try:
+            synced = await sync_keywords_to_sheet(keyword_dict, repository)
+            if synced:
+                logger.info(f"Синхронизировано {synced} ключевых слов с Google Sheets")
+            await asyncio.sleep(interval)
+        except asyncio.CancelledError:
+            # Сохраняем локально все, что еще в очереди, даже если таблица недоступна
+            await keyword_dict.flush_store()
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка синхронизации ключевых слов с Google Sheets: {e}")
+            await asyncio.sleep(interval)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# services/receipt_cache.py
+"""
+Кэш распознанных чеков.
+Результат запроса к API чеков (CheckData) хранится в SQLite с TTL под двумя ключами:
+Telegram file_unique_id (повторная отправка или пересылка того же фото — без скачивания)
+и SHA-256 содержимого изображения (тот же снимок, загруженный заново), а если QR-код
+распознан локально — еще и под фискальными реквизитами (разные фото одного чека). Одновременные
+запросы с одним ключом ждут одну общую задачу, а не вызывают API несколько раз.
+"""
+import asyncio
+import hashlib
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from config import logger, RECEIPT_CACHE_TTL
+from models.transaction import CheckData
+
+
+def file_cache_key(file_unique_id: str) -> str:
+    return f"file:{file_unique_id}"
+
+
+def content_cache_key(image_bytes: bytes) -> str:
+    return f"sha256:{hashlib.sha256(image_bytes).hexdigest()}"
+
+
+def fiscal_cache_key(fiscal_key: str) -> str:
+    return f"qr:{fiscal_key}"
+
+
+class ReceiptCache:
+    """Кэш CheckData в SQLite с дедупликацией одновременных запросов"""
+
+    def __init__(self, repository, ttl: float = RECEIPT_CACHE_TTL):
+        self.repository = repository
+        self.ttl = ttl
+        # Ключ -> задача, которая сейчас получает результат для этого ключа
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    async def get(self, key: str) -> Optional[CheckData]:
+        try:
+            check_json = await self.repository.get_cached_receipt(key, time.time() - self.ttl)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось прочитать кэш чеков: {e}")
+            return None
+        if check_json is None:
+            return None
+        try:
+            return CheckData.model_validate_json(check_json)
+        except Exception as e:
+            # Формат CheckData мог измениться — такую запись просто перезапишем
+            logger.warning(f"⚠️ Запись кэша чеков {key} не читается: {e}")
+            return None
+
+    async def put(self, key: str, check_data: CheckData):
+        try:
+            await self.repository.put_cached_receipt(key, check_data.model_dump_json(), time.time())
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить чек в кэш: {e}")
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[CheckData]]) -> CheckData:
+        """
+        Возвращает чек из кэша или вычисляет его.
+        Пока вычисление идет, остальные запросы с тем же ключом ждут его результат;
+        ошибки не кэшируются, но передаются всем ожидающим.
+        """
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            # Копия: вызывающий код может изменять CheckData (например, категорию)
+            return (await asyncio.shield(pending)).model_copy(deep=True)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            check_data = await self.get(key)
+            if check_data is not None:
+                logger.info(f"♻️ Чек взят из кэша ({key.split(':', 1)[0]})")
+            else:
+                check_data = await compute()
+                await self.put(key, check_data)
+            future.set_result(check_data)
+            return check_data
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже получил вызывающий код; ожидающих может не быть
+            future.exception()
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+
+    async def purge_expired(self) -> int:
+        """Удаляет устаревшие записи (вызывается при старте)"""
+        try:
+            return await self.repository.purge_receipt_cache(time.time() - self.ttl)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось очистить кэш чеков: {e}")
+            return 0
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# services/receipt_queue.py
+"""
+Очередь обработки чеков.
+Хендлер фото только ставит задачу в очередь и сразу возвращается; скачивание, запрос к API
+чеков и классификацию выполняют RECEIPT_WORKERS слотов, которые FairScheduler выдает
+пользователям по очереди (services/fair_scheduler.py). Пользователь получает номер задачи
+и позицию в очереди, а статусное сообщение обновляется по мере перехода задачи между этапами.
+Число одновременных запросов к API чеков дополнительно ограничено глобально
+(CHECK_API_CONCURRENCY в TransactionService).
+"""
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional, Set
+
+from config import logger, RECEIPT_QUEUE_MAXSIZE, RECEIPT_WORKERS, RECEIPT_USER_CONCURRENCY, RECEIPT_USER_QUEUE_LIMIT
+from services.fair_scheduler import FairScheduler, Ticket
+
+# Этапы обработки чека (текст для статусного сообщения)
+STAGE_QUEUED = "queued"
+STAGE_DOWNLOADING = "downloading"
+STAGE_RECOGNIZING = "recognizing"
+STAGE_CLASSIFYING = "classifying"
+STAGE_DONE = "done"
+STAGE_FAILED = "failed"
+
+STAGE_TEXT = {
+    STAGE_QUEUED: "⏳ В очереди",
+    STAGE_DOWNLOADING: "📥 Скачиваю фото",
+    STAGE_RECOGNIZING: "🧾 Распознаю чек",
+    STAGE_CLASSIFYING: "🧠 Определяю категорию",
+    STAGE_DONE: "✅ Готово",
+    STAGE_FAILED: "❌ Ошибка",
+}
+
+
+def new_job_id() -> str:
+    """Короткий номер задачи для пользователя"""
+    return uuid.uuid4().hex[:8]
+
+
+@dataclass(eq=False)
+class ReceiptJob:
+    """
+    Задача обработки одного чека.
+    run — корутина обработки (получает саму задачу, чтобы сообщать об этапах) и показа результата;
+    on_stage — уведомление об изменении этапа (обычно правка статусного сообщения).
+    """
+    user_id: int
+    run: Callable[["ReceiptJob"], Awaitable[None]]
+    on_stage: Optional[Callable[["ReceiptJob", str], Awaitable[None]]] = None
+    job_id: str = field(default_factory=new_job_id)
+    # Стоимость для справедливого планирования (альбом стоит столько, сколько в нем фото)
+    cost: int = 1
+    stage: str = STAGE_QUEUED
+    created_at: float = field(default_factory=time.monotonic)
+
+    async def set_stage(self, stage: str):
+        """Переводит задачу на новый этап и уведомляет пользователя (повтор этапа игнорируется)"""
+        if stage == self.stage:
+            return
+        self.stage = stage
+        if self.on_stage is None:
+            return
+        try:
+            await self.on_stage(self, stage)
+        except Exception as e:
+            # Ошибка обновления статуса не должна прерывать обработку чека
+            logger.warning(f"⚠️ Не удалось обновить статус задачи {self.job_id}: {e}")
+
+
+class ReceiptJobQueue:
+    """
+    Очередь задач обработки чеков со справедливым планированием по пользователям.
+    Слоты выполнения (RECEIPT_WORKERS) выдает FairScheduler: задачи разных пользователей
+    чередуются, у одного пользователя выполняется не больше RECEIPT_USER_CONCURRENCY задач,
+    а в очереди может ждать не больше RECEIPT_USER_QUEUE_LIMIT его задач.
+    """
+
+    def __init__(self, maxsize: int = RECEIPT_QUEUE_MAXSIZE, workers: int = RECEIPT_WORKERS,
+                 per_user_limit: int = RECEIPT_USER_CONCURRENCY, max_queued_per_user: int = RECEIPT_USER_QUEUE_LIMIT):
+        self.scheduler = FairScheduler(
+            "receipts", capacity=workers, per_user_limit=per_user_limit,
+            max_queued_per_user=max_queued_per_user, max_queued=maxsize
+        )
+        self._tasks: Set[asyncio.Task] = set()
+
+    def position(self, user_id: int) -> int:
+        """
+        Позиция, которую получит новая задача пользователя (1 — следующая).
+        Если задача не будет принята, выбрасывает SchedulerQueueFull (или UserQueueLimit).
+        """
+        return self.scheduler.position(user_id)
+
+    def submit(self, job: ReceiptJob) -> int:
+        """
+        Ставит задачу в очередь и возвращает ее позицию.
+        Если очередь (общая или пользователя) переполнена, выбрасывает SchedulerQueueFull.
+        """
+        position = self.scheduler.position(job.user_id)
+        ticket = self.scheduler.enqueue(job.user_id, job.cost)
+        task = asyncio.create_task(self._run(job, ticket))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        logger.info(f"📥 Чек {job.job_id} пользователя {job.user_id} поставлен в очередь (позиция {position})")
+        return position
+
+    async def _run(self, job: ReceiptJob, ticket: Ticket):
+        async with self.scheduler.hold(ticket):
+            await run_receipt_job(job)
+
+    async def join(self):
+        """Ожидает завершения всех поставленных задач"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def close(self):
+        """Отменяет ожидающие и выполняющиеся задачи (при остановке бота)"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def qsize(self) -> int:
+        return self.scheduler.queued()
+
+
+async def run_receipt_job(job: ReceiptJob):
+    """Выполняет задачу; ошибки логируются и отражаются в статусе, но не прерывают очередь"""
+    started = time.monotonic()
+    try:
+        await job.run(job)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Ошибка обработки чека {job.job_id}: {e}")
+        await job.set_stage(STAGE_FAILED)
+    else:
+        # Итоговое сообщение (результат распознавания) показывает сама задача
+        job.stage = STAGE_DONE
+    logger.info(
+        f"🧾 Чек {job.job_id} обработан за {time.monotonic() - started:.1f} сек. "
+        f"(ожидание в очереди {started - job.created_at:.1f} сек.)"
+    )
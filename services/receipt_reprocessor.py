@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# services/receipt_reprocessor.py
+"""
+Повторная обработка сохраненных чеков без обращения к API.
+Сырые ответы API чеков хранятся в SQLite (таблица raw_receipts, JSON сжат zlib) и связаны
+с транзакциями через receipt_key. После улучшения классификатора (или разбора новых полей)
+чеки пользователя разбираются и классифицируются заново локально, пакетами.
+Новые категории применяются только к транзакциям, еще не выгруженным в Google Sheets (их синхронизация
+запишет уже исправленную категорию); выгруженные строки не меняются и считаются отдельно, чтобы SQLite
+не расходилась с таблицей. Классификатор на результатах не дообучается (это его собственные
+предсказания, а не подтверждения пользователя).
+"""
+import asyncio
+import json
+import zlib
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+from config import logger, CATEGORY_STORAGE
+from services.repository import TransactionRepository
+from utils.receipt_logic import check_data_from_json
+
+# Транзакций в одном пакете повторной обработки
+REPROCESS_BATCH_SIZE = 500
+# Категория меняется, только если классификатор уверен в новой (как при распознавании чека)
+REPROCESS_MIN_CONFIDENCE = 0.7
+
+
+@dataclass
+class ReprocessReport:
+    """Итог повторной обработки"""
+    checked: int = 0
+    changed: int = 0
+    # Из changed: транзакции, уже выгруженные в Google Sheets (категория не меняется)
+    synced: int = 0
+    failed: int = 0
+    applied: bool = False
+    # (старая категория, новая категория) -> число транзакций
+    changes: Counter = field(default_factory=Counter)
+
+
+def _reclassify_batch(rows: List[Tuple[int, str, str, str, bool, bytes]], classifier,
+                      report: ReprocessReport) -> List[Tuple[int, str]]:
+    """Разбирает и классифицирует пакет чеков (CPU-работа, выполняется в потоке)"""
+    parsed = []
+    for transaction_id, transaction_type, category, receipt_key, is_synced, raw in rows:
+        try:
+            check = check_data_from_json(json.loads(zlib.decompress(raw)), record_usage=False)
+        except Exception as e:
+            report.failed += 1
+            logger.warning(f"⚠️ Не удалось разобрать сохраненный чек {receipt_key}: {e}")
+            continue
+        parsed.append((transaction_id, transaction_type, category, is_synced, check))
+
+    # Все тексты пакета классифицируются одним вызовом; старые чеки не учитываются
+    # в популярности ключевых слов (и счетчики не меняются из рабочего потока)
+    results = classifier.classify_many([
+        f"{check.comment} {check.retailer_name} {check.items_list}" for *_, check in parsed
+    ], record_usage=False)
+
+    categories = CATEGORY_STORAGE.snapshot
+    updates = []
+    for (transaction_id, transaction_type, category, is_synced, _), result in zip(parsed, results):
+        report.checked += 1
+        if result.confidence <= REPROCESS_MIN_CONFIDENCE or result.category == category:
+            continue
+        # Категории, удаленные из таблицы, не назначаются
+        if not categories.is_valid(result.category, transaction_type):
+            continue
+        report.changed += 1
+        report.changes[(category, result.category)] += 1
+        if is_synced:
+            report.synced += 1
+        else:
+            updates.append((transaction_id, result.category))
+    return updates
+
+
+async def reprocess_receipts(repository: TransactionRepository, classifier, user_id: int, apply: bool = False,
+                             batch_size: int = REPROCESS_BATCH_SIZE) -> ReprocessReport:
+    """
+    Заново разбирает и классифицирует сохраненные чеки пользователя.
+    По умолчанию только считает изменения; с apply=True обновляет категории в SQLite
+    у транзакций, еще не выгруженных в Google Sheets (выгруженные учитываются в report.synced).
+    """
+    report = ReprocessReport(applied=apply)
+    after_id = 0
+    while True:
+        rows = await repository.get_receipt_transactions(user_id, after_id, batch_size)
+        if not rows:
+            break
+        after_id = rows[-1][0]
+
+        updates = await asyncio.to_thread(_reclassify_batch, rows, classifier, report)
+        if apply and updates:
+            updated = await repository.update_transaction_categories(updates)
+            # Транзакции, выгруженные в таблицу после выборки, тоже не изменились
+            report.synced += len(updates) - updated
+
+    logger.info(
+        f"🔁 Повторная обработка чеков пользователя {user_id}: проверено {report.checked}, изменено {report.changed}, "
+        f"уже в таблице {report.synced}, ошибок {report.failed}{' (применено)' if apply else ''}"
+    )
+    return report
@@ -1,9 +1,13 @@
 import aiosqlite
-from typing import List, Optional
+import json
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
 import sqlite3
 from contextlib import asynccontextmanager
 
 from config import logger
+from utils.exceptions import DuplicateReceiptError
 
 
 class TransactionRepository:
@@ -48,6 +52,95 @@ class TransactionRepository:
             if 'type' not in column_names:
                 await db.execute("ALTER TABLE transactions ADD COLUMN type TEXT DEFAULT 'Расход'")
                 logger.info("Добавлен столбец type в таблицу transactions")
+
+            # Миграция: связь с сохраненным сырым ответом API чеков
+            if 'receipt_key' not in column_names:
+                await db.execute("ALTER TABLE transactions ADD COLUMN receipt_key TEXT")
+                logger.info("Добавлен столбец receipt_key в таблицу transactions")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_transactions_receipt_key ON transactions(receipt_key)")
+            
+            # Популярность ключевых слов (накопительные счетчики из KeywordDictionary)
+            await db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS keyword_usage (
+                    keyword TEXT PRIMARY KEY,
+                    usage_count INTEGER NOT NULL DEFAULT 0,
+                    last_used REAL
+                )
+                """
+            )
+            
+            # Словарь ключевых слов: локальная копия — источник истины, лист Keywords — зеркало
+            await db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS keywords (
+                    keyword TEXT PRIMARY KEY,
+                    category TEXT NOT NULL,
+                    confidence REAL NOT NULL,
+                    is_lemma BOOLEAN DEFAULT 0,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    is_synced BOOLEAN DEFAULT 0
+                )
+                """
+            )
+            
+            # Кэш распознанных чеков: ключ — file_unique_id или хэш содержимого изображения
+            await db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS receipt_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    check_json TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            
+            # Сырые ответы API чеков (документ чека, JSON, сжатый zlib) для повторной обработки без API
+            await db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS raw_receipts (
+                    receipt_key TEXT PRIMARY KEY,
+                    raw BLOB NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            
+            # Обработанные подтверждения (ключи идемпотентности) с TTL
+            await db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS processed_confirmations (
+                    idempotency_key TEXT PRIMARY KEY,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            
+            # Записанные чеки: по одной строке на фискальные реквизиты (первичный ключ — уникальный индекс).
+            # Сплит чека дает несколько транзакций, но одну запись здесь
+            cursor = await db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'recorded_receipts'")
+            recorded_exists = await cursor.fetchone() is not None
+            await db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS recorded_receipts (
+                    receipt_key TEXT PRIMARY KEY,
+                    user_id INTEGER,
+                    username TEXT,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            if not recorded_exists:
+                # Миграция: чеки, записанные до появления таблицы
+                await db.execute(
+                    """
+                    INSERT OR IGNORE INTO recorded_receipts (receipt_key, user_id, username, created_at)
+                    SELECT receipt_key, user_id, username, CAST(strftime('%s', MIN(created_at)) AS REAL)
+                    FROM transactions
+                    WHERE receipt_key IS NOT NULL
+                    GROUP BY receipt_key
+                    """
+                )
             
             await db.commit()
 
@@ -57,20 +150,77 @@ class TransactionRepository:
         async with aiosqlite.connect(self.db_path) as db:
             yield db
 
-    async def add_transaction(self, user_id: int, username: str, amount: float, category: str, transaction_type: str, comment: Optional[str] = None) -> int:
-        """Add a new transaction and return its ID."""
+    async def add_transaction(self, user_id: int, username: str, amount: float, category: str, transaction_type: str,
+                              comment: Optional[str] = None, receipt_key: Optional[str] = None) -> int:
+        """
+        Add a new transaction and return its ID.
+        A transaction with a receipt_key records the receipt in the same commit;
+        raises DuplicateReceiptError if that receipt is already recorded.
+        """
         async with self._get_connection() as db:
+            if receipt_key:
+                await self._record_receipts(db, [receipt_key], user_id, username)
             cursor = await db.execute(
                 """
-                INSERT INTO transactions (user_id, username, amount, category, type, comment)
-                VALUES (?, ?, ?, ?, ?, ?)
+                INSERT INTO transactions (user_id, username, amount, category, type, comment, receipt_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
                 """,
-                (user_id, username, amount, category, transaction_type, comment)
+                (user_id, username, amount, category, transaction_type, comment, receipt_key)
             )
             transaction_id = cursor.lastrowid
             await db.commit()
             return transaction_id
 
+    async def add_transactions(self, rows: List[Tuple[int, str, float, str, str, Optional[str], Optional[str]]]) -> List[int]:
+        """
+        Add several transactions (user_id, username, amount, category, type, comment, receipt_key) in one commit
+        and return their IDs. Rows sharing a receipt_key (a split receipt) record it once;
+        raises DuplicateReceiptError and saves nothing if any receipt is already recorded.
+        """
+        ids = []
+        async with self._get_connection() as db:
+            receipt_keys = list(dict.fromkeys(row[6] for row in rows if row[6]))
+            if receipt_keys:
+                await self._record_receipts(db, receipt_keys, rows[0][0], rows[0][1])
+            for row in rows:
+                cursor = await db.execute(
+                    """
+                    INSERT INTO transactions (user_id, username, amount, category, type, comment, receipt_key)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    row
+                )
+                ids.append(cursor.lastrowid)
+            await db.commit()
+        return ids
+
+    async def _record_receipts(self, db, receipt_keys: List[str], user_id: int, username: Optional[str]) -> None:
+        """Record receipts inside the caller's transaction; rolls back and raises DuplicateReceiptError on conflict."""
+        now = time.time()
+        for receipt_key in receipt_keys:
+            try:
+                await db.execute(
+                    "INSERT INTO recorded_receipts (receipt_key, user_id, username, created_at) VALUES (?, ?, ?, ?)",
+                    (receipt_key, user_id, username, now)
+                )
+            except sqlite3.IntegrityError:
+                await db.rollback()
+                recorded = await self._fetch_recorded_receipt(db, receipt_key)
+                raise DuplicateReceiptError(receipt_key, recorded.get('username'), recorded.get('created_at'))
+
+    async def _fetch_recorded_receipt(self, db, receipt_key: str) -> dict:
+        cursor = await db.execute(
+            "SELECT user_id, username, created_at FROM recorded_receipts WHERE receipt_key = ?",
+            (receipt_key,)
+        )
+        row = await cursor.fetchone()
+        return {'user_id': row[0], 'username': row[1], 'created_at': row[2]} if row else {}
+
+    async def get_recorded_receipt(self, receipt_key: str) -> Optional[dict]:
+        """Get who and when recorded a receipt (primary key lookup), or None if it is not recorded."""
+        async with self._get_connection() as db:
+            return await self._fetch_recorded_receipt(db, receipt_key) or None
+
     async def get_unsynced(self) -> List[dict]:
         """Get all unsynced transactions."""
         async with self._get_connection() as db:
@@ -103,8 +253,21 @@ class TransactionRepository:
             return cursor.rowcount > 0
 
     async def delete_transaction_by_details(self, user_id: str, date: str, time: str, amount: float) -> bool:
-        """Delete a transaction by user_id, date, time, and amount."""
+        """
+        Delete a transaction by user_id, date, time, and amount.
+        Receipts left without transactions are released and can be recorded again.
+        """
         async with self._get_connection() as db:
+            params = (int(user_id), amount, f"{date}%")
+            cursor = await db.execute(
+                """
+                SELECT DISTINCT receipt_key FROM transactions
+                WHERE user_id = ? AND amount = ? AND created_at LIKE ? AND receipt_key IS NOT NULL
+                """,
+                params
+            )
+            receipt_keys = [row[0] for row in await cursor.fetchall()]
+
             # Формат даты в SQLite может отличаться от формата в приложении,
             # поэтому ищем по user_id и amount, и дополнительно проверяем дату
             cursor = await db.execute(
@@ -112,12 +275,223 @@ class TransactionRepository:
                 DELETE FROM transactions
                 WHERE user_id = ? AND amount = ? AND created_at LIKE ?
                 """,
-                (int(user_id), amount, f"{date}%")
+                params
+            )
+            deleted = cursor.rowcount
+            await db.executemany(
+                """
+                DELETE FROM recorded_receipts
+                WHERE receipt_key = ? AND NOT EXISTS (SELECT 1 FROM transactions WHERE receipt_key = ?)
+                """,
+                [(receipt_key, receipt_key) for receipt_key in receipt_keys]
             )
             await db.commit()
             
             # Check if any row was actually deleted
-            return cursor.rowcount > 0
+            return deleted > 0
+
+    async def upsert_keywords(self, rows: List[Tuple[str, str, float, bool, bool]]) -> None:
+        """
+        Insert or update keywords: (keyword, category, confidence, is_lemma, is_synced).
+        An update never marks a keyword as synced: a keyword still waiting to be mirrored
+        to Google Sheets stays unsynced until mark_keywords_synced.
+        """
+        if not rows:
+            return
+        async with self._get_connection() as db:
+            await db.executemany(
+                """
+                INSERT INTO keywords (keyword, category, confidence, is_lemma, is_synced)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(keyword) DO UPDATE SET
+                    category = excluded.category,
+                    confidence = excluded.confidence,
+                    is_lemma = excluded.is_lemma,
+                    is_synced = MIN(keywords.is_synced, excluded.is_synced),
+                    updated_at = CURRENT_TIMESTAMP
+                """,
+                rows
+            )
+            await db.commit()
+
+    async def get_keywords(self) -> List[Tuple[str, str, float, bool]]:
+        """Get all keywords: (keyword, category, confidence, is_lemma)."""
+        async with self._get_connection() as db:
+            cursor = await db.execute("SELECT keyword, category, confidence, is_lemma FROM keywords")
+            return [(keyword, category, confidence, bool(is_lemma)) for keyword, category, confidence, is_lemma in await cursor.fetchall()]
+
+    async def get_unsynced_keywords(self) -> List[Tuple[str, str, float]]:
+        """Get keywords not yet mirrored to Google Sheets: (keyword, category, confidence)."""
+        async with self._get_connection() as db:
+            cursor = await db.execute(
+                "SELECT keyword, category, confidence FROM keywords WHERE is_synced = 0 ORDER BY updated_at"
+            )
+            return [tuple(row) for row in await cursor.fetchall()]
+
+    async def mark_keywords_synced(self, rows: List[Tuple[str, str, float]]) -> None:
+        """
+        Mark keywords as mirrored to Google Sheets.
+        A row is marked only if it was not changed again after being read: (keyword, category, confidence).
+        """
+        if not rows:
+            return
+        async with self._get_connection() as db:
+            await db.executemany(
+                "UPDATE keywords SET is_synced = 1 WHERE keyword = ? AND category = ? AND confidence = ?",
+                rows
+            )
+            await db.commit()
+
+    async def add_keyword_usage(self, rows: List[Tuple[str, int, float]]) -> None:
+        """Bulk-add keyword usage deltas: (keyword, delta, last_used unix time)."""
+        if not rows:
+            return
+        async with self._get_connection() as db:
+            await db.executemany(
+                """
+                INSERT INTO keyword_usage (keyword, usage_count, last_used)
+                VALUES (?, ?, ?)
+                ON CONFLICT(keyword) DO UPDATE SET
+                    usage_count = usage_count + excluded.usage_count,
+                    last_used = MAX(COALESCE(last_used, 0), excluded.last_used)
+                """,
+                rows
+            )
+            await db.commit()
+
+    async def get_keyword_usage(self) -> Dict[str, Tuple[int, float]]:
+        """Get persisted keyword usage: keyword -> (usage_count, last_used unix time)."""
+        async with self._get_connection() as db:
+            cursor = await db.execute("SELECT keyword, usage_count, last_used FROM keyword_usage")
+            rows = await cursor.fetchall()
+            return {keyword: (count, last_used or 0.0) for keyword, count, last_used in rows}
+
+    async def get_cached_receipt(self, cache_key: str, min_created_at: float) -> Optional[str]:
+        """Get a cached receipt (CheckData JSON) stored not earlier than min_created_at."""
+        async with self._get_connection() as db:
+            cursor = await db.execute(
+                "SELECT check_json FROM receipt_cache WHERE cache_key = ? AND created_at >= ?",
+                (cache_key, min_created_at)
+            )
+            row = await cursor.fetchone()
+            return row[0] if row else None
+
+    async def put_cached_receipt(self, cache_key: str, check_json: str, created_at: float) -> None:
+        """Insert or replace a cached receipt (CheckData JSON)."""
+        async with self._get_connection() as db:
+            await db.execute(
+                """
+                INSERT INTO receipt_cache (cache_key, check_json, created_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT(cache_key) DO UPDATE SET
+                    check_json = excluded.check_json,
+                    created_at = excluded.created_at
+                """,
+                (cache_key, check_json, created_at)
+            )
+            await db.commit()
+
+    async def purge_receipt_cache(self, older_than: float) -> int:
+        """Delete cached receipts created before older_than; returns the number of deleted rows."""
+        async with self._get_connection() as db:
+            cursor = await db.execute("DELETE FROM receipt_cache WHERE created_at < ?", (older_than,))
+            await db.commit()
+            return cursor.rowcount
+
+    async def claim_idempotency_keys(self, keys: List[str], created_at: float, older_than: float) -> bool:
+        """
+        Atomically claim idempotency keys. Returns False and claims nothing if any key
+        was claimed at or after older_than; expired claims are taken over.
+        """
+        async with self._get_connection() as db:
+            for key in keys:
+                cursor = await db.execute(
+                    """
+                    INSERT INTO processed_confirmations (idempotency_key, created_at)
+                    VALUES (?, ?)
+                    ON CONFLICT(idempotency_key) DO UPDATE SET created_at = excluded.created_at
+                    WHERE processed_confirmations.created_at < ?
+                    """,
+                    (key, created_at, older_than)
+                )
+                if cursor.rowcount == 0:
+                    await db.rollback()
+                    return False
+            await db.commit()
+            return True
+
+    async def release_idempotency_keys(self, keys: List[str]) -> None:
+        """Release claimed idempotency keys so the operation can be retried."""
+        async with self._get_connection() as db:
+            await db.executemany(
+                "DELETE FROM processed_confirmations WHERE idempotency_key = ?",
+                [(key,) for key in keys]
+            )
+            await db.commit()
+
+    async def purge_idempotency_keys(self, older_than: float) -> int:
+        """Delete idempotency keys claimed before older_than; returns the number of deleted rows."""
+        async with self._get_connection() as db:
+            cursor = await db.execute("DELETE FROM processed_confirmations WHERE created_at < ?", (older_than,))
+            await db.commit()
+            return cursor.rowcount
+
+    async def put_raw_receipt(self, receipt_key: str, check_json: dict) -> None:
+        """Store a raw check API document (zlib-compressed JSON); an existing document is kept."""
+        raw = zlib.compress(json.dumps(check_json, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        async with self._get_connection() as db:
+            await db.execute(
+                "INSERT OR IGNORE INTO raw_receipts (receipt_key, raw, created_at) VALUES (?, ?, ?)",
+                (receipt_key, raw, time.time())
+            )
+            await db.commit()
+
+    async def get_raw_receipt(self, receipt_key: str) -> Optional[dict]:
+        """Get a stored raw check API document."""
+        async with self._get_connection() as db:
+            cursor = await db.execute("SELECT raw FROM raw_receipts WHERE receipt_key = ?", (receipt_key,))
+            row = await cursor.fetchone()
+            return json.loads(zlib.decompress(row[0])) if row else None
+
+    async def get_receipt_transactions(
+        self, user_id: int, after_id: int = 0, limit: int = 500
+    ) -> List[Tuple[int, str, str, str, bool, bytes]]:
+        """
+        Get a user's transactions created from stored receipts, ordered by ID, as
+        (id, type, category, receipt_key, is_synced, compressed raw document) tuples.
+        Receipts split into several transactions are skipped: their categories were chosen per item group.
+        """
+        async with self._get_connection() as db:
+            cursor = await db.execute(
+                """
+                SELECT t.id, t.type, t.category, t.receipt_key, t.is_synced, r.raw
+                FROM transactions t
+                JOIN raw_receipts r ON r.receipt_key = t.receipt_key
+                WHERE t.user_id = ? AND t.id > ?
+                  AND NOT EXISTS (
+                      SELECT 1 FROM transactions other
+                      WHERE other.receipt_key = t.receipt_key AND other.id != t.id
+                  )
+                ORDER BY t.id
+                LIMIT ?
+                """,
+                (user_id, after_id, limit)
+            )
+            return await cursor.fetchall()
+
+    async def update_transaction_categories(self, rows: List[Tuple[int, str]]) -> int:
+        """
+        Set categories for (transaction_id, category) pairs in one commit.
+        Only transactions not yet synced to Google Sheets are changed, so SQLite never
+        diverges from the sheet; returns the number of updated transactions.
+        """
+        async with self._get_connection() as db:
+            cursor = await db.executemany(
+                "UPDATE transactions SET category = ? WHERE id = ? AND is_synced = 0",
+                [(category, transaction_id) for transaction_id, category in rows]
+            )
+            await db.commit()
+            return cursor.rowcount
 
     async def close(self):
         """Close the database connection if it was opened."""
@@ -0,0 +1,43 @@
+import asyncio
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+async def start_training_worker(classifier, queue: asyncio.Queue):
+    """
+    Фоновое обучение классификатора на сохраненных транзакциях.
+    Забирает из очереди все накопившиеся транзакции и обучает модель одним пакетом вне event loop;
+    новая версия модели публикуется атомарной подменой ссылки внутри classifier.train().
+    """
+    logger.info("Training worker started.")
+    try:
+        while True:
+            await _train_next_batch(classifier, queue)
+    except asyncio.CancelledError:
+        # Модель сохраняется не после каждого обучения — сохраняем последнюю версию при остановке
+        try:
+            classifier.flush_model()
+        except Exception as e:
+            logger.error(f"Не удалось сохранить модель классификатора при остановке: {e}")
+        raise
+
+
+async def _train_next_batch(classifier, queue: asyncio.Queue):
+    """Обучает классификатор на очередном пакете транзакций из очереди"""
+    batch = [await queue.get()]
+    # Забираем все, что успело накопиться, чтобы строить одну версию модели на пакет
+    while not queue.empty():
+        batch.append(queue.get_nowait())
+
+    try:
+        await classifier.train_async(batch)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        # Ошибки обучения логируются, но не крашат бота
+        logger.error(f"Training worker error on batch of {len(batch)} transactions: {e}")
+    finally:
+        for _ in batch:
+            queue.task_done()
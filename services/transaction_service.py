@@ -2,16 +2,25 @@
 # services/transaction_service.py
 import asyncio
 import traceback
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple, Awaitable, Callable
 from datetime import datetime
 
+import aiohttp
+
 from models.transaction import TransactionData, CheckData
 from sheets.client import write_transaction, add_keywords_to_sheet, load_categories_from_sheet
-from utils.exceptions import SheetWriteError, CheckApiTimeout, CheckApiRecognitionError, TransactionSaveError
-from utils.receipt_logic import parse_check_from_api, extract_learnable_keywords
-from utils.category_classifier import classifier
+from utils.exceptions import SheetWriteError, CheckApiTimeout, CheckApiRecognitionError, TransactionSaveError, DuplicateReceiptError
+from utils.receipt_logic import check_data_from_json, extract_learnable_keywords, fetch_check_json
+from utils.category_classifier import get_classifier, ClassificationResult, TransactionCategoryClassifier
+from services.http_client import download_bytes
+from services.receipt_cache import ReceiptCache, content_cache_key, file_cache_key, fiscal_cache_key
+from utils.qr_decoder import decode_qr_async, fiscal_receipt_key, parse_fiscal_qr
+from utils.image_preprocessing import preprocess_image_async
+
+from config import logger, CATEGORY_STORAGE, CHECK_API_CONCURRENCY
 
-from config import logger
+# Минимальная уверенность классификации позиции, чтобы выделить ее в отдельную группу сплита
+ITEM_SPLIT_CONFIDENCE = 0.6
 
 
 class TransactionService:
@@ -20,53 +29,144 @@ class TransactionService:
     Объединяет логику валидации, DTO, и записи транзакций.
     """
     
-    def __init__(self, repository=None):
-        self.classifier = classifier
+    def __init__(
+        self,
+        repository=None,
+        training_queue: Optional[asyncio.Queue] = None,
+        classifier: Optional[TransactionCategoryClassifier] = None,
+        http_session: Optional[aiohttp.ClientSession] = None,
+        receipt_cache: Optional[ReceiptCache] = None,
+        check_api_limit: Optional[asyncio.Semaphore] = None
+    ):
+        # Классификатор можно внедрить явно; иначе общий экземпляр создается при первом обращении
+        self._classifier = classifier
         self.repository = repository
+        # Очередь фонового обучения классификатора (см. services/training_worker.py)
+        self.training_queue = training_queue
+        # Общий HTTP-сеанс с пулом соединений (см. services/http_client.py)
+        self.http_session = http_session
+        # Кэш распознанных чеков (см. services/receipt_cache.py)
+        self.receipt_cache = receipt_cache
+        # Глобальный лимит одновременных запросов к API чеков (общий для всех воркеров очереди)
+        self.check_api_limit = check_api_limit or asyncio.Semaphore(CHECK_API_CONCURRENCY)
+
+    @property
+    def classifier(self) -> TransactionCategoryClassifier:
+        if self._classifier is None:
+            self._classifier = get_classifier()
+        return self._classifier
+
+    async def download_file(self, url: str) -> bytes:
+        """
+        Скачивает файл (фото чека) через общий HTTP-сеанс.
+        """
+        return await download_bytes(url, self.http_session)
 
-    async def create_transaction_from_check(self, image_bytes: bytes) -> Optional[CheckData]:
+    async def create_transaction_from_check(self, image_bytes: Optional[bytes], qrraw: Optional[str] = None) -> Optional[CheckData]:
         """
-        Создает транзакцию из изображения чека.
+        Создает транзакцию из изображения чека (или из строки его QR-кода, если она уже известна).
         """
         try:
-            parsed_data: CheckData = await parse_check_from_api(image_bytes)
+            async with self.check_api_limit:
+                check_json = await fetch_check_json(image_bytes, session=self.http_session, qrraw=qrraw)
+            parsed_data: CheckData = check_data_from_json(check_json)
         except (CheckApiTimeout, CheckApiRecognitionError) as e:
             raise e
 
+        await self._store_raw_receipt(parsed_data.receipt_key, check_json)
+
         if parsed_data.amount <= 0:
             raise ValueError("Чек распознан, но сумма равна нулю или отрицательна")
 
         return parsed_data
 
-    async def process_check_data(self, check_data: CheckData, user_username: str, user_id: int) -> TransactionData:
+    async def _store_raw_receipt(self, receipt_key: Optional[str], check_json: dict):
         """
-        Обрабатывает данные чека, применяется классификацию и возвращает TransactionData.
+        Сохраняет сырой ответ API чеков (для повторной обработки без API).
+        Ошибка сохранения не мешает распознаванию.
         """
-        # Создаем временную транзакцию для классификации
-        temp_transaction = TransactionData(
-            type=check_data.type,
-            category=check_data.category,
-            amount=check_data.amount,
-            comment=check_data.comment,
-            username=user_username,
-            user_id=user_id,
-            retailer_name=check_data.retailer_name,
-            items_list=check_data.items_list,
-            payment_info=check_data.payment_info,
-            transaction_dt=check_data.transaction_datetime
-        )
+        if self.repository is None or not receipt_key:
+            return
+        try:
+            await self.repository.put_raw_receipt(receipt_key, check_json)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить сырой ответ API чека {receipt_key}: {e}")
+
+    async def ensure_receipt_not_recorded(self, receipt_key: Optional[str]):
+        """
+        Проверяет по фискальным реквизитам, что чек еще не записан (поиск по первичному ключу).
+        Выбрасывает DuplicateReceiptError, чтобы пользователь сразу получил ответ «уже записан».
+        """
+        if self.repository is None or not receipt_key:
+            return
+        recorded = await self.repository.get_recorded_receipt(receipt_key)
+        if recorded:
+            raise DuplicateReceiptError(receipt_key, recorded['username'], recorded['created_at'])
 
-        # Применяем улучшенную классификацию
-        keyword_result = self.classifier.get_category_by_keyword(f"{check_data.retailer_name} {check_data.items_list}")
-        if keyword_result and keyword_result[1] > 0.7:  # Если уверенность выше 0.7
-            predicted_category, confidence = keyword_result
+    async def recognize_receipt(self, file_unique_id: str, fetch_image: Callable[[], Awaitable[bytes]]) -> CheckData:
+        """
+        Распознает чек с учетом кэша.
+        Повтор того же файла Telegram (file_unique_id) не скачивает изображение и не вызывает API;
+        совпадение по хэшу содержимого экономит вызов API. Одновременные запросы одного чека
+        выполняются один раз. Уже записанный чек отклоняется с DuplicateReceiptError.
+        """
+        if self.receipt_cache is None:
+            check_data = await self.recognize_image(await fetch_image())
         else:
-            # Если новая система не дала результата или уверенность низкая, используем ML-классификатор
-            predicted_category, confidence = self.classifier.predict_category(temp_transaction)
+            async def recognize_downloaded() -> CheckData:
+                image_bytes = await fetch_image()
+                return await self.receipt_cache.get_or_compute(
+                    content_cache_key(image_bytes),
+                    lambda: self.recognize_image(image_bytes)
+                )
+
+            check_data = await self.receipt_cache.get_or_compute(file_cache_key(file_unique_id), recognize_downloaded)
+
+        await self.ensure_receipt_not_recorded(check_data.receipt_key)
+        return check_data
+
+    async def recognize_image(self, image_bytes: bytes) -> CheckData:
+        """
+        Распознает чек по изображению.
+        Сначала QR-код декодируется локально: в API уходит короткая строка qrraw, а фискальные
+        реквизиты служат ключом кэша (разные фото одного чека). Изображение загружается в API,
+        только если QR-код распознать не удалось.
+        """
+        qrraw = await decode_qr_async(image_bytes)
+        fields = parse_fiscal_qr(qrraw) if qrraw else None
+        if not fields:
+            # Загружаем уменьшенное и сжатое изображение (подготовка в пуле процессов)
+            prepared = await preprocess_image_async(image_bytes)
+            return await self.create_transaction_from_check(prepared.data)
+
+        # Записанный чек распознается по реквизитам из QR-кода еще до обращения к API
+        receipt_key = fiscal_receipt_key(fields)
+        await self.ensure_receipt_not_recorded(receipt_key)
+
+        logger.info("🔳 QR-код распознан локально, отправляем qrraw вместо изображения")
+        if self.receipt_cache is None:
+            return await self.create_transaction_from_check(None, qrraw=qrraw)
+        return await self.receipt_cache.get_or_compute(
+            fiscal_cache_key(receipt_key),
+            lambda: self.create_transaction_from_check(None, qrraw=qrraw)
+        )
+
+    async def process_check_data(
+        self, check_data: CheckData, user_username: str, user_id: int
+    ) -> Tuple[TransactionData, ClassificationResult]:
+        """
+        Обрабатывает данные чека, применяет классификацию и возвращает TransactionData
+        вместе с итогом классификации (категория и уверенность), чтобы вызывающему коду
+        не требовалось повторно запускать предсказание.
+        """
+        # Текст анализируется один раз: словарь ключевых слов и ML работают с одним AnalyzedText
+        result = self.classifier.classify(
+            f"{check_data.comment} {check_data.retailer_name} {check_data.items_list}"
+        )
 
         # Обновляем категорию на основе предсказания улучшенного классификатора
-        if confidence > 0.7:
-            check_data.category = predicted_category
+        if result.confidence > 0.7:
+            check_data.category = result.category
 
         # Формируем финальную транзакцию
         transaction = TransactionData(
@@ -79,54 +179,132 @@ class TransactionService:
             retailer_name=check_data.retailer_name,
             items_list=check_data.items_list,
             payment_info=check_data.payment_info,
-            transaction_dt=check_data.transaction_datetime
+            transaction_dt=check_data.transaction_datetime,
+            receipt_key=check_data.receipt_key
         )
 
-        return transaction
+        return transaction, result
+
+    def propose_split(self, check_data: CheckData, default_category: str) -> List[Dict[str, Any]]:
+        """
+        Предлагает разделение чека по категориям позиций.
+        Все позиции классифицируются одним пакетным вызовом; позиции с низкой уверенностью
+        или с категорией не из списка расходов относятся к категории всего чека.
+        Возвращает группы (category, amount, items_str) или пустой список, если группа одна.
+        Это только предложение: статистика ключевых слов не меняется, поэтому метод можно
+        вызывать из рабочего потока (asyncio.to_thread).
+        """
+        items = check_data.items
+        if len(items) < 2:
+            return []
+
+        allowed_categories = CATEGORY_STORAGE.snapshot.expense_set
+        results = self.classifier.classify_many([item.name for item in items], record_usage=False)
+
+        groups: Dict[str, Dict[str, Any]] = {}
+        for item, result in zip(items, results):
+            category = result.category
+            if result.confidence < ITEM_SPLIT_CONFIDENCE or category not in allowed_categories:
+                category = default_category
+            group = groups.setdefault(category, {'category': category, 'amount': 0.0, 'names': []})
+            group['amount'] += item.sum
+            group['names'].append(item.name)
+
+        if len(groups) < 2:
+            return []
+
+        return [
+            {'category': group['category'], 'amount': round(group['amount'], 2), 'items_str': " | ".join(group['names'])}
+            for group in sorted(groups.values(), key=lambda g: g['amount'], reverse=True)
+        ]
+
+    def _validate_for_save(self, transaction: TransactionData):
+        """
+        Проверяет транзакцию перед записью в SQLite (выбрасывает SheetWriteError).
+        """
+        # Валидируем данные перед сохранением
+        if not isinstance(transaction.amount, (int, float)) or transaction.amount is None:
+            raise SheetWriteError(f"Неверное значение суммы транзакции: {transaction.amount}")
+        
+        if not isinstance(transaction.category, str) or transaction.category is None:
+            raise SheetWriteError(f"Неверное значение категории транзакции: {transaction.category}")
+        
+        if transaction.user_id is None:
+             logger.error("user_id is missing in transaction data.")
+             raise SheetWriteError("Критическая ошибка: ID пользователя отсутствует в данных транзакции.")
 
     async def save_transaction(self, transaction: TransactionData) -> bool:
         """
-        Сохраняет транзакцию в SQLite (First Write pattern) и обучает классификатор.
+        Сохраняет транзакцию в SQLite (First Write pattern) и ставит ее в очередь обучения классификатора.
+        Возвращает управление, как только запись надежно сохранена.
         """
         try:
-            # Обучаем классификатор на новой транзакции перед записью
-            self.classifier.train([transaction])
-
             # Проверяем, что репозиторий доступен
             if self.repository is None:
                 raise Exception("Repository not initialized for TransactionService")
             
-            # Валидируем данные перед сохранением
-            if not isinstance(transaction.amount, (int, float)) or transaction.amount is None:
-                raise SheetWriteError(f"Неверное значение суммы транзакции: {transaction.amount}")
-            
-            if not isinstance(transaction.category, str) or transaction.category is None:
-                raise SheetWriteError(f"Неверное значение категории транзакции: {transaction.category}")
-            
-            # Извлекаем user_id и username
-            user_id = transaction.user_id
-            if user_id is None:
-                 logger.error("user_id is missing in transaction data.")
-                 raise SheetWriteError("Критическая ошибка: ID пользователя отсутствует в данных транзакции.")
-
-            username = transaction.username # Используем username из объекта транзакции
+            self._validate_for_save(transaction)
             
             # Записываем транзакцию в SQLite синхронно (First Write pattern)
             await self.repository.add_transaction(
-                user_id=user_id,
-                username=username,
+                user_id=transaction.user_id,
+                username=transaction.username,
                 amount=transaction.amount,
                 category=transaction.category,
                 transaction_type=transaction.type,
-                comment=transaction.comment
+                comment=transaction.comment,
+                receipt_key=transaction.receipt_key
             )
-            
-            return True
+        except DuplicateReceiptError:
+            raise
         except Exception as e:
             logger.error(f"Ошибка при записи транзакции в SQLite: {e}")
             logger.debug(f"Стек вызова: {traceback.format_exc()}")
             raise SheetWriteError(f"Ошибка при записи транзакции в SQLite: {e}")
 
+        await self._schedule_training(transaction)
+        return True
+
+    async def save_transactions(self, transactions: List[TransactionData]) -> bool:
+        """
+        Сохраняет несколько транзакций (например, чеки альбома) одной записью в SQLite:
+        либо записываются все, либо ни одной.
+        """
+        try:
+            if self.repository is None:
+                raise Exception("Repository not initialized for TransactionService")
+
+            for transaction in transactions:
+                self._validate_for_save(transaction)
+
+            await self.repository.add_transactions([
+                (t.user_id, t.username, t.amount, t.category, t.type, t.comment, t.receipt_key) for t in transactions
+            ])
+        except DuplicateReceiptError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка при пакетной записи {len(transactions)} транзакций в SQLite: {e}")
+            logger.debug(f"Стек вызова: {traceback.format_exc()}")
+            raise SheetWriteError(f"Ошибка при записи транзакций в SQLite: {e}")
+
+        for transaction in transactions:
+            await self._schedule_training(transaction)
+        return True
+
+    async def _schedule_training(self, transaction: TransactionData):
+        """
+        Передает сохраненную транзакцию на обучение классификатора.
+        Ошибки обучения не влияют на результат сохранения.
+        """
+        try:
+            if self.training_queue is not None:
+                self.training_queue.put_nowait(transaction)
+            else:
+                # Без фонового воркера обучаем в отдельном потоке, не блокируя event loop
+                await self.classifier.train_async([transaction])
+        except Exception as e:
+            logger.error(f"Не удалось обучить классификатор на транзакции: {e}")
+
     async def add_keywords_for_transaction(self, category: str, retailer_name: str, items_list: str) -> bool:
         """
         Добавляет ключевые слова для транзакции в Google Sheets.
@@ -142,6 +320,8 @@ class TransactionService:
         # Сохраняем транзакцию (может выбросить SheetWriteError)
         try:
             await self.save_transaction(transaction)
+        except DuplicateReceiptError:
+            raise
         except SheetWriteError as e:
              raise TransactionSaveError(f"Ошибка записи в таблицу: {e}") from e
         except Exception as e:
@@ -162,6 +342,29 @@ class TransactionService:
         }
         return result
 
+    async def finalize_transactions(self, transactions: List[TransactionData]) -> Dict[str, Any]:
+        """
+        Финализирует пакет транзакций одной записью. При ошибке выбрасывает TransactionSaveError.
+        """
+        try:
+            await self.save_transactions(transactions)
+        except DuplicateReceiptError:
+            raise
+        except SheetWriteError as e:
+             raise TransactionSaveError(f"Ошибка записи в таблицу: {e}") from e
+        except Exception as e:
+             raise TransactionSaveError(f"Неизвестная ошибка сохранения: {e}") from e
+
+        total = sum(t.amount for t in transactions)
+        return {
+            'success': True,
+            'count': len(transactions),
+            'summary': (
+                f"✅ **Записано чеков: {len(transactions)}**\n\n"
+                f"Общая сумма: **{total:.2f}** руб."
+            )
+        }
+
     async def load_categories(self) -> bool:
         """
         Загружает категории из Google Sheets.
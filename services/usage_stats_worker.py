@@ -0,0 +1,50 @@
+import asyncio
+import logging
+
+from .repository import TransactionRepository
+
+
+logger = logging.getLogger(__name__)
+
+USAGE_FLUSH_INTERVAL = 60  # Период сброса статистики ключевых слов в SQLite (секунды)
+
+
+async def flush_keyword_usage(keyword_dict, repository: TransactionRepository) -> int:
+    """Сбрасывает накопленную статистику пачкой; при ошибке изменения возвращаются в очередь"""
+    rows = keyword_dict.drain_usage()
+    if not rows:
+        return 0
+    try:
+        await repository.add_keyword_usage(rows)
+    except Exception:
+        keyword_dict.usage.restore(rows)
+        raise
+    return len(rows)
+
+
+async def start_usage_stats_worker(keyword_dict, repository: TransactionRepository, interval: float = USAGE_FLUSH_INTERVAL):
+    """
+    Фоновый воркер статистики ключевых слов.
+    При старте подгружает сохраненную популярность, затем периодически сбрасывает изменения в SQLite.
+    """
+    logger.info("Usage stats worker started.")
+    try:
+        keyword_dict.usage.load(await repository.get_keyword_usage())
+    except Exception as e:
+        logger.error(f"Не удалось загрузить статистику ключевых слов: {e}")
+
+    while True:
+        try:
+            await asyncio.sleep(interval)
+            flushed = await flush_keyword_usage(keyword_dict, repository)
+            if flushed:
+                logger.debug(f"Сохранена статистика для {flushed} ключевых слов")
+        except asyncio.CancelledError:
+            # Последний сброс при остановке бота
+            try:
+                await flush_keyword_usage(keyword_dict, repository)
+            except Exception as e:
+                logger.error(f"Не удалось сохранить статистику ключевых слов при остановке: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка сохранения статистики ключевых слов: {e}")
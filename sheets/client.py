@@ -249,16 +249,22 @@ async def get_sheet_data_with_cache(sheet_name: str) -> List:
     return data
 
 
+# Состояние (версия ключевых слов реестра, словарь, версия словаря) после последнего переноса
+# ключевых слов листа категорий в KeywordDictionary
+_dictionary_keywords_state: tuple = ()
+
+
 async def load_categories_from_sheet() -> bool:
     """Загружает списки категорий и ключевые слова в CATEGORY_STORAGE."""
+    global _dictionary_keywords_state
     try:
         # Получаем данные с использованием кэширования
         all_values = await get_sheet_data_with_cache(CATEGORIES_SHEET_NAME)
 
-        # Очищаем хранилище перед обновлением
-        CATEGORY_STORAGE.expense.clear()
-        CATEGORY_STORAGE.income.clear()
-        CATEGORY_STORAGE.keywords.clear()
+        # Собираем новый снимок реестра; читатели видят старый до момента публикации
+        expense: List[str] = []
+        income: List[str] = []
+        keywords: Dict[str, List[str]] = {}
 
         for row in all_values[1:]: # Пропускаем заголовок
             expense_cat = row[0].strip() if len(row) > 0 else ''
@@ -266,36 +272,42 @@ async def load_categories_from_sheet() -> bool:
             income_cat = row[2].strip() if len(row) > 2 else ''
             
             if expense_cat:
-                CATEGORY_STORAGE.expense.append(expense_cat)
+                expense.append(expense_cat)
                 
                 if keywords_str:
                     keywords_list = [k.strip().lower() for k in keywords_str.split(',') if k.strip()]
                     if keywords_list:
-                        CATEGORY_STORAGE.keywords[expense_cat] = keywords_list
+                        keywords[expense_cat] = keywords_list
                         
             if income_cat:
-                CATEGORY_STORAGE.income.append(income_cat)
+                income.append(income_cat)
         
-        CATEGORY_STORAGE.last_loaded = datetime.now()
+        CATEGORY_STORAGE.publish(expense, income, keywords, loaded_at=datetime.now())
         
         logger.info(f"✅ Категории загружены. Расход: {len(CATEGORY_STORAGE.expense)}, Доход: {len(CATEGORY_STORAGE.income)}. Ключевых слов: {len(CATEGORY_STORAGE.keywords)}")
         
         # Обновляем KeywordDictionary после загрузки категорий
         try:
             # Импортируем classifier внутри функции, чтобы избежать циклического импорта
-            from utils.category_classifier import classifier
+            from utils.category_classifier import bootstrap_classifier
+            from utils.keyword_matcher import refresh_keyword_matcher
             # Асинхронная инициализация classifier и его KeywordDictionary
-            await classifier.load()
-            # Обновляем словарь ключевых слов в KeywordDictionary
-            for category, keywords in CATEGORY_STORAGE.keywords.items():
-                try:
-                    for keyword in keywords:
-                        classifier.add_keyword(keyword, category, save_to_sheet=False)
-                except (KeyError, ValueError) as e:
-                    logger.warning(f"⚠️ Категория mapping failed для '{category}', используем raw string: {e}")
-                    # Продолжаем с другими категориями
-                    continue
-            logger.info(f"✅ KeywordDictionary обновлен с {len(CATEGORY_STORAGE.keywords)} категориями.")
+            classifier = await bootstrap_classifier(reload=True)
+            keyword_dict = classifier.keyword_dict
+            # Ключевые слова листа переносятся в словарь только если изменились они или сам словарь
+            state = (CATEGORY_STORAGE.keywords_version, id(keyword_dict), getattr(keyword_dict, 'version', 0))
+            if state != _dictionary_keywords_state:
+                # Обновляем словарь ключевых слов в KeywordDictionary одним пакетом (одна копия индекса);
+                # слова листа не сохраняются в SQLite, удаленные из листа убираются из словаря
+                classifier.sync_sheet_keywords(
+                    [(keyword, category, 0.5) for category, keywords in CATEGORY_STORAGE.keywords.items() for keyword in keywords]
+                )
+                _dictionary_keywords_state = (
+                    CATEGORY_STORAGE.keywords_version, id(keyword_dict), getattr(keyword_dict, 'version', 0)
+                )
+                # Автомат поиска пересобирается в отдельном потоке, а не при разборе следующего чека
+                await refresh_keyword_matcher(keyword_dict)
+                logger.info(f"✅ KeywordDictionary обновлен с {len(CATEGORY_STORAGE.keywords)} категориями.")
         except Exception as e:
             logger.error(f"❌ Ошибка обновления KeywordDictionary: {e}")
             
@@ -434,11 +446,8 @@ async def add_keywords_to_sheet(category: str, new_keywords: List[str]) -> bool:
                 # Выполняем обновление ячейки в отдельном потоке
                 await asyncio.to_thread(ws.update_cell, row_index, 2, new_keywords_str.strip(' ,'))
 
-                # Обновляем локальное хранилище CATEGORY_STORAGE
-                if category not in CATEGORY_STORAGE.keywords: CATEGORY_STORAGE.keywords[category] = []
-                for k in unique_new_keywords:
-                    if k not in CATEGORY_STORAGE.keywords[category]:
-                        CATEGORY_STORAGE.keywords[category].append(k)
+                # Публикуем новый снимок CATEGORY_STORAGE с добавленными словами
+                CATEGORY_STORAGE.add_keywords(category, unique_new_keywords)
 
                 # Инвалидируем кэш категорий, так как данные изменились
                 invalidate_categories_cache()
@@ -545,6 +554,16 @@ async def add_keyword_to_sheet(keyword: str, category: str, confidence: float =
     """
     Добавляет новое ключевое слово в лист Keywords.
     """
+    return await add_keyword_rows_to_sheet([[keyword, category, confidence]])
+
+
+async def add_keyword_rows_to_sheet(rows: List[List]) -> bool:
+    """
+    Добавляет строки [ключевое слово, категория, уверенность] в лист Keywords одним запросом.
+    """
+    if not rows:
+        return True
+
     max_retries = 3
     retry_count = 0
     
@@ -559,11 +578,8 @@ async def add_keyword_to_sheet(keyword: str, category: str, confidence: float =
             await asyncio.sleep(1)  # Ждем 1 секунду перед повторной попыткой
 
     try:
-        # Подготовляем строку для добавления
-        row = [keyword, category, confidence]
-        
-        # Добавляем строку в таблицу
-        await asyncio.to_thread(ws.append_rows, [row])
+        # Добавляем строки в таблицу
+        await asyncio.to_thread(ws.append_rows, rows)
         
         # Инвалидируем кэш ключевых слов, так как данные изменились
         if KEYWORDS_SHEET_NAME in _sheets_cache._data_cache:
@@ -571,7 +587,10 @@ async def add_keyword_to_sheet(keyword: str, category: str, confidence: float =
         if KEYWORDS_SHEET_NAME in _sheets_cache._cache_timestamps:
             del _sheets_cache._cache_timestamps[KEYWORDS_SHEET_NAME]
         
-        logger.info(f"✅ Ключевое слово '{keyword}' добавлено в таблицу '{KEYWORDS_SHEET_NAME}' с категорией '{category}'.")
+        if len(rows) == 1:
+            logger.info(f"✅ Ключевое слово '{rows[0][0]}' добавлено в таблицу '{KEYWORDS_SHEET_NAME}' с категорией '{rows[0][1]}'.")
+        else:
+            logger.info(f"✅ {len(rows)} ключевых слов добавлено в таблицу '{KEYWORDS_SHEET_NAME}'.")
         return True
         
     except Exception as e:
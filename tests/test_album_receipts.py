@@ -0,0 +1,103 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, Mock
+
+from handlers.receipts import process_album_job
+from models.transaction import CheckData, TransactionData
+from services.album_collector import AlbumCollector
+from services.receipt_queue import ReceiptJob
+from services.repository import TransactionRepository
+from services.transaction_service import TransactionService
+from utils.exceptions import CheckApiRecognitionError, TransactionSaveError
+from utils.states import TransactionStates
+
+
+def make_transaction(amount: float, user_id=1) -> TransactionData:
+    return TransactionData(type="Расход", category="Продукты", amount=amount, comment="молоко",
+                           username="user", user_id=user_id, retailer_name="Магазин")
+
+
+class TestAlbumCollector:
+    """Тесты сбора фото альбома"""
+
+    @pytest.mark.asyncio
+    async def test_album_is_delivered_once(self):
+        """Проверяем, что фото одного альбома передаются одним вызовом"""
+        collector = AlbumCollector(delay=0.05)
+        albums = []
+
+        async def on_complete(items):
+            albums.append(items)
+
+        first = [collector.add("album-1", index, on_complete) for index in range(3)]
+        collector.add("album-2", "other", on_complete)
+        await asyncio.sleep(0.15)
+
+        assert first == [True, False, False]
+        assert sorted(albums, key=len) == [["other"], [0, 1, 2]]
+        assert collector.pending() == 0
+
+
+class TestAlbumProcessing:
+    """Тесты обработки альбома чеков"""
+
+    @pytest.mark.asyncio
+    async def test_album_summary_keeps_recognized_receipts(self):
+        """Проверяем общую сводку: нераспознанный чек не мешает остальным"""
+        service = Mock(spec=TransactionService)
+        service.load_categories = AsyncMock(return_value=True)
+        checks = {
+            "a": CheckData(category="Продукты", amount=100.0, comment="хлеб"),
+            "b": None,
+            "c": CheckData(category="Продукты", amount=50.0, comment="молоко"),
+        }
+
+        async def recognize_receipt(file_unique_id, fetch_image):
+            if checks[file_unique_id] is None:
+                raise CheckApiRecognitionError("чек некорректен")
+            return checks[file_unique_id]
+
+        service.recognize_receipt = recognize_receipt
+        service.process_check_data = AsyncMock(side_effect=lambda check, username, user_id: (make_transaction(check.amount), None))
+
+        message = Mock()
+        message.from_user.username = "user"
+        message.from_user.id = 1
+        state = Mock()
+        state.update_data = AsyncMock()
+        state.set_state = AsyncMock()
+        files = [Mock(file_unique_id=key) for key in ("a", "b", "c")]
+
+        await process_album_job(ReceiptJob(user_id=1, run=AsyncMock()), message, state, service, files, Mock())
+
+        saved = state.update_data.await_args.kwargs['album_transactions']
+        assert [item['amount'] for item in saved] == [100.0, 50.0]
+        state.set_state.assert_awaited_once_with(TransactionStates.confirming_album)
+
+
+class TestBatchSave:
+    """Тесты пакетной записи транзакций альбома"""
+
+    @pytest.mark.asyncio
+    async def test_transactions_are_saved_together(self, tmp_path):
+        """Проверяем запись всех транзакций альбома одним пакетом"""
+        repository = TransactionRepository(str(tmp_path / "test.db"))
+        await repository.init_db()
+        service = TransactionService(repository=repository, training_queue=asyncio.Queue())
+
+        result = await service.finalize_transactions([make_transaction(100.0), make_transaction(50.0)])
+
+        assert result['count'] == 2
+        assert [row['amount'] for row in await repository.get_unsynced()] == [100.0, 50.0]
+
+    @pytest.mark.asyncio
+    async def test_invalid_transaction_saves_nothing(self, tmp_path):
+        """Проверяем, что пакет записывается целиком или не записывается вовсе"""
+        repository = TransactionRepository(str(tmp_path / "test.db"))
+        await repository.init_db()
+        service = TransactionService(repository=repository, training_queue=asyncio.Queue())
+
+        with pytest.raises(TransactionSaveError):
+            await service.finalize_transactions([make_transaction(100.0), make_transaction(50.0, user_id=None)])
+
+        assert await repository.get_unsynced() == []
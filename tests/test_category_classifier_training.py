@@ -0,0 +1,309 @@
+import heapq
+import pytest
+from unittest.mock import Mock, patch
+
+from models.transaction import TransactionData
+from utils.category_classifier import (
+    ClassifierModel, TransactionCategoryClassifier, TOP_KEYWORDS_LIMIT, TOP_KEYWORDS_REFRESH_INTERVAL,
+)
+
+
+def make_transaction(category: str, comment: str) -> TransactionData:
+    return TransactionData(type="Расход", category=category, amount=100.0, comment=comment, username="tester")
+
+
+class TestIncrementalTraining:
+    """Тесты для инкрементального обновления топ-признаков классификатора"""
+
+    @pytest.fixture(autouse=True)
+    def setup_classifier(self, tmp_path):
+        """Настройка теста: классификатор с пустой моделью во временном файле"""
+        with patch('utils.category_classifier.MODEL_FILE_PATH', str(tmp_path / "model.pkl")):
+            self.classifier = TransactionCategoryClassifier(keyword_dict=Mock())
+            yield
+
+    def _full_top_keywords(self, category):
+        """Эталонный полный пересчет топ-признаков"""
+        return heapq.nlargest(
+            TOP_KEYWORDS_LIMIT,
+            self.classifier.category_features[category],
+            key=lambda feature: self.classifier._calculate_tfidf(feature, category)
+        )
+
+    def test_derived_counters_match_features(self):
+        """Проверяем, что инкрементальные счетчики совпадают с полным пересчетом"""
+        self.classifier.train([make_transaction("Еда", "молоко хлеб сыр")])
+        self.classifier.train([make_transaction("Еда", "молоко кефир")])
+        self.classifier.train([make_transaction("Транспорт", "бензин молоко")])
+
+        for category, features in self.classifier.category_features.items():
+            assert self.classifier.category_feature_totals[category] == sum(features.values())
+
+        for feature in self.classifier.global_features:
+            expected = sum(1 for cat in self.classifier.categories if self.classifier.category_features[cat].get(feature, 0) > 0)
+            assert self.classifier.feature_category_counts[feature] == expected
+
+    def test_top_keywords_are_bounded(self):
+        """Проверяем, что топ-признаки ограничены TOP_KEYWORDS_LIMIT"""
+        words = " ".join(f"товар{chr(ord('а') + i)}" for i in range(25))
+        self.classifier.train([make_transaction("Еда", words)])
+
+        assert len(self.classifier.category_keywords["Еда"]) == TOP_KEYWORDS_LIMIT
+
+    def test_train_touches_only_affected_categories(self):
+        """Проверяем, что обучение не пересчитывает незатронутые категории"""
+        self.classifier.train([make_transaction("Еда", "молоко хлеб")])
+        self.classifier.train([make_transaction("Транспорт", "бензин заправка")])
+
+        with patch('utils.category_classifier.ClassifierModel.update_top_keywords', autospec=True) as mock_update:
+            self.classifier.train([make_transaction("Еда", "сыр")])
+
+        updated_categories = [call.args[1] for call in mock_update.call_args_list]
+        assert updated_categories == ["Еда"]
+
+    def test_rebuild_matches_full_recalculation(self):
+        """Проверяем, что полный пересчет при загрузке совпадает с эталоном"""
+        self.classifier.train([make_transaction("Еда", "молоко хлеб сыр")])
+        self.classifier.train([make_transaction("Транспорт", "бензин заправка")])
+
+        self.classifier._model.rebuild_derived_stats()
+
+        for category in self.classifier.categories:
+            assert set(self.classifier.category_keywords[category]) == set(self._full_top_keywords(category))
+
+    def test_periodic_refresh_matches_full_recalculation(self):
+        """Проверяем, что после нескольких обучений периодический пересчет дает точный топ"""
+        transactions = [
+            make_transaction("Еда", " ".join(f"продукт{chr(ord('а') + i)}" for i in range(15))),
+            make_transaction("Еда", "молоко хлеб"),
+            make_transaction("Транспорт", "молоко бензин продукта продуктб"),
+            make_transaction("Еда", "молоко сыр кефир"),
+            make_transaction("Транспорт", "такси метро продуктв"),
+            make_transaction("Еда", "хлеб сыр"),
+        ]
+        with patch('utils.category_classifier.TOP_KEYWORDS_REFRESH_INTERVAL', len(transactions)):
+            for transaction in transactions[:-1]:
+                self.classifier.train([transaction])
+            # Инкрементальный топ приближенный: до пересчета он расходится с точным
+            assert any(self.classifier.category_keywords[category] != self._full_top_keywords(category)
+                       for category in self.classifier.categories)
+
+            self.classifier.train([transactions[-1]])
+
+        assert self.classifier._model.updates_since_refresh == 0
+        for category in self.classifier.categories:
+            assert self.classifier.category_keywords[category] == self._full_top_keywords(category)
+
+    def test_refresh_runs_exactly_at_interval(self):
+        """Проверяем границу пересчета: INTERVAL-1 обучений без полного пересчета, на INTERVAL-м — точный топ"""
+        words = ["молоко", "хлеб", "сыр", "кефир", "бензин", "такси", "метро", "кофе", "чай", "сахар", "соль", "масло"]
+        categories = ["Еда", "Транспорт", "Кафе"]
+        with patch('utils.category_classifier.ClassifierModel.refresh_top_keywords', autospec=True,
+                   side_effect=ClassifierModel.refresh_top_keywords) as refresh:
+            for i in range(TOP_KEYWORDS_REFRESH_INTERVAL - 1):
+                comment = " ".join(words[(i * 5 + j * 7) % len(words)] for j in range(1 + i % 4))
+                self.classifier.train([make_transaction(categories[i % 3], comment)])
+            assert refresh.call_count == 0
+            assert self.classifier._model.updates_since_refresh == TOP_KEYWORDS_REFRESH_INTERVAL - 1
+
+            self.classifier.train([make_transaction("Еда", "молоко хлеб")])
+
+        assert refresh.call_count == 1
+        assert self.classifier._model.updates_since_refresh == 0
+        for category in self.classifier.categories:
+            assert self.classifier.category_keywords[category] == self._full_top_keywords(category)
+
+
+class TestModelSwap:
+    """Тесты для фонового обучения и подмены версии модели"""
+
+    @pytest.fixture(autouse=True)
+    def setup_classifier(self, tmp_path):
+        """Настройка теста: классификатор с пустой моделью во временном файле"""
+        with patch('utils.category_classifier.MODEL_FILE_PATH', str(tmp_path / "model.pkl")):
+            self.classifier = TransactionCategoryClassifier(keyword_dict=Mock())
+            yield
+
+    def test_train_publishes_new_version_without_mutating_old(self):
+        """Проверяем, что обучение не изменяет опубликованную версию модели"""
+        self.classifier.train([make_transaction("Еда", "молоко хлеб")])
+        old_model = self.classifier._model
+        old_food_features = dict(old_model.category_features["Еда"])
+
+        self.classifier.train([make_transaction("Еда", "молоко сыр")])
+
+        assert self.classifier._model is not old_model
+        assert self.classifier._model.version == old_model.version + 1
+        assert dict(old_model.category_features["Еда"]) == old_food_features
+        assert old_model.total_transactions == 1
+        assert self.classifier.total_transactions == 2
+
+    def test_train_copies_only_touched_shards(self):
+        """Проверяем, что новая версия разделяет с предыдущей все шарды, кроме измененных"""
+        words = " ".join(f"товар{chr(ord('а') + i)}{chr(ord('а') + j)}" for i in range(20) for j in range(20))
+        self.classifier.train([make_transaction("Еда", words)])
+        old_model = self.classifier._model
+
+        self.classifier.train([make_transaction("Еда", "молоко")])
+
+        new_model = self.classifier._model
+        touched = len(set(self.classifier.extract_features("молоко")))
+        for old_counts, new_counts in [(old_model.global_features, new_model.global_features),
+                                       (old_model.category_features["Еда"], new_model.category_features["Еда"])]:
+            copied = sum(1 for old, new in zip(old_counts._shards, new_counts._shards) if old is not new)
+            assert copied <= touched
+
+    def test_model_save_is_debounced(self):
+        """Проверяем, что модель не сохраняется целиком после каждого обучения, но сохраняется при flush"""
+        with patch.object(self.classifier, 'save_model', wraps=self.classifier.save_model) as mock_save:
+            for comment in ("молоко", "хлеб", "сыр"):
+                self.classifier.train([make_transaction("Еда", comment)])
+            assert mock_save.call_count == 1
+
+            self.classifier.flush_model()
+            self.classifier.flush_model()
+
+        assert mock_save.call_count == 2
+        assert mock_save.call_args.args[0].version == self.classifier._model.version
+
+    def test_learn_keyword_publishes_new_version(self):
+        """Проверяем, что learn_keyword не изменяет опубликованную версию модели"""
+        self.classifier.keyword_dict.normalize_text.side_effect = lambda text: text
+        self.classifier.train([make_transaction("Еда", "молоко")])
+        old_model = self.classifier._model
+        old_keywords = dict(old_model.category_keywords)
+
+        self.classifier.learn_keyword("кефир", "Напитки")
+
+        assert self.classifier._model is not old_model
+        assert "кефир" in self.classifier.category_keywords["Напитки"]
+        assert dict(old_model.category_keywords) == old_keywords
+        assert "Напитки" not in old_model.categories
+
+    @pytest.mark.asyncio
+    async def test_training_worker_trains_queued_batch(self):
+        """Проверяем, что воркер обучает классификатор на пакете из очереди"""
+        import asyncio
+        from services.training_worker import start_training_worker
+
+        queue = asyncio.Queue()
+        queue.put_nowait(make_transaction("Еда", "молоко"))
+        queue.put_nowait(make_transaction("Транспорт", "бензин"))
+
+        worker = asyncio.create_task(start_training_worker(self.classifier, queue))
+        await asyncio.wait_for(queue.join(), timeout=5)
+        worker.cancel()
+
+        assert self.classifier.total_transactions == 2
+        assert self.classifier._model.version == 1
+
+
+class TestSingleAnalysisPass:
+    """Тесты для однократного анализа текста при классификации"""
+
+    @pytest.fixture(autouse=True)
+    def setup_classifier(self, tmp_path):
+        """Настройка теста: классификатор с обученной моделью и пустым словарем"""
+        keyword_dict = Mock()
+        keyword_dict.get_category_by_keyword.return_value = None
+        with patch('utils.category_classifier.MODEL_FILE_PATH', str(tmp_path / "model.pkl")):
+            self.classifier = TransactionCategoryClassifier(keyword_dict=keyword_dict)
+            self.classifier.train([make_transaction("Еда", "молоко хлеб")])
+            yield
+
+    def test_classify_lemmatizes_once(self):
+        """Проверяем, что словарь и ML используют один и тот же AnalyzedText"""
+        from utils.text_analysis import AnalyzedText
+
+        with patch.object(self.classifier.lemmatizer, 'lemmatize_many', wraps=self.classifier.lemmatizer.lemmatize_many) as mock_lemmatize:
+            result = self.classifier.classify("молоко хлеб")
+
+        assert mock_lemmatize.call_count == 1
+        passed = self.classifier.keyword_dict.get_category_by_keyword.call_args.args[0]
+        assert isinstance(passed, AnalyzedText)
+        assert result.category == "Еда"
+        assert result.source == "ml"
+
+    def test_classify_returns_keyword_result(self):
+        """Проверяем, что совпадение по словарю возвращается вместе с уверенностью"""
+        self.classifier.keyword_dict.get_category_by_keyword.return_value = ("Транспорт", 1.0)
+
+        result = self.classifier.classify("бензин")
+
+        assert result.as_tuple() == ("Транспорт", 1.0)
+        assert result.source == "keyword"
+
+    def test_predict_category_matches_classify(self):
+        """Проверяем, что predict_category возвращает тот же результат, что и classify"""
+        transaction = make_transaction("", "молоко хлеб")
+
+        assert self.classifier.predict_category(transaction) == \
+            self.classifier.classify(self.classifier.transaction_text(transaction)).as_tuple()
+
+
+class TestBatchClassification:
+    """Тесты пакетной классификации позиций чека и предложения разделения"""
+
+    @pytest.fixture(autouse=True)
+    def setup_classifier(self, tmp_path):
+        """Настройка теста: классификатор, обученный на двух категориях"""
+        keyword_dict = Mock()
+        keyword_dict.get_category_by_keyword.return_value = None
+        with patch('utils.category_classifier.MODEL_FILE_PATH', str(tmp_path / "model.pkl")):
+            self.classifier = TransactionCategoryClassifier(keyword_dict=keyword_dict)
+            self.classifier.train([make_transaction("Продукты", "молоко хлеб сыр")] * 3)
+            self.classifier.train([make_transaction("Аптека", "аспирин бинт")] * 3)
+            yield
+
+    def test_classify_many_matches_classify(self):
+        """Проверяем, что пакетный результат совпадает с поштучной классификацией"""
+        texts = ["молоко", "аспирин", "бинт и сыр", "гвозди"]
+
+        assert self.classifier.classify_many(texts) == [self.classifier.classify(text) for text in texts]
+
+    def test_feature_weights_computed_once_per_batch(self):
+        """Проверяем, что вклад одинакового признака считается один раз на весь пакет"""
+        with patch.object(TransactionCategoryClassifier, '_feature_weights',
+                          wraps=TransactionCategoryClassifier._feature_weights) as mock_weights:
+            self.classifier.classify_many(["молоко"] * 100)
+
+        assert mock_weights.call_count == len(set(self.classifier.extract_features("молоко")))
+
+    def test_propose_split_groups_items_by_category(self):
+        """Проверяем, что позиции группируются по категориям, а неуверенные уходят в категорию чека"""
+        from models.transaction import CheckData, CheckItem
+        from models.category_registry import CategoryRegistry
+        from services.transaction_service import TransactionService
+
+        registry = CategoryRegistry()
+        registry.publish(["Продукты", "Аптека", "Прочее Расход"], [], {})
+        check = CheckData(category="Продукты", amount=410.0, comment="", items=[
+            CheckItem(name="молоко", price=100.0, quantity=1, sum=100.0),
+            CheckItem(name="аспирин", price=250.0, quantity=1, sum=250.0),
+            CheckItem(name="гвозди", price=60.0, quantity=1, sum=60.0),
+        ])
+        service = TransactionService(classifier=self.classifier)
+
+        with patch('services.transaction_service.CATEGORY_STORAGE', registry):
+            proposal = service.propose_split(check, check.category)
+
+        assert proposal == [
+            {'category': "Аптека", 'amount': 250.0, 'items_str': "аспирин"},
+            {'category': "Продукты", 'amount': 160.0, 'items_str': "молоко | гвозди"},
+        ]
+
+    def test_propose_split_does_not_record_keyword_usage(self):
+        """Проверяем, что предложение разделения (выполняется в потоке) не меняет статистику ключевых слов"""
+        from models.transaction import CheckData, CheckItem
+        from services.transaction_service import TransactionService
+
+        check = CheckData(category="Продукты", amount=200.0, comment="", items=[
+            CheckItem(name="молоко", price=100.0, quantity=1, sum=100.0),
+            CheckItem(name="аспирин", price=100.0, quantity=1, sum=100.0),
+        ])
+        service = TransactionService(classifier=self.classifier)
+
+        with patch.object(self.classifier, 'classify_many', wraps=self.classifier.classify_many) as mock_classify:
+            service.propose_split(check, check.category)
+
+        assert mock_classify.call_args.kwargs == {'record_usage': False}
@@ -0,0 +1,85 @@
+import pytest
+
+from models.category_registry import CategoryRegistry
+from utils.keyboards import (
+    CALLBACK_DATA_LIMIT,
+    CategoryKeyboardCache,
+    category_callback_data,
+    parse_category_callback,
+)
+
+LONG_CATEGORY = "Товары для дома, ремонта и строительства (крупные покупки)"
+
+
+class TestCategoryKeyboardCache:
+    """Тесты кэширования клавиатур категорий по версии реестра"""
+
+    def setup_method(self):
+        self.registry = CategoryRegistry()
+        self.registry.publish(["Продукты", "Транспорт", LONG_CATEGORY], ["Зарплата"], {})
+        self.cache = CategoryKeyboardCache(self.registry)
+
+    def test_keyboard_is_built_once_per_version(self):
+        """Проверяем, что клавиатура переиспользуется для одной и той же пары (тип, префикс)"""
+        first = self.cache.inline("Расход", "checkcat")
+
+        assert self.cache.inline("Расход", "checkcat") is first
+        assert self.cache.inline("Расход", "splitcat") is not first
+        assert self.cache.inline("Доход", "checkcat") is not first
+
+    def test_keyboard_rebuilt_when_categories_change(self):
+        """Проверяем сброс кэша при изменении категорий, но не ключевых слов"""
+        first = self.cache.inline("Расход", "checkcat")
+
+        self.registry.add_keywords("Продукты", ["молоко"])
+        assert self.cache.inline("Расход", "checkcat") is first
+
+        self.registry.publish(["Продукты", "Кафе"], ["Зарплата"], self.registry.keywords)
+        second = self.cache.inline("Расход", "checkcat")
+
+        assert second is not first
+        assert [button.text for row in second.inline_keyboard for button in row] == ["Продукты", "Кафе"]
+
+    def test_callbacks_use_compact_ids(self):
+        """Проверяем, что callback_data содержит id категории и укладывается в лимит Telegram"""
+        keyboard = self.cache.inline("Расход", "checkcat")
+
+        for row in keyboard.inline_keyboard:
+            for button in row:
+                assert len(button.callback_data.encode('utf-8')) <= CALLBACK_DATA_LIMIT
+                assert parse_category_callback(button.callback_data, self.registry) == button.text
+
+        # Название длинной категории само по себе не поместилось бы в callback_data
+        assert len(f"checkcat_{LONG_CATEGORY}".encode('utf-8')) > CALLBACK_DATA_LIMIT
+
+    def test_reply_keyboard_is_cached(self):
+        """Проверяем кэширование Reply-клавиатуры ручного ввода"""
+        keyboard = self.cache.reply("Доход")
+
+        assert self.cache.reply("Доход") is keyboard
+        assert keyboard.keyboard[0][0].text == "Зарплата"
+
+
+class TestCategoryCallbackParsing:
+    """Тесты разбора callback кнопок категорий"""
+
+    def setup_method(self):
+        self.registry = CategoryRegistry()
+        self.registry.publish(["Продукты", "Транспорт"], ["Зарплата"], {})
+
+    def test_parse_legacy_name_payload(self):
+        """Проверяем, что кнопки со старым форматом (название категории) продолжают работать"""
+        assert parse_category_callback("checkcat_Транспорт", self.registry) == "Транспорт"
+        assert parse_category_callback("checkcat_Неизвестно", self.registry) is None
+
+    def test_parse_removed_category(self):
+        """Проверяем, что id удаленной категории не разрешается в название"""
+        data = category_callback_data("splitcat", self.registry.id_of("Транспорт"))
+        self.registry.publish(["Продукты"], ["Зарплата"], {})
+
+        assert parse_category_callback(data, self.registry) is None
+
+    def test_callback_limit_is_enforced(self):
+        """Проверяем, что слишком длинный callback отклоняется"""
+        with pytest.raises(ValueError):
+            category_callback_data("x" * CALLBACK_DATA_LIMIT, 1)
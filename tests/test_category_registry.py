@@ -0,0 +1,122 @@
+import pytest
+from unittest.mock import Mock, patch
+
+from models.category_registry import CategoryRegistry, CategorySnapshot, DEFAULT_EXPENSE_CATEGORY
+
+
+class TestCategoryRegistry:
+    """Тесты версионируемого реестра категорий"""
+
+    def setup_method(self):
+        self.registry = CategoryRegistry()
+        self.registry.publish(
+            ["Продукты", "Транспорт", "Прочее Расход"],
+            ["Зарплата"],
+            {"Продукты": ["молоко", "хлеб"]},
+        )
+
+    def test_snapshot_lookups(self):
+        """Проверяем множества и поиск по id в снимке"""
+        snapshot = self.registry.snapshot
+
+        assert snapshot.expense == ("Продукты", "Транспорт", "Прочее Расход")
+        assert snapshot.is_valid("Транспорт", "Расход")
+        assert not snapshot.is_valid("Транспорт", "Доход")
+        assert snapshot.is_valid("Зарплата", "Доход")
+        assert snapshot.name_of(snapshot.id_of("Транспорт")) == "Транспорт"
+        assert snapshot.fallback_expense == "Прочее Расход"
+        assert CategorySnapshot().fallback_expense == DEFAULT_EXPENSE_CATEGORY
+
+    def test_snapshot_is_immutable(self):
+        """Проверяем, что опубликованный снимок нельзя изменить на месте"""
+        snapshot = self.registry.snapshot
+
+        with pytest.raises(Exception):
+            snapshot.expense = ()
+        with pytest.raises(TypeError):
+            snapshot.keywords["Транспорт"] = ("бензин",)
+        assert not hasattr(snapshot.expense, "append")
+
+    def test_ids_are_stable_across_reloads(self):
+        """Проверяем, что id категорий не меняются при перезагрузке и не переиспользуются"""
+        old = self.registry.snapshot
+        new = self.registry.publish(["Транспорт", "Кафе", "Прочее Расход"], ["Зарплата"], {})
+
+        assert new.id_of("Транспорт") == old.id_of("Транспорт")
+        assert new.id_of("Кафе") not in old.names
+        assert new.id_of("Продукты") is None
+
+        restored = self.registry.publish(["Продукты"], [], {})
+        assert restored.id_of("Продукты") == old.id_of("Продукты")
+
+    def test_ids_are_stable_across_restarts(self):
+        """Проверяем, что id зависит только от названия: новый реестр (перезапуск) выдает те же id"""
+        old = self.registry.snapshot
+        restarted = CategoryRegistry().publish(["Прочее Расход", "Транспорт"], [], {})
+
+        assert restarted.id_of("Транспорт") == old.id_of("Транспорт")
+        assert restarted.id_of("Прочее Расход") == old.id_of("Прочее Расход")
+
+    def test_id_collision_gets_distinct_id(self):
+        """Проверяем, что при коллизии хэша категории получают разные id"""
+        with patch('models.category_registry.zlib.crc32', side_effect=lambda data: 7 if b'#' not in data else len(data)):
+            snapshot = CategoryRegistry().publish(["Кафе", "Такси"], [], {})
+
+        assert snapshot.id_of("Кафе") == 7
+        assert snapshot.id_of("Такси") not in (None, 7)
+        assert snapshot.name_of(snapshot.id_of("Такси")) == "Такси"
+
+    def test_readers_keep_old_snapshot(self):
+        """Проверяем, что публикация не меняет снимок, уже взятый читателем"""
+        snapshot = self.registry.snapshot
+        self.registry.publish(["Кафе"], [], {})
+
+        assert snapshot.expense == ("Продукты", "Транспорт", "Прочее Расход")
+        assert self.registry.expense == ("Кафе",)
+
+    def test_versions_change_only_for_changed_parts(self):
+        """Проверяем раздельные версии категорий и ключевых слов"""
+        before = self.registry.snapshot
+
+        same = self.registry.publish(before.expense, before.income, before.keywords)
+        assert same.categories_version == before.categories_version
+        assert same.keywords_version == before.keywords_version
+
+        with_keyword = self.registry.add_keywords("Продукты", ["хлеб", "сыр"])
+        assert with_keyword.keywords["Продукты"] == ("молоко", "хлеб", "сыр")
+        assert with_keyword.categories_version == before.categories_version
+        assert with_keyword.keywords_version == before.keywords_version + 1
+
+        assert self.registry.add_keywords("Продукты", ["сыр"]) is with_keyword
+
+    def test_change_notifications(self):
+        """Проверяем уведомления подписчиков с добавленными и удаленными категориями"""
+        listener = Mock()
+        unsubscribe = self.registry.subscribe(listener)
+
+        self.registry.publish(["Продукты", "Кафе", "Прочее Расход"], ["Зарплата"], {"Продукты": ["молоко", "хлеб"]})
+
+        change = listener.call_args.args[0]
+        assert change.categories_changed and not change.keywords_changed
+        assert change.added == {"Кафе"}
+        assert change.removed == {"Транспорт"}
+
+        # Публикация без изменений не вызывает обработчики
+        listener.reset_mock()
+        snapshot = self.registry.snapshot
+        self.registry.publish(snapshot.expense, snapshot.income, snapshot.keywords)
+        listener.assert_not_called()
+
+        unsubscribe()
+        self.registry.add_keywords("Кафе", ["кофе"])
+        listener.assert_not_called()
+
+    def test_failing_listener_does_not_block_others(self):
+        """Проверяем, что ошибка одного подписчика не мешает остальным"""
+        self.registry.subscribe(Mock(side_effect=RuntimeError("boom")))
+        listener = Mock()
+        self.registry.subscribe(listener)
+
+        self.registry.add_keywords("Транспорт", ["бензин"])
+
+        listener.assert_called_once()
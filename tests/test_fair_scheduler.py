@@ -0,0 +1,101 @@
+import asyncio
+import pytest
+
+from services.fair_scheduler import FairScheduler, fair_slot
+from utils.exceptions import SchedulerQueueFull, UserQueueLimit
+
+
+async def run_all(scheduler: FairScheduler, requests, duration: float = 0.01):
+    """Запускает запросы (user_id, cost) в порядке поступления и возвращает порядок их выполнения"""
+    order = []
+
+    async def request(user_id, cost, label):
+        async with scheduler.slot(user_id, cost):
+            order.append(label)
+            await asyncio.sleep(duration)
+
+    tasks = []
+    for index, (user_id, cost) in enumerate(requests):
+        tasks.append(asyncio.create_task(request(user_id, cost, f"{user_id}{index}")))
+        # Запросы ставятся в очередь строго по порядку
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    return order
+
+
+class TestFairScheduler:
+    """Тесты справедливого планировщика (Deficit Round Robin)"""
+
+    @pytest.mark.asyncio
+    async def test_flooding_user_does_not_starve_others(self):
+        """Проверяем, что запрос второго пользователя не ждет всю очередь первого"""
+        scheduler = FairScheduler("test", capacity=1, per_user_limit=1, max_queued_per_user=20)
+
+        order = await run_all(scheduler, [("a", 1)] * 10 + [("b", 1)])
+
+        assert order.index("b10") <= 2
+
+    @pytest.mark.asyncio
+    async def test_expensive_requests_get_proportionally_fewer_turns(self):
+        """Проверяем учет стоимости: альбомы по 3 фото получают ход реже одиночных чеков"""
+        scheduler = FairScheduler("test", capacity=1, per_user_limit=1)
+
+        order = await run_all(scheduler, [("a", 1), ("a", 3), ("a", 3), ("b", 1), ("b", 1), ("b", 1), ("b", 1)])
+
+        assert order == ["a0", "b3", "a1", "b4", "b5", "a2", "b6"]
+
+    @pytest.mark.asyncio
+    async def test_per_user_concurrency_cap(self):
+        """Проверяем, что один пользователь не занимает все слоты"""
+        scheduler = FairScheduler("test", capacity=4, per_user_limit=2)
+        running = peak = 0
+
+        async def request():
+            nonlocal running, peak
+            async with scheduler.slot("a"):
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*[request() for _ in range(6)])
+
+        assert peak == 2
+        assert scheduler.running() == 0 and scheduler.queued() == 0
+
+    @pytest.mark.asyncio
+    async def test_queue_depth_limits(self):
+        """Проверяем ограничения глубины очереди пользователя и общей очереди"""
+        scheduler = FairScheduler("test", capacity=1, max_queued_per_user=2, max_queued=4)
+        scheduler.enqueue("a")  # Слот выдан сразу
+        scheduler.enqueue("a")
+        scheduler.enqueue("a")
+
+        with pytest.raises(UserQueueLimit):
+            scheduler.enqueue("a")
+
+        scheduler.enqueue("b")
+        assert scheduler.position("c") == 3
+        scheduler.enqueue("c")
+        with pytest.raises(SchedulerQueueFull):
+            scheduler.enqueue("d")
+
+    @pytest.mark.asyncio
+    async def test_cancelled_request_leaves_queue(self):
+        """Проверяем, что отмененный запрос не занимает место и не получает слот"""
+        scheduler = FairScheduler("test", capacity=1)
+        positions = []
+
+        async def on_queued(position):
+            positions.append(position)
+
+        async with scheduler.slot("a"):
+            waiting = asyncio.create_task(fair_slot(scheduler, "b", on_queued).__aenter__())
+            await asyncio.sleep(0)
+            assert scheduler.queued() == 1
+            waiting.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiting
+
+        assert positions == [1]
+        assert scheduler.queued() == 0 and scheduler.running() == 0
@@ -0,0 +1,70 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import utils.receipt_logic as receipt_logic
+from services.http_client import HTTP_LIMIT_PER_HOST, HTTP_POOL_LIMIT, create_http_session
+from services.transaction_service import TransactionService
+
+
+def make_response(status, payload=None):
+    response = MagicMock()
+    response.status = status
+    response.text = AsyncMock(return_value="")
+    response.json = AsyncMock(return_value=payload)
+    context = MagicMock()
+    context.__aenter__ = AsyncMock(return_value=response)
+    context.__aexit__ = AsyncMock(return_value=False)
+    return context
+
+
+CHECK_PAYLOAD = {'code': 1, 'data': {'json': {
+    'user': "Магазин", 'totalSum': 15000, 'items': [{'name': "молоко", 'price': 15000, 'quantity': 1, 'sum': 15000}],
+    'ecashTotalSum': 15000, 'dateTime': "2024-01-01T10:00:00",
+}}}
+
+
+class TestSharedHttpSession:
+    """Тесты общего HTTP-сеанса с пулом соединений"""
+
+    @pytest.mark.asyncio
+    async def test_session_uses_pooled_connector(self):
+        """Проверяем лимиты пула и кэширование DNS"""
+        session = create_http_session()
+        try:
+            connector = session.connector
+            assert connector.limit == HTTP_POOL_LIMIT
+            assert connector.limit_per_host == HTTP_LIMIT_PER_HOST
+            assert connector.use_dns_cache
+        finally:
+            await session.close()
+
+    @pytest.mark.asyncio
+    async def test_retries_reuse_passed_session(self):
+        """Проверяем, что повторы идут через переданный сеанс, который не закрывается, а форма создается заново"""
+        session = MagicMock()
+        session.post = MagicMock(side_effect=[make_response(500), make_response(200, CHECK_PAYLOAD)])
+        session.close = AsyncMock()
+
+        with patch.object(receipt_logic, 'CHECK_API_TOKEN', "token"), \
+                patch.object(receipt_logic.asyncio, 'sleep', AsyncMock()), \
+                patch.object(receipt_logic, 'map_category_by_keywords', return_value="Продукты"):
+            check = await receipt_logic.parse_check_from_api(b"image", session=session)
+
+        assert check.amount == 150.0
+        assert session.post.call_count == 2
+        first_form = session.post.call_args_list[0].kwargs['data']
+        second_form = session.post.call_args_list[1].kwargs['data']
+        assert first_form is not second_form
+        session.close.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_service_passes_session_to_check_api(self):
+        """Проверяем, что TransactionService использует внедренный сеанс"""
+        session = MagicMock()
+        service = TransactionService(http_session=session)
+
+        with patch('services.transaction_service.fetch_check_json', AsyncMock(return_value={})) as mock_fetch, \
+                patch('services.transaction_service.check_data_from_json', return_value=MagicMock(amount=10)):
+            await service.create_transaction_from_check(b"image")
+
+        assert mock_fetch.call_args.kwargs['session'] is session
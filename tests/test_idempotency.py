@@ -0,0 +1,132 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, patch
+
+from handlers.manual import confirm_manual_transaction
+from handlers.receipts import process_confirm_check
+from models.transaction import TransactionData
+from services.idempotency import IdempotencyGuard, confirmation_keys, new_draft_token
+from services.repository import TransactionRepository
+
+
+@pytest_asyncio.fixture
+async def repository(tmp_path):
+    repository = TransactionRepository(str(tmp_path / "test.db"))
+    await repository.init_db()
+    return repository
+
+
+def make_callback(callback_id: str):
+    callback = Mock()
+    callback.id = callback_id
+    callback.answer = AsyncMock()
+    callback.from_user = SimpleNamespace(id=1, username="user", full_name="User")
+    return callback
+
+
+def make_state(data: dict):
+    state = Mock()
+    state.get_data = AsyncMock(return_value=data)
+    state.clear = AsyncMock()
+    return state
+
+
+class TestIdempotencyGuard:
+    """Тесты однократного выполнения подтверждений"""
+
+    @pytest.mark.asyncio
+    async def test_double_tap_on_one_draft_is_absorbed(self, repository):
+        """Проверяем, что второе нажатие (другой callback, тот же черновик) поглощается"""
+        guard = IdempotencyGuard(repository)
+        data = {'draft_token': new_draft_token()}
+
+        first = await guard.claim(confirmation_keys(make_callback("1"), data))
+        second = await guard.claim(confirmation_keys(make_callback("2"), data))
+
+        assert (first, second) == (True, False)
+
+    @pytest.mark.asyncio
+    async def test_concurrent_confirmations_run_once(self, repository):
+        """Проверяем, что из одновременных подтверждений выполняется одно"""
+        guard = IdempotencyGuard(repository)
+        data = {'draft_token': new_draft_token()}
+
+        results = await asyncio.gather(*[guard.claim(confirmation_keys(make_callback(str(i)), data)) for i in range(5)])
+
+        assert results.count(True) == 1
+
+    @pytest.mark.asyncio
+    async def test_redelivered_update_is_absorbed_after_restart(self, repository):
+        """Проверяем, что ключ из таблицы переживает перезапуск (новый экземпляр guard)"""
+        await IdempotencyGuard(repository).claim(["callback:1"])
+
+        assert not await IdempotencyGuard(repository).claim(["callback:1"])
+
+    @pytest.mark.asyncio
+    async def test_released_and_expired_keys_can_be_claimed(self, repository):
+        """Проверяем повтор после ошибки записи и после истечения TTL"""
+        guard = IdempotencyGuard(repository, ttl=0.05)
+        await guard.claim(["draft:a"])
+        await guard.release(["draft:a"])
+        assert await guard.claim(["draft:a"])
+
+        await asyncio.sleep(0.1)
+        assert await IdempotencyGuard(repository, ttl=0.05).claim(["draft:a"])
+        assert await guard.purge_expired() == 0
+
+
+class TestConfirmHandlers:
+    """Тесты хендлеров подтверждения"""
+
+    @pytest.mark.asyncio
+    async def test_double_tap_saves_transaction_once(self, repository):
+        """Проверяем, что двойное нажатие «Подтвердить» записывает транзакцию один раз"""
+        transaction = TransactionData(type="Расход", category="Продукты", amount=100.0, comment="молоко",
+                                      username="user", user_id=1)
+        state = Mock()
+        state.get_data = AsyncMock(return_value={'transaction_data': transaction, 'draft_token': new_draft_token()})
+        state.clear = AsyncMock()
+        service = Mock()
+        service.finalize_transaction = AsyncMock()
+        guard = IdempotencyGuard(repository)
+
+        with patch('handlers.manual.edit_or_send', AsyncMock()):
+            await asyncio.gather(
+                confirm_manual_transaction(make_callback("1"), state, service, guard),
+                confirm_manual_transaction(make_callback("2"), state, service, guard),
+            )
+
+        service.finalize_transaction.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_unexpected_save_error_allows_retry(self, repository):
+        """Проверяем, что после ошибки записи не из TransactionSaveError повторное подтверждение чека записывает его"""
+        state = make_state({'category': "Продукты", 'amount': 100.0, 'draft_token': new_draft_token()})
+        service = Mock()
+        service.finalize_transaction = AsyncMock(side_effect=[RuntimeError("database is locked"), None])
+        guard = IdempotencyGuard(repository)
+
+        with patch('handlers.receipts.edit_or_send', AsyncMock()):
+            await process_confirm_check(make_callback("1"), state, Mock(), service, guard)
+            await process_confirm_check(make_callback("2"), state, Mock(), service, guard)
+
+        assert service.finalize_transaction.await_count == 2
+        state.clear.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_error_after_save_keeps_claim(self, repository):
+        """Проверяем, что ошибка показа результата после записи не разрешает повторную запись"""
+        transaction = TransactionData(type="Расход", category="Продукты", amount=100.0, comment="молоко",
+                                      username="user", user_id=1)
+        state = make_state({'transaction_data': transaction, 'draft_token': new_draft_token()})
+        service = Mock()
+        service.finalize_transaction = AsyncMock()
+        guard = IdempotencyGuard(repository)
+
+        with patch('handlers.manual.edit_or_send', AsyncMock(side_effect=[RuntimeError("message not found"), None, None])):
+            await confirm_manual_transaction(make_callback("1"), state, service, guard)
+            await confirm_manual_transaction(make_callback("2"), state, service, guard)
+
+        service.finalize_transaction.assert_awaited_once()
@@ -0,0 +1,97 @@
+import io
+import random
+import time
+import pytest
+
+PIL = pytest.importorskip("PIL")
+from PIL import Image, ImageDraw
+
+import utils.image_preprocessing as image_preprocessing
+from utils.image_preprocessing import IMAGE_MAX_SIDE, IMAGE_TARGET_BYTES, preprocess_image, preprocess_image_async
+
+# Бюджет времени предобработки одного фото (с запасом для медленных машин)
+PREPROCESS_BUDGET_SECONDS = 2.0
+
+
+def make_receipt_photo(width: int, height: int, seed: int) -> bytes:
+    """Синтетическое «фото чека»: строки текста на неровном фоне с шумом матрицы камеры"""
+    rng = random.Random(seed)
+    image = Image.effect_noise((width, height), 40).convert("RGB")
+    background = Image.new("RGB", (width, height), (235, 230, 220))
+    image = Image.blend(background, image, 0.25)
+    draw = ImageDraw.Draw(image)
+    for line in range(0, height, max(20, height // 60)):
+        text = " ".join(rng.choice(["МОЛОКО", "ХЛЕБ", "ИТОГ", "НДС 20%", "=123.45", "КАССИР"]) for _ in range(8))
+        draw.text((width // 10, line), text, fill=(20, 20, 20))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+
+SAMPLE_PHOTOS = {
+    "phone_12mp": (3024, 4032),
+    "phone_8mp": (2448, 3264),
+    "screenshot": (1080, 2340),
+}
+
+
+class TestImagePreprocessingBenchmark:
+    """Бенчмарк предобработки: экономия байт и задержка на наборе фото чеков"""
+
+    @pytest.fixture(scope="class")
+    def samples(self):
+        return {name: make_receipt_photo(width, height, seed) for seed, (name, (width, height)) in enumerate(SAMPLE_PHOTOS.items())}
+
+    def test_bytes_saved_and_latency(self, samples):
+        """Проверяем размер результата и время обработки каждого образца"""
+        total_before = total_after = 0
+        for name, photo in samples.items():
+            started = time.perf_counter()
+            result = preprocess_image(photo)
+            elapsed = time.perf_counter() - started
+
+            total_before += len(photo)
+            total_after += len(result.data)
+            print(f"{name}: {len(photo) // 1024} KiB -> {len(result.data) // 1024} KiB "
+                  f"({result.saved_bytes / len(photo):.0%} saved), {result.size}, {elapsed * 1000:.0f} ms")
+
+            assert len(result.data) <= IMAGE_TARGET_BYTES
+            assert max(result.size) <= IMAGE_MAX_SIDE
+            assert elapsed < PREPROCESS_BUDGET_SECONDS
+
+        print(f"total: {total_before // 1024} KiB -> {total_after // 1024} KiB")
+        assert total_after < total_before / 3
+
+    def test_output_is_grayscale_jpeg(self, samples):
+        """Проверяем, что результат — JPEG в оттенках серого"""
+        result = preprocess_image(samples["phone_8mp"])
+
+        with Image.open(io.BytesIO(result.data)) as image:
+            assert image.format == "JPEG"
+            assert image.mode == "L"
+
+    def test_small_file_is_sent_as_is(self):
+        """Проверяем, что уже компактный файл не увеличивается при пережатии"""
+        buffer = io.BytesIO()
+        Image.effect_noise((400, 300), 60).save(buffer, format="JPEG", quality=20)
+        original = buffer.getvalue()
+
+        result = preprocess_image(original)
+
+        assert result.data == original
+        assert result.saved_bytes == 0
+
+    @pytest.mark.asyncio
+    async def test_process_pool_end_to_end(self, samples):
+        """Проверяем обработку в пуле процессов и возврат исходника при ошибке"""
+        try:
+            started = time.perf_counter()
+            result = await preprocess_image_async(samples["phone_12mp"])
+            print(f"process pool end-to-end: {(time.perf_counter() - started) * 1000:.0f} ms")
+
+            assert len(result.data) <= IMAGE_TARGET_BYTES
+
+            broken = await preprocess_image_async(b"not an image")
+            assert broken.data == b"not an image"
+        finally:
+            image_preprocessing.shutdown_preprocess_pool()
@@ -0,0 +1,82 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+from unittest.mock import patch
+
+import utils.category_classifier as category_classifier
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Допустимое время импорта модуля классификатора (с запасом для медленных машин)
+CLASSIFIER_IMPORT_BUDGET_SECONDS = 2.0
+
+
+def measure_import(module: str) -> dict:
+    """Импортирует модуль в чистом интерпретаторе и возвращает время импорта и состояние ленивых объектов"""
+    code = (
+        "import json, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "elapsed = time.perf_counter() - start\n"
+        "import utils.category_classifier as cc, utils.lemmatizer as lm\n"
+        "print(json.dumps({'elapsed': elapsed,"
+        " 'classifier_created': cc._classifier is not None,"
+        " 'morph_initialized': lm._morph_analyzer_initialized}))\n"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", code], cwd=PROJECT_ROOT, capture_output=True, text=True, timeout=60
+    )
+    assert completed.returncode == 0, completed.stderr
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+class TestImportTime:
+    """Тесты времени импорта: тяжелые подсистемы не создаются при импорте модулей"""
+
+    def test_import_handlers_is_lazy(self):
+        """Проверяем, что импорт handlers не создает классификатор и MorphAnalyzer"""
+        result = measure_import("handlers")
+        print(f"import handlers: {result['elapsed']:.3f}s")
+
+        assert result['classifier_created'] is False
+        assert result['morph_initialized'] is False
+
+    def test_import_classifier_module_within_budget(self):
+        """Проверяем, что импорт модуля классификатора укладывается в бюджет времени"""
+        result = measure_import("utils.category_classifier")
+        print(f"import utils.category_classifier: {result['elapsed']:.3f}s")
+
+        assert result['classifier_created'] is False
+        assert result['elapsed'] < CLASSIFIER_IMPORT_BUDGET_SECONDS
+
+
+class TestLazyClassifier:
+    """Тесты ленивого создания и явной инициализации глобального классификатора"""
+
+    @pytest.fixture(autouse=True)
+    def reset_classifier(self, tmp_path):
+        """Сбрасываем глобальный экземпляр и используем временный файл модели"""
+        with patch.object(category_classifier, '_classifier', None), \
+                patch.object(category_classifier, '_classifier_bootstrapped', False), \
+                patch('utils.category_classifier.MODEL_FILE_PATH', str(tmp_path / "model.pkl")):
+            yield
+
+    def test_get_classifier_returns_shared_instance(self):
+        """Проверяем, что классификатор создается один раз и доступен по старому имени"""
+        first = category_classifier.get_classifier()
+
+        assert category_classifier.get_classifier() is first
+        assert category_classifier.classifier is first
+
+    @pytest.mark.asyncio
+    async def test_bootstrap_loads_keyword_dictionary_once(self):
+        """Проверяем, что bootstrap загружает словарь один раз, если не запрошена перезагрузка"""
+        with patch.object(category_classifier.TransactionCategoryClassifier, 'load') as mock_load:
+            instance = await category_classifier.bootstrap_classifier()
+            await category_classifier.bootstrap_classifier()
+            await category_classifier.bootstrap_classifier(reload=True)
+
+        assert instance is category_classifier.get_classifier()
+        assert mock_load.call_count == 2
@@ -198,4 +198,108 @@ class TestKeywordDictionaryAsync:
             # Проверяем, что данные были загружены
             assert "сахар" in self.keyword_dict.keyword_to_category
             assert self.keyword_dict.keyword_to_category["сахар"].category == "еда"
-            assert self.keyword_dict.keyword_to_category["сахар"].confidence == 0.6
\ No newline at end of file
+            assert self.keyword_dict.keyword_to_category["сахар"].confidence == 0.6
+
+class TestAtomicIndexRebuild:
+    """Тесты для атомарной пересборки индекса и инкрементального режима"""
+
+    INITIAL_ROWS = [
+        ["чай", "напитки", "0.8"],
+        ["кофе", "напитки", "0.9"],
+        ["хлеб белый", "еда", "0.7"],
+    ]
+    CHANGED_ROWS = [
+        ["чай", "напитки", "0.8"],
+        ["кофе", "еда", "0.6"],
+        ["молоко", "еда", "0.9"],
+    ]
+
+    def setup_method(self):
+        self.keyword_dict = KeywordDictionary("test_spreadsheet_id", "test_sheet_name")
+
+    async def _load(self, rows, incremental=True):
+        with patch('sheets.client.get_sheet_data_with_cache', new_callable=AsyncMock) as mock_get_data:
+            mock_get_data.return_value = rows
+            await self.keyword_dict.async_load_from_sheets(incremental=incremental)
+
+    @pytest.mark.asyncio
+    async def test_reload_publishes_new_index_without_mutating_old(self):
+        """Проверяем, что перезагрузка не изменяет опубликованный ранее индекс"""
+        await self._load(self.INITIAL_ROWS)
+        old_index = self.keyword_dict._index
+        old_keywords = set(old_index.keyword_to_category)
+
+        await self._load(self.CHANGED_ROWS)
+
+        assert self.keyword_dict._index is not old_index
+        assert set(old_index.keyword_to_category) == old_keywords
+        assert old_index.keyword_to_category["кофе"].category == "напитки"
+        assert self.keyword_dict.version == old_index.version + 1
+
+    @pytest.mark.asyncio
+    async def test_repeated_loads_do_not_duplicate_entries(self):
+        """Проверяем, что повторные загрузки не накапливают записи в category_keywords"""
+        await self._load(self.INITIAL_ROWS, incremental=False)
+        await self._load(self.INITIAL_ROWS, incremental=False)
+        await self._load(self.INITIAL_ROWS)
+
+        assert len(self.keyword_dict.category_keywords["напитки"]) == 2
+
+    @pytest.mark.asyncio
+    async def test_incremental_reload_matches_full_rebuild(self):
+        """Проверяем, что инкрементальная загрузка дает тот же индекс, что и полная"""
+        await self._load(self.INITIAL_ROWS)
+        await self._load(self.CHANGED_ROWS, incremental=True)
+        incremental = self.keyword_dict._index
+
+        full_dict = KeywordDictionary("test_spreadsheet_id", "test_sheet_name")
+        with patch('sheets.client.get_sheet_data_with_cache', new_callable=AsyncMock) as mock_get_data:
+            mock_get_data.return_value = self.CHANGED_ROWS
+            await full_dict.async_load_from_sheets(incremental=False)
+        full = full_dict._index
+
+        assert incremental.rows() == full.rows()
+        assert {c: {e.keyword for e in entries} for c, entries in incremental.category_keywords.items()} == \
+            {c: {e.keyword for e in entries} for c, entries in full.category_keywords.items()}
+        assert set(incremental.unigram_to_categories) == set(full.unigram_to_categories)
+        assert set(incremental.bigram_to_category) == set(full.bigram_to_category)
+        assert incremental.trigram_keyword_count == full.trigram_keyword_count
+        assert {t: sorted(k) for t, k in incremental.trigram_index.items()} == \
+            {t: sorted(k) for t, k in full.trigram_index.items()}
+
+    @pytest.mark.asyncio
+    async def test_incremental_reload_keeps_unchanged_entries(self):
+        """Проверяем, что неизменившиеся строки не пересоздаются и сохраняют статистику"""
+        await self._load(self.INITIAL_ROWS)
+        tea_entry = self.keyword_dict.keyword_to_category["чай"]
+        self.keyword_dict.get_category_by_keyword("чай")
+
+        with patch('models.keyword_dictionary.KeywordIndex.build') as mock_build:
+            await self._load(self.CHANGED_ROWS)
+
+        mock_build.assert_not_called()
+        assert self.keyword_dict.keyword_to_category["чай"] is tea_entry
+        assert self.keyword_dict.usage.count("чай") == 1
+
+    @pytest.mark.asyncio
+    async def test_unchanged_reload_keeps_published_index(self):
+        """Проверяем, что загрузка без изменений не копирует индекс и не меняет версию"""
+        await self._load(self.INITIAL_ROWS)
+        index = self.keyword_dict._index
+
+        await self._load(self.INITIAL_ROWS)
+
+        assert self.keyword_dict._index is index
+
+    def test_add_keywords_publishes_one_version(self):
+        """Проверяем, что пакет ключевых слов применяется одной копией индекса, а повтор пакета — без копии"""
+        rows = [("чай", "напитки", 0.5), ("кофе", "напитки", 0.5), ("хлеб белый", "еда", 0.5)]
+        version = self.keyword_dict.version
+
+        self.keyword_dict.add_keywords(rows, save_to_sheet=False)
+        index = self.keyword_dict._index
+
+        assert self.keyword_dict.version == version + 1
+        assert {"чай", "кофе", "хлеб белый"} <= set(index.keyword_to_category)
+        assert self.keyword_dict.add_keywords(rows, save_to_sheet=False) == 0
+        assert self.keyword_dict._index is index
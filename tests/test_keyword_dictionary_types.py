@@ -215,4 +215,51 @@ class TestKeywordDictionaryTypeSafety:
                 # Используем фразу, которая будет разбита на слова, включая нашу биграмму
                 words = bigram_key.split()
                 search_phrase = f"{words[0]} {words[1]} что-то"
-                self.keyword_dict.get_category_by_keyword(search_phrase)
\ No newline at end of file
+                self.keyword_dict.get_category_by_keyword(search_phrase)
+
+class TestTrigramIndex:
+    """Тесты для триграммного индекса нечеткого поиска"""
+
+    def setup_method(self):
+        self.keyword_dict = KeywordDictionary("test_spreadsheet_id", "test_sheet_name")
+        self.keyword_dict.add_keyword("молоко", "Еда", confidence=0.9, save_to_sheet=False)
+        self.keyword_dict.add_keyword("бензин", "Транспорт", confidence=0.8, save_to_sheet=False)
+
+    def test_search_similar_tolerates_typos(self):
+        """Проверяем, что поиск находит слово с опечаткой"""
+        result = self.keyword_dict.search_similar_keywords("малоко")
+
+        assert [entry.keyword for entry in result] == ["молоко"]
+
+    def test_only_candidates_with_shared_trigrams_are_scored(self):
+        """Проверяем, что схожесть считается только для кандидатов из индекса"""
+        with patch.object(self.keyword_dict, '_calculate_similarity', wraps=self.keyword_dict._calculate_similarity) as mock_similarity:
+            self.keyword_dict.search_similar_keywords("малоко")
+
+        scored = {call.args[1] for call in mock_similarity.call_args_list}
+        assert "бензин" not in scored
+
+    def test_index_follows_direct_dictionary_changes(self):
+        """Проверяем, что индекс пересобирается при прямом изменении keyword_to_category"""
+        self.keyword_dict.keyword_to_category["кефир"] = KeywordEntry(keyword="кефир", category="Еда", confidence=0.7)
+
+        assert [entry.keyword for entry in self.keyword_dict.search_similar_keywords("кифир")] == ["кефир"]
+
+    def test_trigram_rebuild_does_not_mutate_published_index(self):
+        """Проверяем, что пересборка триграмм публикует новый индекс, не трогая тот, что видят текущие поиски"""
+        old_index = self.keyword_dict._index
+        old_trigrams = {trigram: list(keywords) for trigram, keywords in old_index.trigram_index.items()}
+        self.keyword_dict.keyword_to_category["кефир"] = KeywordEntry(keyword="кефир", category="Еда", confidence=0.7)
+
+        self.keyword_dict.search_similar_keywords("кифир")
+
+        assert self.keyword_dict._index is not old_index
+        assert self.keyword_dict.version == old_index.version + 1
+        assert {trigram: list(keywords) for trigram, keywords in old_index.trigram_index.items()} == old_trigrams
+
+    def test_find_fuzzy_category(self):
+        """Проверяем категорию по слову с опечаткой и уменьшенную уверенность"""
+        category, confidence = self.keyword_dict.find_fuzzy_category("Малоко 3,2% 1л")
+
+        assert category == "Еда"
+        assert 0 < confidence < 0.9
@@ -0,0 +1,130 @@
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+
+from models.category_registry import CategoryRegistry
+from models.keyword_dictionary import KeywordDictionary
+import sheets.client as sheets_client
+import utils.keyword_matcher as keyword_matcher
+from utils.keyword_matcher import AhoCorasickAutomaton, KeywordMatcher, KeywordPattern, get_keyword_matcher
+
+
+class TestAhoCorasickAutomaton:
+    """Тесты для автомата Ахо–Корасик"""
+
+    def test_finds_all_overlapping_matches(self):
+        """Проверяем, что находятся все вхождения, включая вложенные и перекрывающиеся"""
+        automaton = AhoCorasickAutomaton([
+            KeywordPattern("he", "A", 1.0),
+            KeywordPattern("she", "B", 1.0),
+            KeywordPattern("hers", "C", 1.0),
+            KeywordPattern("his", "D", 1.0),
+        ])
+
+        found = {(start, end, pattern.keyword) for start, end, pattern in automaton.find_all("ushers")}
+
+        assert found == {(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")}
+
+    def test_whole_word_patterns_respect_boundaries(self):
+        """Проверяем, что шаблоны из словаря совпадают только целыми словами"""
+        automaton = AhoCorasickAutomaton([KeywordPattern("сыр", "Еда", 1.0, whole_word=True)])
+
+        assert automaton.find_all("сырок глазированный") == []
+        assert [m[2].keyword for m in automaton.find_all("сыр, хлеб")] == ["сыр"]
+
+
+class TestKeywordMatcher:
+    """Тесты для оценки категорий по всем совпадениям"""
+
+    def test_best_category_wins_over_first_match(self):
+        """Проверяем, что выбирается категория с наибольшим суммарным весом, а не первое совпадение"""
+        matcher = KeywordMatcher([
+            KeywordPattern("азс", "Транспорт", 1.0),
+            KeywordPattern("молоко", "Еда", 1.0),
+            KeywordPattern("хлеб", "Еда", 1.0),
+        ])
+
+        category, confidence = matcher.match("АЗС молоко хлеб")
+
+        assert category == "Еда"
+        assert confidence == pytest.approx(2 / 3)
+
+    def test_allowed_categories_filter(self):
+        """Проверяем, что совпадения вне разрешенных категорий игнорируются"""
+        matcher = KeywordMatcher([KeywordPattern("молоко", "Еда", 1.0)])
+
+        assert matcher.match("молоко", allowed_categories={"Транспорт"}) is None
+
+
+class TestMatcherCache:
+    """Тесты пересборки автомата при изменении версии ключевых слов"""
+
+    @pytest.fixture(autouse=True)
+    def registry(self):
+        registry = CategoryRegistry()
+        registry.publish(["Еда", "Транспорт"], [], {"Еда": ["молок"]})
+        with patch.object(keyword_matcher, '_matcher', None), \
+                patch.object(keyword_matcher, '_rebuild_task', None), \
+                patch.object(keyword_matcher, 'CATEGORY_STORAGE', registry):
+            yield registry
+
+    def test_rebuilt_only_when_version_changes(self):
+        """Проверяем, что автомат переиспользуется, пока версия ключевых слов не изменилась"""
+        keyword_dict = KeywordDictionary("test_spreadsheet_id", "test_sheet_name")
+
+        first = get_keyword_matcher(keyword_dict)
+        assert get_keyword_matcher(keyword_dict) is first
+
+        keyword_dict.add_keyword("бензин", "Транспорт", confidence=0.9, save_to_sheet=False)
+        second = get_keyword_matcher(keyword_dict)
+
+        assert second is not first
+        assert second.match("бензин аи-95")[0] == "Транспорт"
+        assert second.match("молоко 3.2%")[0] == "Еда"
+
+    def test_unchanged_keyword_keeps_version(self):
+        """Проверяем, что повторное добавление того же ключевого слова не инвалидирует автомат"""
+        keyword_dict = KeywordDictionary("test_spreadsheet_id", "test_sheet_name")
+        keyword_dict.add_keyword("бензин", "Транспорт", confidence=0.9, save_to_sheet=False)
+        version = keyword_dict.version
+        first = get_keyword_matcher(keyword_dict)
+
+        keyword_dict.add_keyword("Бензин ", "Транспорт", confidence=0.9, save_to_sheet=False)
+
+        assert keyword_dict.version == version
+        assert get_keyword_matcher(keyword_dict) is first
+
+    @pytest.mark.asyncio
+    async def test_stale_matcher_is_rebuilt_off_event_loop(self):
+        """Проверяем, что внутри event loop автомат пересобирается в фоне, а до этого используется прежний"""
+        keyword_dict = KeywordDictionary("test_spreadsheet_id", "test_sheet_name")
+        first = get_keyword_matcher(keyword_dict)
+
+        keyword_dict.add_keyword("бензин", "Транспорт", confidence=0.9, save_to_sheet=False)
+        with patch.object(keyword_matcher, 'KeywordMatcher', wraps=KeywordMatcher) as build:
+            assert get_keyword_matcher(keyword_dict) is first
+            assert build.call_count == 0
+            await keyword_matcher._rebuild_task
+
+        second = get_keyword_matcher(keyword_dict)
+        assert second is not first
+        assert second.match("бензин аи-95")[0] == "Транспорт"
+
+    @pytest.mark.asyncio
+    async def test_category_reload_skips_unchanged_keywords(self, registry):
+        """Проверяем, что повторная загрузка категорий не переносит неизменившиеся ключевые слова в словарь"""
+        keyword_dict = KeywordDictionary("test_spreadsheet_id", "test_sheet_name")
+        classifier = Mock(keyword_dict=keyword_dict)
+        classifier.sync_sheet_keywords = Mock(side_effect=keyword_dict.sync_sheet_keywords)
+        sheet = [["Расход", "Ключевые слова", "Доход"], ["Еда", "молоко, хлеб", "Зарплата"]]
+
+        with patch.object(sheets_client, 'CATEGORY_STORAGE', registry), \
+                patch.object(sheets_client, '_dictionary_keywords_state', ()), \
+                patch.object(sheets_client, 'get_sheet_data_with_cache', AsyncMock(return_value=sheet)), \
+                patch('utils.category_classifier.bootstrap_classifier', AsyncMock(return_value=classifier)):
+            assert await sheets_client.load_categories_from_sheet()
+            version = keyword_dict.version
+            assert await sheets_client.load_categories_from_sheet()
+
+        classifier.sync_sheet_keywords.assert_called_once()
+        assert keyword_dict.version == version
+        assert keyword_matcher._matcher.version[2] == version
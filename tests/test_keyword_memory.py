@@ -0,0 +1,70 @@
+import gc
+import random
+import tracemalloc
+
+from models.keyword_dictionary import CATEGORY_IDS, KeywordEntry, KeywordIndex
+
+# Бюджет памяти на одно ключевое слово вместе со всеми индексами (униграммы, биграммы, триграммы)
+BYTES_PER_KEYWORD_BUDGET = 800
+BENCHMARK_KEYWORDS = 20000
+
+
+def make_rows(count: int):
+    """Синтетические ключевые слова: фразы из 1-2 слов, 30 категорий"""
+    rng = random.Random(1)
+    alphabet = "абвгдежзийклмнопрстуфхцчшщыэюя"
+    words = ["".join(rng.choice(alphabet) for _ in range(rng.randint(4, 9))) for _ in range(3000)]
+    categories = [f"Категория {i}" for i in range(30)]
+    rows = {}
+    while len(rows) < count:
+        keyword = " ".join(rng.choice(words) for _ in range(rng.choice([1, 1, 2])))
+        # Новая строка категории на каждую запись, как при разборе листа
+        rows[keyword] = ("".join(rng.choice(categories)), 0.5)
+    return rows
+
+
+class TestKeywordEntryLayout:
+    """Тесты компактного представления KeywordEntry"""
+
+    def test_entry_has_no_instance_dict(self):
+        """Проверяем, что запись использует __slots__"""
+        entry = KeywordEntry(keyword="кофе", category="напитки", confidence=0.9)
+
+        assert not hasattr(entry, '__dict__')
+
+    def test_categories_are_interned(self):
+        """Проверяем, что одинаковые категории хранятся один раз"""
+        first = KeywordEntry(keyword="чай", category="".join(["напит", "ки"]), confidence=0.9)
+        second = KeywordEntry(keyword="кофе", category="".join(["напи", "тки"]), confidence=0.9)
+
+        assert first.category_id == second.category_id
+        assert first.category is second.category
+        assert CATEGORY_IDS.values[first.category_id] == "напитки"
+
+
+class TestKeywordIndexMemory:
+    """Бенчмарк памяти индекса ключевых слов"""
+
+    def test_bytes_per_keyword(self):
+        """Измеряем память на одно ключевое слово (вместе со строками ключевых слов) и проверяем бюджет"""
+        gc.collect()
+        tracemalloc.start()
+        try:
+            # Строки создаются внутри отслеживаемого участка: индекс хранит их, и они входят в бюджет
+            rows = make_rows(BENCHMARK_KEYWORDS)
+            created_at = 0.0
+            index = KeywordIndex.build(
+                (KeywordEntry(keyword, category, confidence, created_at=created_at)
+                 for keyword, (category, confidence) in rows.items()),
+                version=1
+            )
+            # Промежуточные строки разбора листа индексу не нужны
+            del rows
+            gc.collect()
+            used, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        bytes_per_keyword = used / len(index.keyword_to_category)
+        print(f"KeywordIndex: {bytes_per_keyword:.0f} B/keyword ({len(index.keyword_to_category)} keywords)")
+        assert bytes_per_keyword < BYTES_PER_KEYWORD_BUDGET
@@ -0,0 +1,128 @@
+import pytest
+from unittest.mock import patch, AsyncMock
+
+from models.keyword_dictionary import KeywordDictionary
+from services.repository import TransactionRepository
+from services.keyword_sync_worker import sync_keywords_to_sheet
+
+
+async def make_repository(tmp_path) -> TransactionRepository:
+    repository = TransactionRepository(str(tmp_path / "test.db"))
+    await repository.init_db()
+    return repository
+
+
+class TestKeywordStore:
+    """Тесты локального SQLite-хранилища словаря ключевых слов"""
+
+    def setup_method(self):
+        self.keyword_dict = KeywordDictionary("test_spreadsheet_id", "test_sheet_name")
+
+    @pytest.mark.asyncio
+    async def test_attach_store_warms_index(self, tmp_path):
+        """Проверяем, что индекс прогревается из SQLite без обращения к Google Sheets"""
+        repository = await make_repository(tmp_path)
+        await repository.upsert_keywords([("кофе", "напитки", 0.9, False, True)])
+
+        with patch('sheets.client.get_sheet_data_with_cache', new_callable=AsyncMock) as mock_get_data:
+            loaded = await self.keyword_dict.attach_store(repository)
+
+        mock_get_data.assert_not_called()
+        assert loaded == 1
+        assert self.keyword_dict.get_category_by_keyword("кофе") == ("напитки", 0.9)
+
+    @pytest.mark.asyncio
+    async def test_add_keyword_is_persisted_locally(self, tmp_path):
+        """Проверяем, что новое слово сохраняется в SQLite, а не отправляется в таблицу напрямую"""
+        repository = await make_repository(tmp_path)
+        await self.keyword_dict.attach_store(repository)
+
+        with patch('sheets.client.add_keyword_to_sheet', new_callable=AsyncMock) as mock_sheet:
+            self.keyword_dict.add_keyword("кофе", "напитки", 0.9)
+            await self.keyword_dict.flush_store()
+
+        mock_sheet.assert_not_called()
+        assert ("кофе", "напитки", 0.9, False) in await repository.get_keywords()
+        assert await repository.get_unsynced_keywords() == [("кофе", "напитки", 0.9)]
+
+        restarted = KeywordDictionary("test_spreadsheet_id", "test_sheet_name")
+        await restarted.attach_store(repository)
+        assert restarted.get_category_by_keyword("кофе") == ("напитки", 0.9)
+
+    @pytest.mark.asyncio
+    async def test_reload_keeps_learned_keyword_unsynced(self, tmp_path):
+        """Проверяем, что перезагрузка без записи в таблицу не помечает выученное слово синхронизированным"""
+        repository = await make_repository(tmp_path)
+        await self.keyword_dict.attach_store(repository)
+        self.keyword_dict.add_keyword("кофе", "напитки", 0.9)
+        await self.keyword_dict.flush_store()
+
+        self.keyword_dict.add_keyword("кофе", "напитки", 0.5, save_to_sheet=False)
+        await self.keyword_dict.flush_store()
+
+        assert await repository.get_unsynced_keywords() == [("кофе", "напитки", 0.5)]
+
+    @pytest.mark.asyncio
+    async def test_category_sheet_keywords_are_not_persisted(self, tmp_path):
+        """Проверяем, что слова листа категорий не попадают в SQLite и не возвращаются после перезапуска"""
+        repository = await make_repository(tmp_path)
+        await self.keyword_dict.attach_store(repository)
+
+        self.keyword_dict.sync_sheet_keywords([("бензин", "Транспорт", 0.5)])
+        await self.keyword_dict.flush_store()
+
+        assert self.keyword_dict.get_category_by_keyword("бензин") == ("Транспорт", 0.5)
+        assert await repository.get_keywords() == []
+        restarted = KeywordDictionary("test_spreadsheet_id", "test_sheet_name")
+        await restarted.attach_store(repository)
+        assert "бензин" not in restarted.keyword_to_category
+
+    def test_keyword_removed_from_category_sheet_is_dropped(self):
+        """Проверяем, что удаленное из листа категорий слово убирается, а выученное слово остается"""
+        self.keyword_dict.sync_sheet_keywords([("бензин", "Транспорт", 0.5), ("такси", "Транспорт", 0.5),
+                                               ("кофе", "Кафе", 0.5)])
+        self.keyword_dict.add_keyword("кофе", "Кафе", 0.9, save_to_sheet=False)
+
+        self.keyword_dict.sync_sheet_keywords([("такси", "Транспорт", 0.5)])
+
+        assert "бензин" not in self.keyword_dict.keyword_to_category
+        assert self.keyword_dict.get_category_by_keyword("такси") == ("Транспорт", 0.5)
+        assert self.keyword_dict.get_category_by_keyword("кофе") == ("Кафе", 0.9)
+
+    @pytest.mark.asyncio
+    async def test_sheet_edits_merge_without_overwriting_local_changes(self, tmp_path):
+        """Проверяем, что правки из таблицы переносятся, а несинхронизированные локальные слова сохраняются"""
+        repository = await make_repository(tmp_path)
+        await repository.upsert_keywords([("чай", "напитки", 0.8, False, True)])
+        await self.keyword_dict.attach_store(repository)
+        self.keyword_dict.add_keyword("кофе", "напитки", 0.9)
+
+        with patch('sheets.client.get_sheet_data_with_cache', new_callable=AsyncMock) as mock_get_data:
+            mock_get_data.return_value = [
+                ["чай", "еда", "0.7"],
+                ["кофе", "еда", "0.1"],
+                ["хлеб", "еда", "0.6"],
+            ]
+            await self.keyword_dict.async_load_from_sheets()
+
+        assert self.keyword_dict.get_category_by_keyword("чай") == ("еда", 0.7)
+        assert self.keyword_dict.get_category_by_keyword("хлеб") == ("еда", 0.6)
+        assert self.keyword_dict.get_category_by_keyword("кофе") == ("напитки", 0.9)
+        stored = {row[0]: row[1:3] for row in await repository.get_keywords()}
+        assert stored == {"чай": ("еда", 0.7), "кофе": ("напитки", 0.9), "хлеб": ("еда", 0.6)}
+
+    @pytest.mark.asyncio
+    async def test_sync_pushes_unsynced_keywords_to_sheet(self, tmp_path):
+        """Проверяем, что синхронизация дописывает в таблицу только незеркалированные слова"""
+        repository = await make_repository(tmp_path)
+        await self.keyword_dict.attach_store(repository)
+        self.keyword_dict.add_keyword("кофе", "напитки", 0.9)
+        self.keyword_dict.add_keyword("чай", "напитки", 0.8, save_to_sheet=False)
+
+        with patch('services.keyword_sync_worker.add_keyword_rows_to_sheet', new_callable=AsyncMock) as mock_sheet:
+            mock_sheet.return_value = True
+            assert await sync_keywords_to_sheet(self.keyword_dict, repository) == 1
+            assert await sync_keywords_to_sheet(self.keyword_dict, repository) == 0
+
+        mock_sheet.assert_called_once_with([["кофе", "напитки", 0.9]])
+        assert await repository.get_unsynced_keywords() == []
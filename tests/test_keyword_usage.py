@@ -0,0 +1,96 @@
+import pytest
+from unittest.mock import patch
+
+from models.keyword_dictionary import KeywordDictionary, KeywordEntry
+from models.keyword_usage import KeywordUsageStats
+from services.repository import TransactionRepository
+from services.usage_stats_worker import flush_keyword_usage
+
+
+class TestKeywordUsageStats:
+    """Тесты для счетчиков использования ключевых слов"""
+
+    def test_record_and_drain(self):
+        """Проверяем, что drain возвращает только несброшенные изменения"""
+        stats = KeywordUsageStats()
+        stats.record_many(["чай", "кофе", "чай"], now=100.0)
+
+        assert sorted(stats.drain()) == [("кофе", 1, 100.0), ("чай", 2, 100.0)]
+        assert stats.drain() == []
+        assert stats.count("чай") == 2
+
+    def test_restore_requeues_failed_rows(self):
+        """Проверяем, что неудачный сброс возвращает изменения в очередь"""
+        stats = KeywordUsageStats()
+        stats.record("чай", now=100.0)
+        rows = stats.drain()
+
+        stats.restore(rows)
+
+        assert stats.drain() == [("чай", 1, 100.0)]
+
+
+class TestKeywordDictionaryUsage:
+    """Тесты учета использования при поиске в KeywordDictionary"""
+
+    def setup_method(self):
+        self.keyword_dict = KeywordDictionary("test_spreadsheet_id", "test_sheet_name")
+        self.keyword_dict.add_keyword("кофе", "напитки", 0.9, save_to_sheet=False)
+
+    def test_lookup_does_not_allocate_entries(self):
+        """Проверяем, что поиск по униграммам не создает фиктивные KeywordEntry"""
+        with patch.object(KeywordEntry, '__init__', autospec=True, side_effect=KeywordEntry.__init__) as mock_init:
+            self.keyword_dict.get_category_by_keyword("кофе латте")
+
+        mock_init.assert_not_called()
+        assert self.keyword_dict.get_usage_stats()["кофе"] == 1
+
+    def test_lookup_takes_one_timestamp(self):
+        """Проверяем, что время берется один раз на поиск"""
+        with patch('models.keyword_dictionary.time.time', return_value=100.0) as mock_time:
+            self.keyword_dict.get_categories_by_text("кофе кофе")
+
+        assert mock_time.call_count == 1
+
+    def test_lookup_without_usage_recording(self):
+        """Проверяем, что поиск с record_usage=False не меняет статистику (в т.ч. через леммы)"""
+        self.keyword_dict.get_category_by_keyword("кофе", record_usage=False)
+        self.keyword_dict.get_category_by_keyword("кофе латте", record_usage=False)
+        self.keyword_dict.get_category_by_keyword("кофею", record_usage=False)
+
+        assert self.keyword_dict.get_usage_stats()["кофе"] == 0
+        assert self.keyword_dict.drain_usage() == []
+
+    def test_drain_updates_entries(self):
+        """Проверяем, что при сбросе итоговые значения переносятся в KeywordEntry"""
+        self.keyword_dict.get_category_by_keyword("кофе")
+        entry = self.keyword_dict.keyword_to_category["кофе"]
+        assert entry.usage_count == 0
+
+        self.keyword_dict.drain_usage()
+
+        assert entry.usage_count == 1
+        assert entry.last_used is not None
+
+
+class TestUsagePersistence:
+    """Тесты сохранения статистики в SQLite"""
+
+    @pytest.mark.asyncio
+    async def test_usage_survives_restart(self, tmp_path):
+        """Проверяем, что популярность ключевых слов переживает перезапуск"""
+        repository = TransactionRepository(str(tmp_path / "test.db"))
+        await repository.init_db()
+
+        keyword_dict = KeywordDictionary("test_spreadsheet_id", "test_sheet_name")
+        keyword_dict.add_keyword("кофе", "напитки", 0.9, save_to_sheet=False)
+        keyword_dict.get_category_by_keyword("кофе")
+        keyword_dict.get_category_by_keyword("кофе")
+        assert await flush_keyword_usage(keyword_dict, repository) == 1
+        keyword_dict.get_category_by_keyword("кофе")
+        await flush_keyword_usage(keyword_dict, repository)
+
+        restarted = KeywordDictionary("test_spreadsheet_id", "test_sheet_name")
+        restarted.usage.load(await repository.get_keyword_usage())
+
+        assert restarted.usage.count("кофе") == 3
@@ -147,4 +147,44 @@ class TestLemmatizationIntegration:
         assert isinstance(result, str)
         # Проверяем, что слова остались в строке
         assert "кофе" in result or "коф" in result
-        assert "чай" in result or "ч" in result
\ No newline at end of file
+        assert "чай" in result or "ч" in result
+
+class TestSharedLemmatizer:
+    """
+    Тесты для общего лемматизатора процесса
+    """
+
+    def test_all_consumers_share_one_morph_analyzer(self):
+        """Проверяем, что словарь и классификатор используют один лемматизатор"""
+        from utils.lemmatizer import get_lemmatizer
+        from utils.category_classifier import TransactionCategoryClassifier
+
+        keyword_dict = KeywordDictionary("test_spreadsheet_id", "test_sheet_name")
+        with patch('utils.category_classifier.MODEL_FILE_PATH', "missing_model.pkl"):
+            classifier = TransactionCategoryClassifier(keyword_dict=keyword_dict)
+
+        shared = get_lemmatizer()
+        assert keyword_dict.lemmatizer is shared
+        assert classifier.lemmatizer is shared
+        assert Lemmatizer().morph_analyzer is shared.morph_analyzer
+
+    def test_lemmatize_many_matches_single_words(self):
+        """Проверяем, что пакетная лемматизация совпадает с пословной"""
+        from utils.lemmatizer import get_lemmatizer
+
+        lemmatizer = get_lemmatizer()
+        words = ["молока", "хлеба", "молока", "и"]
+        assert lemmatizer.lemmatize_many(words) == [lemmatizer.lemmatize_word(word) for word in words]
+
+    def test_repeated_words_are_served_from_cache(self):
+        """Проверяем, что повторные слова берутся из кэша"""
+        from utils.lemmatizer import get_lemmatizer
+
+        lemmatizer = get_lemmatizer()
+        if not lemmatizer.morph_analyzer:
+            pytest.skip("pymorphy3 недоступен")
+
+        lemmatizer.lemmatize_word("сметаной")
+        hits_before = Lemmatizer.cache_info().hits
+        lemmatizer.lemmatize_many(["сметаной", "сметаной"])
+        assert Lemmatizer.cache_info().hits == hits_before + 2
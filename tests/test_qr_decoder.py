@@ -0,0 +1,89 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+
+import utils.qr_decoder as qr_decoder
+from models.transaction import CheckData
+from services.receipt_cache import ReceiptCache
+from services.transaction_service import TransactionService
+from utils.qr_decoder import fiscal_receipt_key, parse_fiscal_qr
+from utils.receipt_logic import _build_check_form
+
+QRRAW = "t=20240101T1000&s=150.00&fn=9960440300000000&i=12345&fp=1234567890&n=1"
+
+
+def make_check() -> CheckData:
+    return CheckData(category="Продукты", amount=150.0, comment="молоко")
+
+
+class TestFiscalQr:
+    """Тесты разбора строки фискального QR-кода"""
+
+    def test_parse_fiscal_qr(self):
+        """Проверяем разбор полей и стабильный ключ чека"""
+        fields = parse_fiscal_qr(QRRAW)
+
+        assert fields['s'] == "150.00"
+        assert fiscal_receipt_key(fields) == "9960440300000000:12345:1234567890"
+
+    def test_non_fiscal_qr_is_rejected(self):
+        """Проверяем, что произвольный QR-код (например, ссылка) не принимается за чек"""
+        assert parse_fiscal_qr("https://example.com/?t=1") is None
+        assert parse_fiscal_qr("") is None
+
+    @pytest.mark.asyncio
+    async def test_decode_without_opencv_returns_none(self):
+        """Проверяем, что без OpenCV декодирование просто пропускается"""
+        with patch.object(qr_decoder, 'cv2', None):
+            assert qr_decoder.decode_qr(b"image") is None
+            assert await qr_decoder.decode_qr_async(b"image") is None
+
+    def test_form_uses_qrraw_instead_of_file(self):
+        """Проверяем, что при известном qrraw изображение не загружается"""
+        with patch('utils.receipt_logic.CHECK_API_TOKEN', "token"):
+            qr_form = _build_check_form(b"x" * 1000, QRRAW)
+            file_form = _build_check_form(b"x" * 1000)
+
+        assert [field[0]['name'] for field in qr_form._fields] == ["token", "qrraw"]
+        assert [field[0]['name'] for field in file_form._fields] == ["token", "qrfile"]
+
+
+class TestQrRecognition:
+    """Тесты выбора между qrraw и загрузкой изображения"""
+
+    @pytest.mark.asyncio
+    async def test_decoded_qr_sends_qrraw(self):
+        """Проверяем, что при распознанном QR-коде в API уходит qrraw"""
+        service = TransactionService()
+        service.create_transaction_from_check = AsyncMock(return_value=make_check())
+
+        with patch('services.transaction_service.decode_qr_async', AsyncMock(return_value=QRRAW)):
+            await service.recognize_image(b"image")
+
+        service.create_transaction_from_check.assert_awaited_once_with(None, qrraw=QRRAW)
+
+    @pytest.mark.asyncio
+    async def test_falls_back_to_image_upload(self):
+        """Проверяем загрузку изображения, если QR-код не распознан"""
+        service = TransactionService()
+        service.create_transaction_from_check = AsyncMock(return_value=make_check())
+
+        with patch('services.transaction_service.decode_qr_async', AsyncMock(return_value=None)):
+            await service.recognize_image(b"image")
+
+        service.create_transaction_from_check.assert_awaited_once_with(b"image")
+
+    @pytest.mark.asyncio
+    async def test_different_photos_of_same_receipt_share_cache(self, tmp_path):
+        """Проверяем, что разные фото одного чека распознаются одним вызовом API"""
+        from services.repository import TransactionRepository
+
+        repository = TransactionRepository(str(tmp_path / "test.db"))
+        await repository.init_db()
+        service = TransactionService(receipt_cache=ReceiptCache(repository))
+        service.create_transaction_from_check = AsyncMock(return_value=make_check())
+
+        with patch('services.transaction_service.decode_qr_async', AsyncMock(return_value=QRRAW)):
+            await service.recognize_receipt("photo-1", AsyncMock(return_value=b"first photo"))
+            await service.recognize_receipt("photo-2", AsyncMock(return_value=b"second photo"))
+
+        service.create_transaction_from_check.assert_awaited_once()
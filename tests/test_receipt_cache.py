@@ -0,0 +1,91 @@
+import asyncio
+import time
+import pytest
+from unittest.mock import AsyncMock
+
+from models.transaction import CheckData
+from services.receipt_cache import ReceiptCache, content_cache_key, file_cache_key
+from services.repository import TransactionRepository
+from services.transaction_service import TransactionService
+from utils.exceptions import CheckApiRecognitionError
+
+
+async def make_repository(tmp_path) -> TransactionRepository:
+    repository = TransactionRepository(str(tmp_path / "test.db"))
+    await repository.init_db()
+    return repository
+
+
+def make_check(amount: float = 150.0) -> CheckData:
+    return CheckData(category="Продукты", amount=amount, comment="молоко", items_list="молоко")
+
+
+class TestReceiptCache:
+    """Тесты кэша распознанных чеков"""
+
+    @pytest.mark.asyncio
+    async def test_repeat_receipt_skips_download_and_api(self, tmp_path):
+        """Проверяем, что повтор того же файла не скачивает изображение и не вызывает API"""
+        service = TransactionService(receipt_cache=ReceiptCache(await make_repository(tmp_path)))
+        service.create_transaction_from_check = AsyncMock(return_value=make_check())
+        fetch_image = AsyncMock(return_value=b"image")
+
+        first = await service.recognize_receipt("unique-1", fetch_image)
+        second = await service.recognize_receipt("unique-1", fetch_image)
+
+        assert first == second
+        fetch_image.assert_awaited_once()
+        service.create_transaction_from_check.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_same_content_with_new_file_id_skips_api(self, tmp_path):
+        """Проверяем, что совпадение по хэшу содержимого экономит вызов API"""
+        service = TransactionService(receipt_cache=ReceiptCache(await make_repository(tmp_path)))
+        service.create_transaction_from_check = AsyncMock(return_value=make_check())
+
+        await service.recognize_receipt("unique-1", AsyncMock(return_value=b"image"))
+        await service.recognize_receipt("unique-2", AsyncMock(return_value=b"image"))
+
+        service.create_transaction_from_check.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_share_one_call(self, tmp_path):
+        """Проверяем, что одновременные запросы одного чека выполняются один раз"""
+        cache = ReceiptCache(await make_repository(tmp_path))
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return make_check()
+
+        results = await asyncio.gather(*[cache.get_or_compute("file:same", compute) for _ in range(5)])
+
+        assert calls == 1
+        assert all(result == results[0] for result in results)
+        # Каждый получает собственную копию
+        assert len({id(result) for result in results}) == 5
+
+    @pytest.mark.asyncio
+    async def test_errors_are_shared_but_not_cached(self, tmp_path):
+        """Проверяем, что ошибка передается ожидающим, но следующий запрос повторяет вызов"""
+        cache = ReceiptCache(await make_repository(tmp_path))
+        failing = AsyncMock(side_effect=CheckApiRecognitionError("чек некорректен"))
+
+        with pytest.raises(CheckApiRecognitionError):
+            await cache.get_or_compute("file:bad", failing)
+
+        assert await cache.get_or_compute("file:bad", AsyncMock(return_value=make_check())) == make_check()
+
+    @pytest.mark.asyncio
+    async def test_expired_entries_are_ignored_and_purged(self, tmp_path):
+        """Проверяем TTL записей кэша"""
+        repository = await make_repository(tmp_path)
+        cache = ReceiptCache(repository, ttl=60)
+        await repository.put_cached_receipt(file_cache_key("old"), make_check().model_dump_json(), time.time() - 120)
+        await cache.put(content_cache_key(b"fresh"), make_check())
+
+        assert await cache.get(file_cache_key("old")) is None
+        assert await cache.get(content_cache_key(b"fresh")) == make_check()
+        assert await cache.purge_expired() == 1
@@ -0,0 +1,119 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from datetime import datetime
+from unittest.mock import AsyncMock, patch
+
+from models.transaction import TransactionData
+from services.repository import TransactionRepository
+from services.transaction_service import TransactionService
+from utils.exceptions import DuplicateReceiptError
+from utils.qr_decoder import fiscal_receipt_key, parse_fiscal_qr
+from utils.receipt_logic import raw_receipt_key
+
+QRRAW = "t=20240101T1200&s=100.00&fn=9999078900012345&i=00042&fp=1234567890&n=1"
+KEY = "9999078900012345:42:1234567890"
+
+
+def make_row(receipt_key, user_id=1, amount=100.0) -> tuple:
+    return (user_id, f"user{user_id}", amount, "Продукты", "Расход", "Магазин", receipt_key)
+
+
+def make_transaction(receipt_key, user_id=1) -> TransactionData:
+    return TransactionData(type="Расход", category="Продукты", amount=100.0, comment="молоко",
+                           username=f"user{user_id}", user_id=user_id, receipt_key=receipt_key)
+
+
+@pytest_asyncio.fixture
+async def repository(tmp_path):
+    repository = TransactionRepository(str(tmp_path / "test.db"))
+    await repository.init_db()
+    return repository
+
+
+class TestFiscalKey:
+    """Тесты ключа фискальных реквизитов"""
+
+    def test_qr_and_api_keys_match(self):
+        """Проверяем, что ключ из QR-кода совпадает с ключом из ответа API"""
+        api_key = raw_receipt_key({"fiscalDriveNumber": "9999078900012345", "fiscalDocumentNumber": 42,
+                                   "fiscalSign": 1234567890})
+
+        assert fiscal_receipt_key(parse_fiscal_qr(QRRAW)) == api_key == KEY
+
+
+class TestRecordedReceipts:
+    """Тесты уникальности записанных чеков"""
+
+    @pytest.mark.asyncio
+    async def test_second_save_of_receipt_is_rejected(self, repository):
+        """Проверяем, что чек, записанный одним пользователем, не записывается другим"""
+        await repository.add_transaction(1, "user1", 100.0, "Продукты", "Расход", receipt_key=KEY)
+
+        with pytest.raises(DuplicateReceiptError) as error:
+            await repository.add_transaction(2, "user2", 100.0, "Продукты", "Расход", receipt_key=KEY)
+
+        assert error.value.username == "user1"
+        assert len(await repository.get_unsynced()) == 1
+
+    @pytest.mark.asyncio
+    async def test_split_receipt_is_recorded_once(self, repository):
+        """Проверяем, что части сплита одного чека записываются вместе и блокируют повтор"""
+        await repository.add_transactions([make_row(KEY, amount=60.0), make_row(KEY, amount=40.0)])
+
+        with pytest.raises(DuplicateReceiptError):
+            await repository.add_transactions([make_row("other"), make_row(KEY)])
+
+        assert [row['amount'] for row in await repository.get_unsynced()] == [60.0, 40.0]
+        assert await repository.get_recorded_receipt("other") is None
+
+    @pytest.mark.asyncio
+    async def test_undo_releases_receipt(self, repository):
+        """Проверяем, что после удаления транзакции чек можно записать снова"""
+        await repository.add_transaction(1, "user1", 100.0, "Продукты", "Расход", receipt_key=KEY)
+        today = datetime.utcnow().strftime('%Y-%m-%d')
+
+        assert await repository.delete_transaction_by_details("1", today, "", 100.0)
+        assert await repository.get_recorded_receipt(KEY) is None
+        await repository.add_transaction(1, "user1", 100.0, "Продукты", "Расход", receipt_key=KEY)
+
+    @pytest.mark.asyncio
+    async def test_existing_receipts_are_migrated(self, repository):
+        """Проверяем заполнение таблицы записанных чеков для старой базы"""
+        async with repository._get_connection() as db:
+            await db.execute("DROP TABLE recorded_receipts")
+            await db.execute(
+                "INSERT INTO transactions (user_id, username, amount, category, type, receipt_key) VALUES (1, 'old', 1, 'Продукты', 'Расход', ?)",
+                (KEY,)
+            )
+            await db.commit()
+
+        await repository.init_db()
+
+        assert (await repository.get_recorded_receipt(KEY))['username'] == "old"
+
+
+class TestDuplicateDetection:
+    """Тесты раннего обнаружения повторного чека"""
+
+    @pytest.mark.asyncio
+    async def test_recorded_qr_receipt_skips_api(self, repository):
+        """Проверяем, что записанный чек с распознанным QR-кодом отклоняется без вызова API"""
+        service = TransactionService(repository=repository, training_queue=asyncio.Queue())
+        await service.finalize_transaction(make_transaction(KEY))
+        service.create_transaction_from_check = AsyncMock()
+
+        with patch('services.transaction_service.decode_qr_async', AsyncMock(return_value=QRRAW)):
+            with pytest.raises(DuplicateReceiptError):
+                await service.recognize_image(b"image")
+
+        service.create_transaction_from_check.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_duplicate_album_keeps_batch_error_type(self, repository):
+        """Проверяем, что повтор в пакетной записи сообщается как DuplicateReceiptError"""
+        service = TransactionService(repository=repository, training_queue=asyncio.Queue())
+        await service.finalize_transaction(make_transaction(KEY))
+
+        with pytest.raises(DuplicateReceiptError):
+            await service.finalize_transactions([make_transaction("other"), make_transaction(KEY, user_id=2)])
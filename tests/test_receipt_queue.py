@@ -0,0 +1,87 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from services.receipt_queue import (
+    ReceiptJob, ReceiptJobQueue, run_receipt_job,
+    STAGE_DONE, STAGE_DOWNLOADING, STAGE_FAILED, STAGE_RECOGNIZING,
+)
+from services.transaction_service import TransactionService
+from utils.exceptions import SchedulerQueueFull
+
+
+class TestReceiptJobQueue:
+    """Тесты очереди обработки чеков"""
+
+    @pytest.mark.asyncio
+    async def test_workers_process_jobs_concurrently(self):
+        """Проверяем, что задачи выполняются параллельно, но не больше числа слотов"""
+        queue = ReceiptJobQueue(workers=3, per_user_limit=3)
+        running = peak = 0
+
+        async def run(job):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.05)
+            running -= 1
+
+        jobs = [ReceiptJob(user_id=1, run=run) for _ in range(6)]
+        for job in jobs:
+            queue.submit(job)
+
+        await asyncio.wait_for(queue.join(), 2)
+
+        assert peak == 3
+        assert all(job.stage == STAGE_DONE for job in jobs)
+
+    @pytest.mark.asyncio
+    async def test_full_queue_rejects_job(self):
+        """Проверяем отказ при переполнении очереди вместо неограниченного роста"""
+        queue = ReceiptJobQueue(maxsize=1, workers=1)
+        blocker = asyncio.Event()
+        queue.submit(ReceiptJob(user_id=1, run=lambda job: blocker.wait()))
+        queue.submit(ReceiptJob(user_id=2, run=AsyncMock()))
+
+        with pytest.raises(SchedulerQueueFull):
+            queue.submit(ReceiptJob(user_id=3, run=AsyncMock()))
+        await queue.close()
+
+    @pytest.mark.asyncio
+    async def test_stage_updates_are_reported_once(self):
+        """Проверяем уведомления об этапах и статус ошибки"""
+        on_stage = AsyncMock()
+
+        async def run(job):
+            await job.set_stage(STAGE_DOWNLOADING)
+            await job.set_stage(STAGE_DOWNLOADING)
+            await job.set_stage(STAGE_RECOGNIZING)
+            raise RuntimeError("сбой")
+
+        job = ReceiptJob(user_id=1, run=run, on_stage=on_stage)
+        await run_receipt_job(job)
+
+        assert [call.args[1] for call in on_stage.await_args_list] == [STAGE_DOWNLOADING, STAGE_RECOGNIZING, STAGE_FAILED]
+
+
+class TestCheckApiConcurrency:
+    """Тесты глобального лимита запросов к API чеков"""
+
+    @pytest.mark.asyncio
+    async def test_check_api_calls_are_capped(self):
+        """Проверяем, что одновременных запросов к API не больше лимита"""
+        service = TransactionService(check_api_limit=asyncio.Semaphore(2))
+        running = peak = 0
+
+        async def fake_api(*args, **kwargs):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.02)
+            running -= 1
+            return {"totalSum": 10000, "user": "Магазин", "items": [{"name": "молоко", "sum": 10000}]}
+
+        with patch('services.transaction_service.fetch_check_json', fake_api):
+            await asyncio.gather(*[service.create_transaction_from_check(b"image") for _ in range(6)])
+
+        assert peak == 2
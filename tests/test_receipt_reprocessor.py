@@ -0,0 +1,206 @@
+import pytest
+import pytest_asyncio
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from models.category_registry import CategoryRegistry
+from services.receipt_reprocessor import reprocess_receipts
+from services.repository import TransactionRepository
+from utils.receipt_logic import check_data_from_json
+
+
+def make_check_json(document: int, name: str = "Молоко 1л") -> dict:
+    return {
+        "user": "Магазин",
+        "totalSum": 10000,
+        "ecashTotalSum": 10000,
+        "fiscalDriveNumber": "9999078900012345",
+        "fiscalDocumentNumber": document,
+        "fiscalSign": 1234567890,
+        "items": [{"name": name, "price": 10000, "quantity": 1, "sum": 10000}] * 20,
+    }
+
+
+def make_row(receipt_key: str, category: str = "Прочее Расход", user_id: int = 1) -> tuple:
+    return (user_id, f"user{user_id}", 100.0, category, "Расход", "Магазин", receipt_key)
+
+
+class FakeClassifier:
+    """Классификатор, уверенно относящий все чеки к одной категории"""
+
+    def __init__(self, category: str, confidence: float = 0.9):
+        self.category = category
+        self.confidence = confidence
+        self.record_usage = []
+
+    def classify_many(self, texts, record_usage=True):
+        self.record_usage.append(record_usage)
+        return [SimpleNamespace(category=self.category, confidence=self.confidence) for _ in texts]
+
+
+@pytest_asyncio.fixture
+async def repository(tmp_path):
+    repository = TransactionRepository(str(tmp_path / "test.db"))
+    await repository.init_db()
+    return repository
+
+
+@pytest.fixture
+def categories():
+    registry = CategoryRegistry()
+    registry.publish(["Продукты", "Прочее Расход"], ["Зарплата"], {})
+    with patch('services.receipt_reprocessor.CATEGORY_STORAGE', registry):
+        yield registry
+
+
+class TestRawReceiptStorage:
+    """Тесты хранения сырых ответов API чеков"""
+
+    def test_fiscal_identity_is_receipt_key(self):
+        """Проверяем, что ключ чека — его фискальные реквизиты"""
+        check = check_data_from_json(make_check_json(42))
+
+        assert check.receipt_key == "9999078900012345:42:1234567890"
+
+    @pytest.mark.asyncio
+    async def test_raw_receipt_roundtrip_is_compressed(self, repository):
+        """Проверяем, что документ сохраняется сжатым, один раз и читается без потерь"""
+        check_json = make_check_json(1)
+        await repository.put_raw_receipt("key", check_json)
+        await repository.put_raw_receipt("key", make_check_json(2))
+
+        assert await repository.get_raw_receipt("key") == check_json
+        async with repository._get_connection() as db:
+            cursor = await db.execute("SELECT length(raw) FROM raw_receipts WHERE receipt_key = 'key'")
+            (size,) = await cursor.fetchone()
+        assert size < len(str(check_json)) / 4
+
+
+class TestReprocessReceipts:
+    """Тесты повторной обработки сохраненных чеков"""
+
+    @pytest.mark.asyncio
+    async def test_dry_run_does_not_change_categories(self, repository, categories):
+        """Проверяем, что без apply категории только подсчитываются"""
+        check_json = make_check_json(1)
+        key = check_data_from_json(check_json).receipt_key
+        await repository.put_raw_receipt(key, check_json)
+        await repository.add_transactions([make_row(key)])
+
+        report = await reprocess_receipts(repository, FakeClassifier("Продукты"), 1)
+
+        assert (report.checked, report.changed) == (1, 1)
+        assert report.changes[("Прочее Расход", "Продукты")] == 1
+        assert [row['category'] for row in await repository.get_unsynced()] == ["Прочее Расход"]
+
+    @pytest.mark.asyncio
+    async def test_apply_updates_categories_in_batches(self, repository, categories):
+        """Проверяем обновление категорий по всем страницам выборки"""
+        for document in range(5):
+            check_json = make_check_json(document)
+            key = check_data_from_json(check_json).receipt_key
+            await repository.put_raw_receipt(key, check_json)
+            await repository.add_transactions([make_row(key)])
+
+        report = await reprocess_receipts(repository, FakeClassifier("Продукты"), 1, apply=True, batch_size=2)
+
+        assert report.changed == 5
+        assert {row['category'] for row in await repository.get_unsynced()} == {"Продукты"}
+
+    @pytest.mark.asyncio
+    async def test_uncertain_or_unknown_categories_are_kept(self, repository, categories):
+        """Проверяем, что неуверенный результат и категории вне таблицы не применяются"""
+        check_json = make_check_json(1)
+        key = check_data_from_json(check_json).receipt_key
+        await repository.put_raw_receipt(key, check_json)
+        await repository.add_transactions([make_row(key)])
+
+        uncertain = await reprocess_receipts(repository, FakeClassifier("Продукты", confidence=0.5), 1, apply=True)
+        unknown = await reprocess_receipts(repository, FakeClassifier("Удаленная категория"), 1, apply=True)
+
+        assert (uncertain.changed, unknown.changed) == (0, 0)
+        assert [row['category'] for row in await repository.get_unsynced()] == ["Прочее Расход"]
+
+    @pytest.mark.asyncio
+    async def test_split_receipts_are_skipped(self, repository, categories):
+        """Проверяем, что разделенный на несколько транзакций чек не переклассифицируется"""
+        check_json = make_check_json(1)
+        key = check_data_from_json(check_json).receipt_key
+        await repository.put_raw_receipt(key, check_json)
+        await repository.add_transactions([make_row(key), make_row(key, "Продукты")])
+
+        report = await reprocess_receipts(repository, FakeClassifier("Продукты"), 1, apply=True)
+
+        assert report.checked == 0
+
+    @pytest.mark.asyncio
+    async def test_only_callers_receipts_are_reprocessed(self, repository, categories):
+        """Проверяем, что команда пользователя не меняет категории чеков других пользователей"""
+        for document, user_id in ((1, 1), (2, 2)):
+            check_json = make_check_json(document)
+            key = check_data_from_json(check_json).receipt_key
+            await repository.put_raw_receipt(key, check_json)
+            await repository.add_transactions([make_row(key, user_id=user_id)])
+
+        report = await reprocess_receipts(repository, FakeClassifier("Продукты"), 1, apply=True)
+
+        assert report.changed == 1
+        assert {row['user_id']: row['category'] for row in await repository.get_unsynced()} == \
+            {1: "Продукты", 2: "Прочее Расход"}
+
+    @pytest.mark.asyncio
+    async def test_synced_transactions_are_not_changed(self, repository, categories):
+        """Проверяем, что уже выгруженная в Google Sheets транзакция не меняется и попадает в отчет"""
+        ids = []
+        for document in range(2):
+            check_json = make_check_json(document)
+            key = check_data_from_json(check_json).receipt_key
+            await repository.put_raw_receipt(key, check_json)
+            ids += await repository.add_transactions([make_row(key)])
+        await repository.mark_as_synced(ids[0])
+
+        report = await reprocess_receipts(repository, FakeClassifier("Продукты"), 1, apply=True)
+
+        assert (report.changed, report.synced) == (2, 1)
+        async with repository._get_connection() as db:
+            cursor = await db.execute("SELECT id, category FROM transactions ORDER BY id")
+            rows = dict(await cursor.fetchall())
+        assert rows == {ids[0]: "Прочее Расход", ids[1]: "Продукты"}
+
+    @pytest.mark.asyncio
+    async def test_transaction_synced_during_reprocessing_is_not_changed(self, repository, categories):
+        """Проверяем, что транзакция, выгруженная после выборки, не перезаписывается"""
+        check_json = make_check_json(1)
+        key = check_data_from_json(check_json).receipt_key
+        await repository.put_raw_receipt(key, check_json)
+        (transaction_id,) = await repository.add_transactions([make_row(key)])
+        get_rows = repository.get_receipt_transactions
+
+        async def get_rows_then_sync(*args):
+            rows = await get_rows(*args)
+            if rows:
+                await repository.mark_as_synced(transaction_id)
+            return rows
+
+        with patch.object(repository, 'get_receipt_transactions', side_effect=get_rows_then_sync):
+            report = await reprocess_receipts(repository, FakeClassifier("Продукты"), 1, apply=True)
+
+        assert (report.changed, report.synced) == (1, 1)
+        async with repository._get_connection() as db:
+            cursor = await db.execute("SELECT category FROM transactions WHERE id = ?", (transaction_id,))
+            assert await cursor.fetchone() == ("Прочее Расход",)
+
+    @pytest.mark.asyncio
+    async def test_reprocessing_does_not_record_keyword_usage(self, repository, categories):
+        """Проверяем, что старые чеки классифицируются без учета в статистике ключевых слов"""
+        check_json = make_check_json(1)
+        key = check_data_from_json(check_json).receipt_key
+        await repository.put_raw_receipt(key, check_json)
+        await repository.add_transactions([make_row(key)])
+        classifier = FakeClassifier("Продукты")
+
+        with patch('services.receipt_reprocessor.check_data_from_json', wraps=check_data_from_json) as parse:
+            await reprocess_receipts(repository, classifier, 1)
+
+        assert classifier.record_usage == [False]
+        assert parse.call_args.kwargs == {'record_usage': False}
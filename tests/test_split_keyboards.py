@@ -0,0 +1,101 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from utils.split_keyboards import (
+    SPLIT_PAGE_SIZE,
+    full_mask,
+    get_items_page_keyboard,
+    mask_count,
+    mask_indices,
+    mask_sum,
+    page_count,
+    page_indices,
+)
+
+
+def make_items(count):
+    return [{'name': f"Товар {i}", 'price': float(i), 'quantity': 1.0, 'sum': float(i)} for i in range(count)]
+
+
+class TestSelectionMasks:
+    """Тесты битовых масок выбора товаров"""
+
+    def test_mask_helpers(self):
+        """Проверяем перечисление, подсчет и сумму по маске"""
+        items = make_items(5)
+        mask = 0b10110
+
+        assert list(mask_indices(mask)) == [1, 2, 4]
+        assert mask_count(mask) == 3
+        assert mask_sum(items, mask) == 7.0
+        assert full_mask(5) == 0b11111
+
+    def test_pages_skip_distributed_items(self):
+        """Проверяем, что страницы строятся только по нераспределенным товарам"""
+        remaining = full_mask(25) & ~full_mask(5)  # Первые 5 товаров уже в группах
+
+        assert page_count(remaining) == 2
+        assert page_indices(remaining, 0) == list(range(5, 5 + SPLIT_PAGE_SIZE))
+        assert page_indices(remaining, 1) == list(range(15, 25))
+
+
+class TestItemsPageKeyboard:
+    """Тесты постраничной клавиатуры выбора товаров"""
+
+    def test_large_receipt_is_paginated(self):
+        """Проверяем, что чек на 120 позиций показывается страницами с навигацией"""
+        items = make_items(120)
+        keyboard = get_items_page_keyboard(items, full_mask(120), 0, page=3)
+
+        item_rows = [row for row in keyboard.inline_keyboard if row[0].callback_data.startswith("toggle_item_")]
+        assert len(item_rows) == SPLIT_PAGE_SIZE
+        assert item_rows[0][0].callback_data == "toggle_item_30"
+
+        navigation = keyboard.inline_keyboard[-2]
+        assert [button.callback_data for button in navigation] == ["split_page_2", "split_page_3", "split_page_4"]
+        assert all(len(button.callback_data.encode('utf-8')) <= 64 for row in keyboard.inline_keyboard for button in row)
+
+    def test_selection_marks_and_next_button(self):
+        """Проверяем отметки выбранных товаров и сумму на кнопке 'Далее'"""
+        items = make_items(3)
+        keyboard = get_items_page_keyboard(items, full_mask(3), 0b101, page=0)
+
+        texts = [row[0].text for row in keyboard.inline_keyboard[:3]]
+        assert texts[0].startswith("✅") and texts[1].startswith("⬜") and texts[2].startswith("✅")
+        assert keyboard.inline_keyboard[-1][0].text == "➡ Далее (2 • 2.00)"
+
+    def test_page_markup_is_cached(self):
+        """Проверяем, что повторный запрос той же страницы берет готовую клавиатуру"""
+        items = make_items(30)
+        first = get_items_page_keyboard(items, full_mask(30), 0b1, page=1, session_id="cache-test")
+
+        assert get_items_page_keyboard(items, full_mask(30), 0b1, page=1, session_id="cache-test") is first
+        assert get_items_page_keyboard(items, full_mask(30), 0b11, page=1, session_id="cache-test") is not first
+
+
+class TestToggleSplitItem:
+    """Тесты переключения товара в FSM"""
+
+    @pytest.mark.asyncio
+    async def test_toggle_updates_only_selection(self):
+        """Проверяем, что нажатие меняет только маску выбора и клавиатуру текущей страницы"""
+        from handlers.receipts import toggle_split_item
+
+        items = make_items(40)
+        state = MagicMock()
+        state.get_data = AsyncMock(return_value={
+            'items': items, 'split_id': "toggle-test", 'split_remaining': full_mask(40),
+            'split_selected': 0, 'split_page': 0, 'split_groups': [],
+        })
+        state.update_data = AsyncMock()
+        callback = MagicMock()
+        callback.data = "toggle_item_7"
+        callback.answer = AsyncMock()
+
+        with patch('handlers.receipts.edit_reply_markup', AsyncMock(return_value=True)) as mock_edit, \
+                patch('handlers.receipts.edit_or_send', AsyncMock()) as mock_send:
+            await toggle_split_item(callback, state)
+
+        state.update_data.assert_awaited_once_with(split_selected=1 << 7)
+        mock_edit.assert_awaited_once()
+        mock_send.assert_not_awaited()
@@ -4,47 +4,279 @@
 """
 import re
 import asyncio
-from typing import List, Dict, Tuple, Optional
+from typing import Iterable, List, Dict, Tuple, Optional, Sequence, Union
+from dataclasses import dataclass
 from collections import defaultdict, Counter
 import math
+import heapq
 from datetime import datetime
 import pickle
 import os
-
-try:
-    from pymorphy3 import MorphAnalyzer
-except ImportError:
-    MorphAnalyzer = None
+import threading
+import time
+from collections.abc import Mapping
 
 from models.transaction import TransactionData
 from models.keyword_dictionary import KeywordDictionary
+from utils.lemmatizer import get_lemmatizer
+from utils.text_analysis import AnalyzedText, analyze_text
 from config import logger, KEYWORDS_SPREADSHEET_ID, KEYWORDS_SHEET_NAME
 
 MODEL_FILE_PATH = "category_classifier_model.pkl"
+TOP_KEYWORDS_LIMIT = 10  # Сколько характерных признаков хранить для каждой категории
+# Через сколько обучений топ-признаки всех категорий пересчитываются полностью
+# (инкрементальное обновление приближенное, см. ClassifierModel.update_top_keywords).
+# Полный пересчет стоит O(F log K), F — сумма размеров таблиц признаков всех категорий,
+# поэтому амортизированная стоимость train() — O(затронутых признаков · log K + F / интервал)
+TOP_KEYWORDS_REFRESH_INTERVAL = 100
+# Не чаще одного сохранения модели в pickle за этот период (сек.); остальное сохраняется при остановке
+MODEL_SAVE_INTERVAL = 300
+# Число шардов таблиц признаков: новая версия модели копирует только измененные шарды
+FEATURE_SHARDS = 256
 
 
-class TransactionCategoryClassifier:
+@dataclass(frozen=True)
+class ClassificationResult:
+    """Итог классификации: категория, уверенность и этап, который ее определил ("keyword" или "ml")"""
+    category: str
+    confidence: float
+    source: str = "ml"
+
+    def as_tuple(self) -> Tuple[str, float]:
+        return self.category, self.confidence
+
+
+_EMPTY_SHARD: Dict[str, int] = {}
+
+
+class ShardedCounts(Mapping):
     """
-    Класс для классификации транзакций по категориям на основе машинного обучения
+    Счетчики признаков, разбитые на шарды по хэшу ключа.
+    copy() разделяет шарды с исходником (O(FEATURE_SHARDS)); запись копирует только свой шард,
+    поэтому новая версия модели стоит пропорционально числу измененных признаков, а не размеру модели.
     """
-    def __init__(self, keyword_dict: Optional[KeywordDictionary] = None):
+    __slots__ = ('_shards', '_owned')
+
+    def __init__(self, counts: Optional[Dict[str, int]] = None):
+        self._shards = [_EMPTY_SHARD] * FEATURE_SHARDS
+        self._owned = set()
+        for key, value in (counts or {}).items():
+            self.add(key, value)
+
+    def copy(self) -> "ShardedCounts":
+        new = ShardedCounts.__new__(ShardedCounts)
+        new._shards = list(self._shards)
+        new._owned = set()
+        # Шарды теперь общие: исходник тоже должен копировать их перед записью
+        self._owned = set()
+        return new
+
+    def add(self, key: str, delta: int = 1):
+        index = hash(key) % FEATURE_SHARDS
+        if index not in self._owned:
+            self._shards[index] = dict(self._shards[index])
+            self._owned.add(index)
+        shard = self._shards[index]
+        shard[key] = shard.get(key, 0) + delta
+
+    def get(self, key, default=0):
+        return self._shards[hash(key) % FEATURE_SHARDS].get(key, default)
+
+    def __getitem__(self, key) -> int:
+        # Как defaultdict(int), но без вставки отсутствующего ключа
+        return self.get(key, 0)
+
+    def __contains__(self, key) -> bool:
+        return key in self._shards[hash(key) % FEATURE_SHARDS]
+
+    def __iter__(self):
+        for shard in self._shards:
+            yield from shard
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+
+class ClassifierModel:
+    """
+    Версия состояния ML-модели (частоты признаков и производные счетчики).
+    Опубликованная версия не изменяется: обучение строит новую версию через copy_for_update()
+    и атомарно подменяет ссылку, поэтому предсказания всегда видят согласованное состояние.
+    Таблицы по признакам (ShardedCounts) копируются пошардово, таблицы по категориям малы
+    (число категорий) и копируются целиком.
+    """
+    def __init__(self):
         self.category_keywords = defaultdict(list)  # ключевые слова для каждой категории
-        self.category_features = defaultdict(lambda: defaultdict(int))  # частоты признаков по категориям
-        self.global_features = defaultdict(int)  # частоты признаков глобально
+        self.category_features: Dict[str, ShardedCounts] = {}  # частоты признаков по категориям
+        self.global_features = ShardedCounts()  # частоты признаков глобально
         self.category_transactions_count = defaultdict(int)  # количество транзакций в каждой категории
         self.total_transactions = 0
         self.categories = set()
-        
-        # Инициализация MorphAnalyzer для лемматизации
-        if MorphAnalyzer:
-            try:
-                self.morph_analyzer = MorphAnalyzer()
-            except Exception as e:
-                logger.warning(f"⚠️ Не удалось инициализировать pymorphy3 MorphAnalyzer: {e}")
-                self.morph_analyzer = None
+        # Производные счетчики, поддерживаемые инкрементально (не сохраняются в pickle)
+        self.category_feature_totals = defaultdict(int)  # сумма частот признаков в категории
+        self.feature_category_counts = ShardedCounts()  # в скольких категориях встречается признак
+        self.updates_since_refresh = 0  # обучений после последнего полного пересчета топ-признаков
+        self.version = 0
+
+    def copy_for_update(self, categories) -> "ClassifierModel":
+        """
+        Создает новую версию модели для обучения.
+        Таблицы признаков изменяемых категорий и глобальные счетчики признаков разделяют шарды
+        с текущей версией и копируют шард только при записи в него.
+        """
+        new_model = ClassifierModel()
+        new_model.category_features = dict(self.category_features)
+        for category in categories:
+            if category in self.category_features:
+                new_model.category_features[category] = self.category_features[category].copy()
+        new_model.category_keywords = defaultdict(list, self.category_keywords)
+        new_model.global_features = self.global_features.copy()
+        new_model.category_transactions_count = defaultdict(int, self.category_transactions_count)
+        new_model.total_transactions = self.total_transactions
+        new_model.categories = set(self.categories)
+        new_model.category_feature_totals = defaultdict(int, self.category_feature_totals)
+        new_model.feature_category_counts = self.feature_category_counts.copy()
+        new_model.updates_since_refresh = self.updates_since_refresh
+        new_model.version = self.version + 1
+        return new_model
+
+    def add_features(self, category: str, features: List[str]):
+        """Учитывает признаки одной транзакции в категории"""
+        self.categories.add(category)
+        self.category_transactions_count[category] += 1
+        self.total_transactions += 1
+
+        category_features = self.category_features.get(category)
+        if category_features is None:
+            category_features = self.category_features[category] = ShardedCounts()
+        for feature in features:
+            if category_features[feature] == 0:
+                self.feature_category_counts.add(feature)
+            category_features.add(feature)
+            self.category_feature_totals[category] += 1
+            self.global_features.add(feature)
+
+    def update_top_keywords(self, category: str, features):
+        """
+        Обновляет топ-N признаков категории с учетом только что измененных признаков.
+        Оценки текущих лидеров пересчитываются, кандидаты берутся из затронутых признаков,
+        отбор выполняется ограниченной кучей размера TOP_KEYWORDS_LIMIT.
+        Это приближение: обучение меняет IDF (общее число транзакций, число категорий с признаком)
+        и сумму частот категории, поэтому оценки незатронутых признаков тоже сдвигаются, и признак
+        вне текущего топа может обогнать лидеров. Расхождение с полным пересчетом устраняется
+        refresh_top_keywords() каждые TOP_KEYWORDS_REFRESH_INTERVAL обучений и при загрузке модели.
+        """
+        candidates = set(self.category_keywords.get(category, []))
+        candidates.update(features)
+        self.category_keywords[category] = heapq.nlargest(
+            TOP_KEYWORDS_LIMIT,
+            candidates,
+            key=lambda feature: self.tfidf(feature, category)
+        )
+
+    def rebuild_derived_stats(self):
+        """
+        Полный пересчет производных счетчиков и топ-признаков.
+        Выполняется один раз при загрузке модели, а не при каждом обучении.
+        """
+        self.category_feature_totals = defaultdict(int)
+        feature_category_counts = defaultdict(int)
+        for category, features in self.category_features.items():
+            for feature, count in features.items():
+                if count > 0:
+                    self.category_feature_totals[category] += count
+                    feature_category_counts[feature] += 1
+        self.feature_category_counts = ShardedCounts(feature_category_counts)
+
+        self.refresh_top_keywords()
+
+    def refresh_top_keywords(self):
+        """
+        Полный пересчет топ-признаков всех категорий (сбрасывает накопленное расхождение).
+        Стоимость O(F log K) по всем признакам модели; при вызове раз в TOP_KEYWORDS_REFRESH_INTERVAL
+        обучений это добавляет к каждому обучению O(F / TOP_KEYWORDS_REFRESH_INTERVAL) в среднем.
+        Точный инкрементальный топ невозможен: каждое обучение меняет IDF всех признаков.
+        """
+        self.category_keywords = defaultdict(list)
+        for category in self.categories:
+            self.category_keywords[category] = heapq.nlargest(
+                TOP_KEYWORDS_LIMIT,
+                self.category_features.get(category, ()),
+                key=lambda feature: self.tfidf(feature, category)
+            )
+        self.updates_since_refresh = 0
+
+    def tfidf(self, feature: str, category: str) -> float:
+        """
+        Расчет TF-IDF для признака в категории
+        """
+        # Term Frequency в категории
+        category_sum = self.category_feature_totals.get(category, 0)
+        if category_sum == 0:
+            tf = 0  # Если сумма равна нулю, то и частота равна нулю
         else:
-            logger.warning("⚠️ pymorphy3 не установлен, лемматизация будет недоступна")
-            self.morph_analyzer = None
+            tf = self.category_features[category].get(feature, 0) / category_sum if category in self.category_features else 0
+
+        # Inverse Document Frequency
+        category_containing_feature = self.feature_category_counts.get(feature, 0)
+        idf = math.log(self.total_transactions / category_containing_feature) if category_containing_feature > 0 else 0
+
+        return tf * idf
+
+    def to_state(self) -> dict:
+        """Состояние для сохранения в pickle"""
+        return {
+            'category_features': {cat: dict(features) for cat, features in self.category_features.items()},  # Конвертируем defaultdict в dict для pickle
+            'global_features': dict(self.global_features),
+            'category_transactions_count': dict(self.category_transactions_count),
+            'categories': set(self.categories),
+            'total_transactions': self.total_transactions
+        }
+
+    @classmethod
+    def from_state(cls, model_state: dict) -> "ClassifierModel":
+        """Восстановление модели из сохраненного состояния"""
+        model = cls()
+        for cat, features in model_state.get('category_features', {}).items():
+            model.category_features[cat] = ShardedCounts(features)
+        model.global_features = ShardedCounts(model_state.get('global_features', {}))
+        model.category_transactions_count = defaultdict(int, model_state.get('category_transactions_count', {}))
+        model.categories = set(model_state.get('categories', set()))
+        model.total_transactions = model_state.get('total_transactions', 0)
+        model.rebuild_derived_stats()
+        return model
+
+
+def _model_attribute(name: str, doc: str) -> property:
+    """Свойство классификатора, читающее поле текущей опубликованной версии модели"""
+    return property(lambda self: getattr(self._model, name), doc=doc)
+
+
+class TransactionCategoryClassifier:
+    """
+    Класс для классификации транзакций по категориям на основе машинного обучения
+    """
+    category_keywords = _model_attribute('category_keywords', "Ключевые слова для каждой категории")
+    category_features = _model_attribute('category_features', "Частоты признаков по категориям")
+    global_features = _model_attribute('global_features', "Частоты признаков глобально")
+    category_transactions_count = _model_attribute('category_transactions_count', "Количество транзакций в каждой категории")
+    total_transactions = _model_attribute('total_transactions', "Общее количество транзакций")
+    categories = _model_attribute('categories', "Известные категории")
+    category_feature_totals = _model_attribute('category_feature_totals', "Сумма частот признаков в категории")
+    feature_category_counts = _model_attribute('feature_category_counts', "В скольких категориях встречается признак")
+
+    def __init__(self, keyword_dict: Optional[KeywordDictionary] = None):
+        # Текущая опубликованная версия модели; заменяется целиком после обучения
+        self._model = ClassifierModel()
+        # Сериализует построение новых версий (фоновое обучение и learn_keyword)
+        self._model_lock = threading.Lock()
+        # Версия модели, сохраненная в pickle, и время последнего сохранения (для отложенного сохранения)
+        self._saved_version = 0
+        self._last_saved_at = 0.0
+        
+        # Общий для процесса лемматизатор (один MorphAnalyzer и кэш лемм)
+        self.lemmatizer = get_lemmatizer()
+        self.morph_analyzer = self.lemmatizer.morph_analyzer
         
         # Интеграция с новой системой KeywordDictionary
         if keyword_dict is None:
@@ -75,22 +307,32 @@ class TransactionCategoryClassifier:
         except Exception as e:
             logger.error(f"❌ Ошибка при инициализации KeywordDictionary: {e}")
 
-    def save_model(self):
+    def save_model(self, model: Optional[ClassifierModel] = None):
         """Сохранение состояния модели в файл"""
+        model = model or self._model
         try:
-            model_state = {
-                'category_features': dict(self.category_features),  # Конвертируем defaultdict в dict для pickle
-                'global_features': dict(self.global_features),
-                'category_transactions_count': dict(self.category_transactions_count),
-                'categories': self.categories,
-                'total_transactions': self.total_transactions
-            }
             with open(MODEL_FILE_PATH, 'wb') as f:
-                pickle.dump(model_state, f)
+                pickle.dump(model.to_state(), f)
+            self._saved_version = model.version
+            self._last_saved_at = time.monotonic()
             logger.info(f"💾 ML-модель успешно сохранена в {MODEL_FILE_PATH}")
         except Exception as e:
             logger.error(f"❌ Ошибка при сохранении модели: {e}")
 
+    def save_model_if_due(self):
+        """
+        Отложенное сохранение: модель сохраняется целиком, поэтому после обучения она пишется
+        в pickle не чаще раза в MODEL_SAVE_INTERVAL секунд.
+        """
+        if time.monotonic() - self._last_saved_at >= MODEL_SAVE_INTERVAL:
+            self.flush_model()
+
+    def flush_model(self):
+        """Сохраняет модель, если опубликованная версия еще не сохранена (вызывается и при остановке)"""
+        model = self._model
+        if model.version != self._saved_version:
+            self.save_model(model)
+
     def load_model(self):
         """Загрузка состояния модели из файла"""
         if not os.path.exists(MODEL_FILE_PATH):
@@ -100,184 +342,201 @@ class TransactionCategoryClassifier:
             with open(MODEL_FILE_PATH, 'rb') as f:
                 model_state = pickle.load(f)
             
-            # Восстанавливаем defaultdict'ы
-            self.category_features = defaultdict(lambda: defaultdict(int))
-            for cat, features in model_state.get('category_features', {}).items():
-                self.category_features[cat] = defaultdict(int, features)
-                
-            self.global_features = defaultdict(int, model_state.get('global_features', {}))
-            self.category_transactions_count = defaultdict(int, model_state.get('category_transactions_count', {}))
-            self.categories = model_state.get('categories', set())
-            self.total_transactions = model_state.get('total_transactions', 0)
+            self._model = ClassifierModel.from_state(model_state)
+            self._last_saved_at = time.monotonic()
             
             logger.info(f"📂 ML-модель загружена из {MODEL_FILE_PATH} ({self.total_transactions} trx)")
         except Exception as e:
             logger.error(f"❌ Ошибка при загрузке модели: {e}")
          
-    def extract_features(self, text: str) -> List[str]:
+    def extract_features(self, text: Union[str, AnalyzedText]) -> List[str]:
         """
         Извлечение признаков из текста транзакции
         """
-        # Приводим к нижнему регистру и разбиваем на слова
-        text = text.lower()
-        # Убираем цифры и специальные символы, оставляя только слова
-        words = re.findall(r'\b[а-яёa-z]+\b', text)
-        
-        # Лемматизируем слова, если доступен morph_analyzer
-        if self.morph_analyzer:
-            lemmatized_words = []
-            for word in words:
-                if len(word) >= 2:  # лемматизируем только слова длиной 2 символа и более
-                    try:
-                        parsed_word = self.morph_analyzer.parse(word)[0]
-                        lemma = parsed_word.normal_form
-                        lemmatized_words.append(lemma)
-                    except Exception:
-                        # Если лемматизация не удалась, используем исходное слово
-                        lemmatized_words.append(word)
-            words = lemmatized_words
-        
-        # Фильтруем короткие слова и добавляем n-граммы
-        features = []
-        for word in words:
-            if len(word) >= 3:  # добавляем только слова длиной 3 символа и более
-                features.append(word)
-        
-        # Добавляем биграммы (последовательности из 2 слов)
-        for i in range(len(words) - 1):
-            if len(words[i]) >= 2 and len(words[i+1]) >= 2:
-                bigram = f"{words[i]}_{words[i+1]}"
-                features.append(bigram)
-        
-        # Убираем дубликаты
-        return list(set(features))
+        return analyze_text(text).features
+    
+    @staticmethod
+    def transaction_text(transaction: TransactionData) -> str:
+        """Текст транзакции для классификации: комментарий, продавец и список товаров"""
+        return f"{transaction.comment} {transaction.retailer_name} {transaction.items_list}"
     
     def lemmatize_word(self, word: str) -> str:
         """
         Лемматизация отдельного слова
         """
-        if self.morph_analyzer and len(word) >= 2:
-            try:
-                parsed_word = self.morph_analyzer.parse(word)[0]
-                return parsed_word.normal_form
-            except Exception:
-                # Если лемматизация не удалась, возвращаем исходное слово
-                return word
-        return word
+        return self.lemmatizer.lemmatize_word(word)
     
     def lemmatize_text(self, text: str) -> str:
         """
         Лемматизация всего текста
         """
-        if not self.morph_analyzer:
-            return text.lower()
-            
-        words = re.findall(r'\b[а-яёa-z]+\b', text.lower())
-        lemmatized_words = [self.lemmatize_word(word) for word in words]
-        return ' '.join(lemmatized_words)
+        return self.lemmatizer.lemmatize_text(text)
     
     def train(self, transactions: List[TransactionData]):
         """
-        Обучение классификатора на исторических данных
+        Обучение классификатора на исторических данных.
+        Новая версия модели строится в стороне и публикуется одной подменой ссылки.
+        Топ характерных признаков пересчитывается только для затронутых признаков.
         """
         logger.info(f"Начинаю обучение классификатора на {len(transactions)} транзакциях")
         
-        for transaction in transactions:
-            category = transaction.category
-            self.categories.add(category)
-            self.category_transactions_count[category] += 1
-            self.total_transactions += 1
+        # Извлекаем признаки из комментария, названия продавца и списка товаров
+        samples = [
+            (transaction.category, self.extract_features(self.transaction_text(transaction)))
+            for transaction in transactions
+        ]
+        
+        with self._model_lock:
+            # Категория -> признаки, затронутые в этом вызове
+            touched_features = defaultdict(set)
+            for category, features in samples:
+                touched_features[category].update(features)
             
-            # Извлекаем признаки из комментария, названия продавца и списка товаров
-            text = f"{transaction.comment} {transaction.retailer_name} {transaction.items_list}"
-            features = self.extract_features(text)
+            new_model = self._model.copy_for_update(touched_features.keys())
+            for category, features in samples:
+                new_model.add_features(category, features)
             
-            # Обновляем частоты признаков
-            for feature in features:
-                self.category_features[category][feature] += 1
-                self.global_features[feature] += 1
-        
-        # Обновляем ключевые слова для каждой категории
-        for category in self.categories:
-            category_features = self.category_features[category]
-            # Выбираем топ-10 наиболее характерных признаков для категории
-            sorted_features = sorted(
-                category_features.items(), 
-                key=lambda x: self._calculate_tfidf(x[0], category), 
-                reverse=True
-            )
-            self.category_keywords[category] = [feature for feature, _ in sorted_features[:10]]
-        
+            # Обновляем ключевые слова только для затронутых категорий,
+            # а периодически — полностью, чтобы инкрементальный топ не расходился с точным
+            for category, features in touched_features.items():
+                new_model.update_top_keywords(category, features)
+            new_model.updates_since_refresh += 1
+            if new_model.updates_since_refresh >= TOP_KEYWORDS_REFRESH_INTERVAL:
+                new_model.refresh_top_keywords()
+            
+            self._model = new_model
         
-        logger.info(f"Обучение завершено. Обнаружено {len(self.categories)} категорий")
-        self.save_model()
+        logger.info(f"Обучение завершено. Обнаружено {len(new_model.categories)} категорий (версия модели {new_model.version})")
+        self.save_model_if_due()
+    
+    async def train_async(self, transactions: List[TransactionData]):
+        """
+        Обучение в отдельном потоке, чтобы не блокировать event loop.
+        Предсказания продолжают использовать предыдущую версию модели до подмены.
+        """
+        await asyncio.to_thread(self.train, transactions)
     
     def _calculate_tfidf(self, feature: str, category: str) -> float:
         """
         Расчет TF-IDF для признака в категории
         """
-        # Term Frequency в категории
-        category_sum = sum(self.category_features[category].values())
-        if category_sum == 0:
-            tf = 0  # Если сумма равна нулю, то и частота равна нулю
-        else:
-            tf = self.category_features[category][feature] / category_sum
-        
-        # Inverse Document Frequency
-        category_containing_feature = sum(
-            1 for cat in self.categories
-            if self.category_features[cat][feature] > 0
-        )
-        idf = math.log(self.total_transactions / category_containing_feature) if category_containing_feature > 0 else 0
-        
-        return tf * idf
+        return self._model.tfidf(feature, category)
     
     def predict_category(self, transaction: TransactionData) -> Tuple[str, float]:
         """
         Предсказание категории для новой транзакции с возвратом уверенности
         """
-        text = f"{transaction.comment} {transaction.retailer_name} {transaction.items_list}"
+        return self.classify(self.transaction_text(transaction)).as_tuple()
+    
+    def classify(self, text: Union[str, AnalyzedText]) -> ClassificationResult:
+        """
+        Классификация текста: сначала словарь ключевых слов, затем ML.
+        Текст анализируется один раз; все этапы используют один и тот же AnalyzedText.
+        """
+        analyzed = analyze_text(text)
         
         # 1. Сначала проверяем точные совпадения по ключевым словам
         if hasattr(self, 'keyword_dict'):
-            keyword_result = self.keyword_dict.get_category_by_keyword(text)
+            keyword_result = self.keyword_dict.get_category_by_keyword(analyzed)
             if keyword_result:
-                return keyword_result
+                category, confidence = keyword_result
+                return ClassificationResult(category, confidence, source="keyword")
 
         # 2. Если точных совпадений нет, используем ML
-        features = self.extract_features(text)
-        
-        scores = {}
-        has_matching_features = False
-        
-        for category in self.categories:
-            # Счетчик для этой категории
-            category_score = 0
-            category_total_features = sum(self.category_features[category].values())
-            
-            # Оцениваем каждый признак
+        return self._predict_ml(analyzed.features)
+    
+    def classify_many(
+        self, texts: Sequence[Union[str, AnalyzedText]], record_usage: bool = True
+    ) -> List[ClassificationResult]:
+        """
+        Пакетная классификация (например, всех позиций чека).
+        Словарь ключевых слов проверяется для каждого текста, а тексты без совпадений
+        оцениваются ML одним вызовом: веса признаков считаются один раз на весь пакет.
+        С record_usage=False статистика использования ключевых слов не меняется: так классифицируют
+        служебные пакеты и вызовы из рабочих потоков (счетчики KeywordUsageStats не потокобезопасны).
+        """
+        analyzed_texts = [analyze_text(text) for text in texts]
+        results: List[Optional[ClassificationResult]] = [None] * len(analyzed_texts)
+        ml_positions = []
+
+        keyword_dict = getattr(self, 'keyword_dict', None)
+        for position, analyzed in enumerate(analyzed_texts):
+            keyword_result = (
+                keyword_dict.get_category_by_keyword(analyzed, record_usage=record_usage) if keyword_dict is not None else None
+            )
+            if keyword_result:
+                category, confidence = keyword_result
+                results[position] = ClassificationResult(category, confidence, source="keyword")
+            else:
+                ml_positions.append(position)
+
+        ml_results = self._predict_ml_many([analyzed_texts[position].features for position in ml_positions])
+        for position, result in zip(ml_positions, ml_results):
+            results[position] = result
+        return results
+
+    def _predict_ml(self, features: List[str]) -> ClassificationResult:
+        """
+        ML-предсказание категории по признакам текста
+        """
+        return self._predict_ml_many([features])[0]
+
+    def _predict_ml_many(self, feature_lists: Sequence[List[str]]) -> List[ClassificationResult]:
+        """
+        ML-предсказание для пакета текстов.
+        Вклад признака в каждую категорию (вероятность признака с учетом TF-IDF) и априорные
+        вероятности категорий вычисляются один раз и переиспользуются всеми текстами пакета.
+        """
+        # Фиксируем версию модели на время предсказания
+        model = self._model
+        categories = list(model.categories)
+        priors = {
+            category: model.category_transactions_count.get(category, 0) / model.total_transactions
+            if model.total_transactions > 0 else 0
+            for category in categories
+        }
+        feature_weights: Dict[str, Dict[str, float]] = {}
+
+        results = []
+        for features in feature_lists:
+            category_scores = defaultdict(float)
+            has_matching_features = False
             for feature in features:
-                if category_total_features > 0:
-                    # Вероятность признака в данной категории
-                    if self.category_features[category][feature] > 0:
-                        has_matching_features = True
-                        feature_prob = self.category_features[category][feature] / category_total_features
-                        # Добавляем к оценке с использованием TF-IDF
-                        tfidf = self._calculate_tfidf(feature, category)
-                        category_score += feature_prob * (1 + tfidf)
-            
+                weights = feature_weights.get(feature)
+                if weights is None:
+                    weights = feature_weights[feature] = self._feature_weights(model, categories, feature)
+                if weights:
+                    has_matching_features = True
+                    for category, weight in weights.items():
+                        category_scores[category] += weight
             # Учитываем априорную вероятность категории
-            prior_prob = self.category_transactions_count[category] / self.total_transactions if self.total_transactions > 0 else 0
-            scores[category] = category_score + prior_prob
-        
+            scores = {category: category_scores.get(category, 0) + priors[category] for category in categories}
+            results.append(self._result_from_scores(model, scores, has_matching_features))
+        return results
+
+    @staticmethod
+    def _feature_weights(model: ClassifierModel, categories: List[str], feature: str) -> Dict[str, float]:
+        """Вклад признака в оценку каждой категории, где он встречается"""
+        weights = {}
+        for category in categories:
+            category_total_features = model.category_feature_totals.get(category, 0)
+            if category_total_features > 0:
+                count = model.category_features.get(category, {}).get(feature, 0)
+                if count > 0:
+                    # Вероятность признака в данной категории с учетом TF-IDF
+                    weights[category] = count / category_total_features * (1 + model.tfidf(feature, category))
+        return weights
+
+    @staticmethod
+    def _result_from_scores(model: ClassifierModel, scores: Dict[str, float], has_matching_features: bool) -> ClassificationResult:
         if not scores:
             # Если не найдено ни одной подходящей категории, возвращаем наиболее частую
             # Но с нулевой уверенностью, чтобы не подставлять её автоматически, если это не обосновано
-            if self.category_transactions_count:
-                most_common_category = max(self.category_transactions_count, key=self.category_transactions_count.get)
-                return most_common_category, 0.0 # Было 0.5, теперь 0.0
+            if model.category_transactions_count:
+                most_common_category = max(model.category_transactions_count, key=model.category_transactions_count.get)
+                return ClassificationResult(most_common_category, 0.0, source="ml") # Было 0.5, теперь 0.0
             else:
-                return "Прочее Расход", 0.0
+                return ClassificationResult("Прочее Расход", 0.0, source="ml")
         
         # Находим категорию с максимальной оценкой
         best_category = max(scores, key=scores.get)
@@ -286,7 +545,7 @@ class TransactionCategoryClassifier:
         # Если не было совпадений по признакам, значит сработала только априорная вероятность (prior_prob)
         # В этом случае мы не должны быть уверены в прогнозе
         if not has_matching_features:
-            return best_category, 0.0
+            return ClassificationResult(best_category, 0.0, source="ml")
 
         # Нормализуем оценку в диапазон [0, 1]
         if max_score > 0:
@@ -296,7 +555,7 @@ class TransactionCategoryClassifier:
         else:
             confidence = 0.0
             
-        return best_category, confidence
+        return ClassificationResult(best_category, confidence, source="ml")
     
     def suggest_category_with_improvement(self, transaction: TransactionData) -> Tuple[str, float]:
         """
@@ -316,11 +575,11 @@ class TransactionCategoryClassifier:
         """
         return self.keyword_dict.get_categories_by_text(text)
 
-    def get_category_by_keyword(self, keyword: str) -> Optional[Tuple[str, float]]:
+    def get_category_by_keyword(self, keyword: str, record_usage: bool = True) -> Optional[Tuple[str, float]]:
         """
         Получение категории по ключевому слову с использованием KeywordDictionary
         """
-        return self.keyword_dict.get_category_by_keyword(keyword)
+        return self.keyword_dict.get_category_by_keyword(keyword, record_usage=record_usage)
 
     def add_keyword(self, keyword: str, category: str, confidence: float = 0.5, save_to_sheet: bool = True):
         """
@@ -328,6 +587,12 @@ class TransactionCategoryClassifier:
         """
         self.keyword_dict.add_keyword(keyword, category, confidence, save_to_sheet=save_to_sheet)
 
+    def sync_sheet_keywords(self, rows: Iterable[Tuple[str, str, float]]) -> int:
+        """
+        Синхронизация KeywordDictionary с ключевыми словами листа категорий (только в памяти)
+        """
+        return self.keyword_dict.sync_sheet_keywords(rows)
+
     def learn_keyword(self, text: str, category: str):
         """
         Обучение классификатора новому соответствию текста и категории.
@@ -358,19 +623,21 @@ class TransactionCategoryClassifier:
         if lemmatized_text != normalized_text:
             self.add_keyword(lemmatized_text, category, save_to_sheet=False)  # Не сохраняем лемму отдельно в Google Sheets
         
-        # Обновляем локальные данные
-        self.categories.add(category)
-        if hasattr(self, 'category_keywords'):
-            if category not in self.category_keywords:
-                self.category_keywords[category] = []
-            if normalized_text not in self.category_keywords[category]:
-                self.category_keywords[category].append(normalized_text)
+        # Обновляем локальные данные в новой версии модели: опубликованная версия не изменяется
+        with self._model_lock:
+            new_model = self._model.copy_for_update(())
+            new_model.categories.add(category)
+            keywords = list(new_model.category_keywords.get(category, []))
+            if normalized_text not in keywords:
+                keywords.append(normalized_text)
             # Также добавляем лемму, если она отличается
-        if lemmatized_text != normalized_text and lemmatized_text not in self.category_keywords[category]:
-                self.category_keywords[category].append(lemmatized_text)
+            if lemmatized_text != normalized_text and lemmatized_text not in keywords:
+                keywords.append(lemmatized_text)
+            new_model.category_keywords[category] = keywords
+            self._model = new_model
         
         logger.info(f"Добавлено новое ключевое слово: '{normalized_text}' -> '{category}' (с леммой: '{lemmatized_text}')")
-        self.save_model()
+        self.save_model_if_due()
 
     def predict(self, text: str) -> str:
         """
@@ -418,5 +685,42 @@ class TransactionCategoryClassifier:
                 category in self.keyword_dict.category_keywords if hasattr(self.keyword_dict, 'category_keywords') else True)
 
 
-# Глобальный экземпляр классификатора
-classifier = TransactionCategoryClassifier()
\ No newline at end of file
+# Глобальный экземпляр классификатора создается лениво: импорт модуля не загружает
+# MorphAnalyzer, KeywordDictionary и pickle модели
+_classifier: Optional[TransactionCategoryClassifier] = None
+_classifier_lock = threading.Lock()
+_classifier_bootstrapped = False
+
+
+def get_classifier() -> TransactionCategoryClassifier:
+    """Возвращает общий для процесса классификатор (создается при первом обращении)"""
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                _classifier = TransactionCategoryClassifier()
+    return _classifier
+
+
+async def bootstrap_classifier(reload: bool = False, keyword_store=None) -> TransactionCategoryClassifier:
+    """
+    Явная асинхронная инициализация классификатора при старте бота.
+    Тяжелое создание (MorphAnalyzer, загрузка модели) выполняется в отдельном потоке,
+    KeywordDictionary загружается один раз (или повторно при reload=True).
+    Если передано keyword_store (TransactionRepository), словарь сначала прогревается из SQLite.
+    """
+    global _classifier_bootstrapped
+    instance = await asyncio.to_thread(get_classifier)
+    if keyword_store is not None and hasattr(instance.keyword_dict, 'attach_store'):
+        await instance.keyword_dict.attach_store(keyword_store)
+    if reload or not _classifier_bootstrapped:
+        await instance.load()
+        _classifier_bootstrapped = True
+    return instance
+
+
+def __getattr__(name: str):
+    # Совместимость со старым `from utils.category_classifier import classifier`
+    if name == 'classifier':
+        return get_classifier()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
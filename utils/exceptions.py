@@ -38,4 +38,24 @@ class CheckApiTimeout(CheckApiError):
 
 class CheckApiRecognitionError(CheckApiError):
     """Чек не распознан или некорректен."""
-    pass
\ No newline at end of file
+    pass
+class ReceiptDownloadError(BudgetBotError):
+    """Не удалось скачать изображение чека из Telegram."""
+    pass
+
+class SchedulerQueueFull(BudgetBotError):
+    """Очередь дорогих операций (обработка чеков, чтение истории) переполнена."""
+    pass
+
+class UserQueueLimit(SchedulerQueueFull):
+    """У пользователя слишком много запросов в очереди."""
+    pass
+
+class DuplicateReceiptError(TransactionSaveError):
+    """Чек с теми же фискальными реквизитами уже записан."""
+
+    def __init__(self, receipt_key: str, username: str = None, recorded_at: float = None):
+        self.receipt_key = receipt_key
+        self.username = username
+        self.recorded_at = recorded_at
+        super().__init__(f"Чек {receipt_key} уже записан")
@@ -0,0 +1,155 @@
+# utils/image_preprocessing.py
+"""
+Подготовка фото чека перед загрузкой в API чеков.
+Фото с телефона (несколько МБ) уменьшается, переводится в оттенки серого, обрезается
+по области QR-кода (если OpenCV его находит) и пережимается в JPEG до целевого размера.
+Обработка выполняется в пуле процессов, чтобы не занимать event loop и GIL.
+Pillow — необязательная зависимость: без нее изображение отправляется как есть.
+"""
+import asyncio
+import io
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from config import logger
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    ImageOps = None
+
+try:
+    import cv2
+    import numpy as np
+except ImportError:
+    cv2 = None
+    np = None
+
+# Максимальная сторона изображения после уменьшения (пикселей)
+IMAGE_MAX_SIDE = 1600
+# Целевой размер загружаемого файла (байт)
+IMAGE_TARGET_BYTES = 300 * 1024
+# Качество JPEG, перебираемое от большего к меньшему, пока файл не уложится в целевой размер
+JPEG_QUALITY_STEPS = (85, 75, 65, 55)
+# Во сколько раз уменьшать изображение, если даже минимальное качество не помогло
+DOWNSCALE_STEP = 0.75
+MIN_IMAGE_SIDE = 600
+# Поля вокруг найденного QR-кода (доля от его размера)
+QR_CROP_MARGIN = 0.5
+# Процессов в пуле предобработки
+IMAGE_POOL_WORKERS = 2
+
+
+@dataclass(frozen=True)
+class PreprocessedImage:
+    """Результат предобработки: данные для загрузки и статистика"""
+    data: bytes
+    original_bytes: int
+    size: Tuple[int, int] = (0, 0)
+    cropped: bool = False
+    elapsed: float = 0.0
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.original_bytes - len(self.data)
+
+
+def _find_qr_box(gray_image) -> Optional[Tuple[int, int, int, int]]:
+    """Прямоугольник вокруг QR-кода с полями или None (нужен OpenCV)"""
+    if cv2 is None:
+        return None
+    try:
+        found, points = cv2.QRCodeDetector().detect(np.asarray(gray_image))
+    except Exception:
+        return None
+    if not found or points is None:
+        return None
+
+    xs, ys = points[0][:, 0], points[0][:, 1]
+    left, top, right, bottom = float(xs.min()), float(ys.min()), float(xs.max()), float(ys.max())
+    margin = max(right - left, bottom - top) * QR_CROP_MARGIN
+    width, height = gray_image.size
+    box = (
+        max(0, int(left - margin)), max(0, int(top - margin)),
+        min(width, int(right + margin)), min(height, int(bottom + margin)),
+    )
+    if box[2] - box[0] < 50 or box[3] - box[1] < 50:
+        return None
+    return box
+
+
+def _encode_jpeg(image, target_bytes: int) -> bytes:
+    """Пережимает изображение, снижая качество, а затем размер, пока файл не уложится в целевой"""
+    while True:
+        for quality in JPEG_QUALITY_STEPS:
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=quality, optimize=True)
+            if buffer.tell() <= target_bytes:
+                return buffer.getvalue()
+        if min(image.size) * DOWNSCALE_STEP < MIN_IMAGE_SIDE:
+            return buffer.getvalue()
+        image = image.resize((int(image.width * DOWNSCALE_STEP), int(image.height * DOWNSCALE_STEP)), Image.LANCZOS)
+
+
+def preprocess_image(image_bytes: bytes, max_side: int = IMAGE_MAX_SIDE,
+                     target_bytes: int = IMAGE_TARGET_BYTES) -> PreprocessedImage:
+    """Уменьшение, оттенки серого, обрезка по QR-коду и сжатие (блокирующий вызов для пула процессов)"""
+    started = time.perf_counter()
+    if Image is None:
+        return PreprocessedImage(image_bytes, len(image_bytes))
+
+    with Image.open(io.BytesIO(image_bytes)) as source:
+        # Учитываем поворот из EXIF, иначе QR-код на снимке с телефона может оказаться боком
+        image = ImageOps.exif_transpose(source).convert("L")
+
+    box = _find_qr_box(image)
+    if box:
+        image = image.crop(box)
+
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    data = _encode_jpeg(image, target_bytes)
+    if len(data) >= len(image_bytes):
+        # Исходный файл уже компактнее — отправляем его
+        data = image_bytes
+    return PreprocessedImage(data, len(image_bytes), image.size, bool(box), time.perf_counter() - started)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_preprocess_pool() -> ProcessPoolExecutor:
+    """Пул процессов предобработки (создается при первом использовании)"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=IMAGE_POOL_WORKERS)
+    return _pool
+
+
+def shutdown_preprocess_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def preprocess_image_async(image_bytes: bytes) -> PreprocessedImage:
+    """Предобработка в пуле процессов; при любой ошибке возвращается исходное изображение"""
+    if Image is None:
+        return PreprocessedImage(image_bytes, len(image_bytes))
+    try:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(get_preprocess_pool(), preprocess_image, image_bytes)
+    except Exception as e:
+        logger.warning(f"⚠️ Предобработка изображения не удалась, отправляем исходное: {e}")
+        return PreprocessedImage(image_bytes, len(image_bytes))
+
+    logger.info(
+        f"🖼️ Изображение чека: {result.original_bytes // 1024} КБ -> {len(result.data) // 1024} КБ "
+        f"за {result.elapsed * 1000:.0f} мс{' (обрезано по QR-коду)' if result.cropped else ''}"
+    )
+    return result
@@ -1,10 +1,15 @@
 # utils/keyboards.py
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters.callback_data import CallbackData
-from typing import Optional
+from typing import Dict, Optional, Tuple
 from dataclasses import dataclass
 from datetime import datetime
 from config import CATEGORY_STORAGE
+from models.category_registry import CategoryChange, CategoryRegistry, CategorySnapshot
+from utils.messages import MSG
+
+# Ограничение Telegram на размер callback_data (в байтах)
+CALLBACK_DATA_LIMIT = 64
 
 
 class HistoryCallbackData(CallbackData, prefix="history"):
@@ -13,6 +18,94 @@ class HistoryCallbackData(CallbackData, prefix="history"):
     direction: str  # 'prev' или 'next'
 
 
+def category_callback_data(prefix: str, category_id: int) -> str:
+    """Компактный callback для кнопки категории: префикс и id категории вместо названия."""
+    data = f"{prefix}_{category_id}"
+    if len(data.encode('utf-8')) > CALLBACK_DATA_LIMIT:
+        raise ValueError(f"callback_data длиннее {CALLBACK_DATA_LIMIT} байт: {data!r}")
+    return data
+
+
+def parse_category_callback(data: str, registry: Optional[CategoryRegistry] = None) -> Optional[str]:
+    """Название категории по callback кнопки; None, если категории больше нет в реестре."""
+    categories = (registry or CATEGORY_STORAGE).snapshot
+    payload = data.split('_', 1)[1] if '_' in data else ''
+    if payload.isdigit():
+        return categories.name_of(int(payload))
+    # Кнопки в старых сообщениях содержат название категории вместо id
+    if payload in categories.expense_set or payload in categories.income_set:
+        return payload
+    return None
+
+
+class CategoryKeyboardCache:
+    """
+    Кэш клавиатур выбора категорий.
+    Клавиатура собирается один раз на версию списка категорий для пары (тип, префикс);
+    при изменении категорий реестр уведомляет кэш, и старые клавиатуры сбрасываются.
+    """
+
+    def __init__(self, registry: CategoryRegistry):
+        self.registry = registry
+        self._keyboards: Dict[Tuple[int, str, str], object] = {}
+        registry.subscribe(self._on_change)
+
+    def _on_change(self, change: CategoryChange):
+        if change.categories_changed:
+            self._keyboards.clear()
+
+    def inline(self, transaction_type: str = "Расход", prefix: str = "cat") -> InlineKeyboardMarkup:
+        categories = self.registry.snapshot
+        key = (categories.categories_version, transaction_type, prefix)
+        keyboard = self._keyboards.get(key)
+        if keyboard is None:
+            keyboard = self._build_inline(categories, transaction_type, prefix)
+            self._keyboards[key] = keyboard
+        return keyboard
+
+    def reply(self, transaction_type: str = "Расход") -> ReplyKeyboardMarkup:
+        """Reply-клавиатура с названиями категорий и кнопкой отмены (для ручного ввода)."""
+        categories = self.registry.snapshot
+        key = (categories.categories_version, transaction_type, "")
+        keyboard = self._keyboards.get(key)
+        if keyboard is None:
+            names = categories.categories_for(transaction_type)
+            keyboard = ReplyKeyboardMarkup(
+                keyboard=[
+                    [KeyboardButton(text=cat) for cat in names[i:i + 2]]
+                    for i in range(0, len(names), 2)
+                ] + [
+                    [KeyboardButton(text=MSG.btn_cancel)]
+                ],
+                resize_keyboard=True,
+                one_time_keyboard=True
+            )
+            self._keyboards[key] = keyboard
+        return keyboard
+
+    @staticmethod
+    def _build_inline(categories: CategorySnapshot, transaction_type: str, prefix: str) -> InlineKeyboardMarkup:
+        buttons = [
+            InlineKeyboardButton(text=cat, callback_data=category_callback_data(prefix, categories.id_of(cat)))
+            for cat in categories.categories_for(transaction_type)
+        ]
+        # Распределяем кнопки по строкам (по 2 в строке)
+        return InlineKeyboardMarkup(inline_keyboard=[buttons[i:i + 2] for i in range(0, len(buttons), 2)])
+
+
+_category_keyboards = CategoryKeyboardCache(CATEGORY_STORAGE)
+
+
+def get_category_inline_keyboard(transaction_type: str = "Расход", prefix: str = "cat") -> InlineKeyboardMarkup:
+    """Кэшированная Inline-клавиатура категорий с callback вида '{prefix}_{id категории}'."""
+    return _category_keyboards.inline(transaction_type, prefix)
+
+
+def get_category_reply_keyboard(transaction_type: str = "Расход") -> ReplyKeyboardMarkup:
+    """Кэшированная Reply-клавиатура категорий для ручного ввода."""
+    return _category_keyboards.reply(transaction_type)
+
+
 @dataclass
 class TransactionDraft:
     """Структура данных для черновика транзакции"""
@@ -88,18 +181,8 @@ def get_transaction_type_keyboard() -> InlineKeyboardMarkup:
 
 
 def get_categories_keyboard(transaction_type: str = "Расход") -> InlineKeyboardMarkup:
-    """Генерирует Inline-клавиатуру с категориями для выбора."""
-    category_list = CATEGORY_STORAGE.expense if transaction_type == "Расход" else CATEGORY_STORAGE.income
-    
-    buttons = [
-        InlineKeyboardButton(text=cat, callback_data=f"cat_{cat}")
-        for cat in category_list
-    ]
-    
-    # Распределяем кнопки по строкам (по 2 в строке)
-    keyboard = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
-    
-    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+    """Возвращает Inline-клавиатуру с категориями для выбора (из кэша по версии реестра)."""
+    return get_category_inline_keyboard(transaction_type, prefix="cat")
 
 
 def get_draft_inline_keyboard(draft: TransactionDraft) -> InlineKeyboardMarkup:
@@ -167,21 +250,6 @@ def get_transaction_type_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
-def get_categories_keyboard(transaction_type: str = "Расход") -> InlineKeyboardMarkup:
-    """Генерирует Inline-клавиатуру с категориями для выбора."""
-    category_list = CATEGORY_STORAGE.expense if transaction_type == "Расход" else CATEGORY_STORAGE.income
-    
-    buttons = [
-        InlineKeyboardButton(text=cat, callback_data=f"cat_{cat}")
-        for cat in category_list
-    ]
-    
-    # Распределяем кнопки по строкам (по 2 в строке)
-    keyboard = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
-    
-    return InlineKeyboardMarkup(inline_keyboard=keyboard)
-
-
 def get_amount_entry_keyboard() -> InlineKeyboardMarkup:
     """Генерирует Inline-клавиатуру с кнопкой 'Без суммы' для ввода суммы."""
     keyboard = [
@@ -0,0 +1,200 @@
+"""
+Модуль для поиска ключевых слов в тексте чека алгоритмом Ахо–Корасик.
+Автомат строится один раз по всем ключевым словам (CATEGORY_STORAGE и KeywordDictionary)
+и находит все вхождения за один линейный проход по тексту.
+"""
+import asyncio
+import threading
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple, Collection
+
+from config import CATEGORY_STORAGE, logger
+
+
+@dataclass(frozen=True)
+class KeywordPattern:
+    """Шаблон для поиска: ключевое слово, его категория и вес"""
+    keyword: str
+    category: str
+    weight: float
+    whole_word: bool = False  # Совпадение только по границам слов
+
+
+class AhoCorasickAutomaton:
+    """
+    Автомат Ахо–Корасик над набором строк.
+    Переходы хранятся в словарях (алфавит кириллицы/латиницы разреженный),
+    у каждого состояния есть суффиксная ссылка и список шаблонов, заканчивающихся в нем.
+    """
+
+    def __init__(self, patterns: Iterable[KeywordPattern]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[KeywordPattern]] = [[]]
+        for pattern in patterns:
+            if pattern.keyword:
+                self._add(pattern)
+        self._build_links()
+
+    def _add(self, pattern: KeywordPattern):
+        state = 0
+        for char in pattern.keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = next_state
+            state = next_state
+        self._output[state].append(pattern)
+
+    def _build_links(self):
+        """Построение суффиксных ссылок обходом в ширину"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                # Шаблоны суффиксного состояния тоже заканчиваются здесь
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find_all(self, text: str) -> List[Tuple[int, int, KeywordPattern]]:
+        """Все вхождения шаблонов в текст: (начало, конец, шаблон)"""
+        matches = []
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern in output[state]:
+                start = index - len(pattern.keyword) + 1
+                if pattern.whole_word and not _is_word_boundary(text, start, index + 1):
+                    continue
+                matches.append((start, index + 1, pattern))
+        return matches
+
+    @property
+    def size(self) -> int:
+        """Количество состояний автомата"""
+        return len(self._goto)
+
+
+def _is_word_boundary(text: str, start: int, end: int) -> bool:
+    return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
+
+
+class KeywordMatcher:
+    """
+    Категоризация текста по всем найденным ключевым словам сразу.
+    Каждое найденное ключевое слово добавляет к своей категории вес, пропорциональный
+    уверенности и числу слов во фразе; побеждает категория с наибольшей суммой.
+    """
+
+    def __init__(self, patterns: Iterable[KeywordPattern], version: Tuple = ()):
+        self.version = version
+        self.automaton = AhoCorasickAutomaton(patterns)
+
+    def score(self, text: str, allowed_categories: Optional[Collection[str]] = None) -> Dict[str, float]:
+        """Суммарные веса категорий по всем совпадениям (каждое ключевое слово учитывается один раз)"""
+        scores: Dict[str, float] = defaultdict(float)
+        seen = set()
+        for _, _, pattern in self.automaton.find_all(text.lower()):
+            if allowed_categories is not None and pattern.category not in allowed_categories:
+                continue
+            key = (pattern.keyword, pattern.category)
+            if key in seen:
+                continue
+            seen.add(key)
+            scores[pattern.category] += pattern.weight * len(pattern.keyword.split())
+        return scores
+
+    def match(self, text: str, allowed_categories: Optional[Collection[str]] = None) -> Optional[Tuple[str, float]]:
+        """Лучшая категория и ее доля в суммарном весе совпадений"""
+        scores = self.score(text, allowed_categories)
+        if not scores:
+            return None
+        category = max(scores, key=scores.get)
+        total = sum(scores.values())
+        return category, (scores[category] / total if total else 0.0)
+
+
+def collect_patterns(keyword_dict=None, categories=None) -> List[KeywordPattern]:
+    """
+    Шаблоны из CATEGORY_STORAGE.keywords (подстроки, как в прежней логике) и
+    из KeywordDictionary (целые слова и фразы с уверенностью из словаря).
+    """
+    categories = categories if categories is not None else CATEGORY_STORAGE.snapshot
+    patterns = [
+        KeywordPattern(keyword=keyword.lower(), category=category, weight=1.0)
+        for category, keywords in categories.keywords.items()
+        for keyword in keywords
+    ]
+    if keyword_dict is not None:
+        for keyword, entry in list(getattr(keyword_dict, 'keyword_to_category', {}).items()):
+            patterns.append(KeywordPattern(keyword=keyword, category=entry.category, weight=entry.confidence, whole_word=True))
+    return patterns
+
+
+_matcher: Optional[KeywordMatcher] = None
+_matcher_lock = threading.Lock()
+# Фоновая пересборка автомата (задача event loop поверх asyncio.to_thread)
+_rebuild_task: Optional[asyncio.Task] = None
+
+
+def _matcher_version(keyword_dict, categories) -> Tuple:
+    return (categories.keywords_version, id(keyword_dict), getattr(keyword_dict, 'version', 0))
+
+
+def _build_matcher(keyword_dict=None) -> KeywordMatcher:
+    """Пересборка автомата, если версия ключевых слов изменилась (выполняется в любом потоке)"""
+    global _matcher
+    with _matcher_lock:
+        # Версия и ключевые слова берутся из одного снимка реестра категорий
+        categories = CATEGORY_STORAGE.snapshot
+        version = _matcher_version(keyword_dict, categories)
+        if _matcher is None or _matcher.version != version:
+            _matcher = KeywordMatcher(collect_patterns(keyword_dict, categories), version=version)
+        return _matcher
+
+
+def get_keyword_matcher(keyword_dict=None) -> KeywordMatcher:
+    """
+    Возвращает скомпилированный автомат; пересобирает его только при изменении
+    версии ключевых слов в CATEGORY_STORAGE или KeywordDictionary.
+    Внутри event loop устаревший автомат не пересобирается синхронно (секунды на больших словарях):
+    пересборка запускается в отдельном потоке, а до ее завершения используется предыдущая версия.
+    """
+    matcher = _matcher
+    if matcher is not None and matcher.version == _matcher_version(keyword_dict, CATEGORY_STORAGE.snapshot):
+        return matcher
+    if matcher is not None and _schedule_rebuild(keyword_dict):
+        return matcher
+    return _build_matcher(keyword_dict)
+
+
+def _schedule_rebuild(keyword_dict) -> bool:
+    """Запускает фоновую пересборку; False, если в текущем потоке нет event loop"""
+    global _rebuild_task
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    if _rebuild_task is None or _rebuild_task.done():
+        _rebuild_task = loop.create_task(refresh_keyword_matcher(keyword_dict))
+    return True
+
+
+async def refresh_keyword_matcher(keyword_dict=None) -> Optional[KeywordMatcher]:
+    """Пересборка автомата в отдельном потоке (после перезагрузки ключевых слов)"""
+    try:
+        return await asyncio.to_thread(_build_matcher, keyword_dict)
+    except Exception as e:
+        logger.error(f"❌ Ошибка пересборки автомата ключевых слов: {e}")
+        return _matcher
@@ -1,8 +1,11 @@
 """
 Модуль для централизованной лемматизации текста.
+Один MorphAnalyzer и один кэш лемм на процесс: все потребители получают общий экземпляр через get_lemmatizer().
 """
-from typing import List
+from typing import List, Iterable, Optional
+from functools import lru_cache
 import re
+import threading
 try:
     from pymorphy3 import MorphAnalyzer
 except ImportError:
@@ -10,55 +13,103 @@ except ImportError:
 
 from config import logger
 
+LEMMA_CACHE_SIZE = 50000  # Максимальное количество слов в LRU-кэше лемм
+
+_morph_analyzer = None
+_morph_analyzer_initialized = False
+_init_lock = threading.Lock()
+_shared_lemmatizer: Optional["Lemmatizer"] = None
+
+
+def get_morph_analyzer():
+    """Возвращает общий для процесса MorphAnalyzer (создается один раз)"""
+    global _morph_analyzer, _morph_analyzer_initialized
+    if _morph_analyzer_initialized:
+        return _morph_analyzer
+
+    with _init_lock:
+        if not _morph_analyzer_initialized:
+            try:
+                if MorphAnalyzer:
+                    _morph_analyzer = MorphAnalyzer()
+                    logger.info("✅ pymorphy3 MorphAnalyzer инициализирован")
+                else:
+                    logger.warning("⚠️ pymorphy3 не установлен, лемматизация будет недоступна")
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось инициализировать pymorphy3 MorphAnalyzer: {e}")
+            _morph_analyzer_initialized = True
+
+    return _morph_analyzer
+
+
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def _cached_lemma(word: str) -> str:
+    """Лемма слова с кэшированием результатов разбора pymorphy3"""
+    try:
+        return _morph_analyzer.parse(word)[0].normal_form
+    except Exception:
+        # Если лемматизация не удалась, возвращаем исходное слово
+        return word
+
 
 class Lemmatizer:
     """
     Класс для лемматизации текста, использующий pymorphy3.
     Предоставляет унифицированный интерфейс для лемматизации слов и текста.
+    Все экземпляры используют общий MorphAnalyzer и общий LRU-кэш лемм.
     """
-    
+
     def __init__(self):
         """Инициализация лемматизатора"""
         self.morph_analyzer = None
         self._initialize_morph_analyzer()
-    
+
     def _initialize_morph_analyzer(self):
         """Метод для инициализации morph_analyzer"""
-        try:
-            if MorphAnalyzer:
-                self.morph_analyzer = MorphAnalyzer()
-                logger.info("✅ pymorphy3 MorphAnalyzer инициализирован")
-            else:
-                logger.warning("⚠️ pymorphy3 не установлен, лемматизация будет недоступна")
-        except Exception as e:
-            logger.warning(f"⚠️ Не удалось инициализировать pymorphy3 MorphAnalyzer: {e}")
-    
+        self.morph_analyzer = get_morph_analyzer()
+
     def lemmatize_word(self, word: str) -> str:
         """
         Лемматизация отдельного слова
         """
         if self.morph_analyzer and len(word) >= 2:
-            try:
-                parsed_word = self.morph_analyzer.parse(word)[0]
-                return parsed_word.normal_form
-            except Exception:
-                # Если лемматизация не удалась, возвращаем исходное слово
-                return word
+            return _cached_lemma(word)
         return word
-    
+
+    def lemmatize_many(self, words: Iterable[str]) -> List[str]:
+        """
+        Пакетная лемматизация слов.
+        Повторяющиеся слова разбираются один раз, остальные берутся из кэша.
+        """
+        if not self.morph_analyzer:
+            return list(words)
+        return [_cached_lemma(word) if len(word) >= 2 else word for word in words]
+
     def lemmatize_text(self, text: str) -> str:
         """
         Лемматизация всего текста
         """
         if not self.morph_analyzer:
             return text.lower()
-            
+
         words = re.findall(r'\b[а-яёa-z]+\b', text.lower())
-        lemmatized_words = [self.lemmatize_word(word) for word in words]
-        return ' '.join(lemmatized_words)
-    
+        return ' '.join(self.lemmatize_many(words))
+
     def lemmatize_words_list(self, words: List[str]) -> List[str]:
         """
         Лемматизация списка слов
         """
-        return [self.lemmatize_word(word) for word in words]
\ No newline at end of file
+        return self.lemmatize_many(words)
+
+    @staticmethod
+    def cache_info():
+        """Статистика LRU-кэша лемм"""
+        return _cached_lemma.cache_info()
+
+
+def get_lemmatizer() -> Lemmatizer:
+    """Возвращает общий для процесса экземпляр Lemmatizer"""
+    global _shared_lemmatizer
+    if _shared_lemmatizer is None:
+        _shared_lemmatizer = Lemmatizer()
+    return _shared_lemmatizer
@@ -26,7 +26,25 @@ class Messages:
     error_getting_file = "❌ **Ошибка!** Не удалось получить файл."
     error_file_too_big = "❌ Размер изображения слишком большой. Пожалуйста, отправьте фото меньше 5 МБ."
     receipt_sending_to_api = "⏳ **Чек получен.** Отправка изображения."
+    receipt_queued = "⏳ **Чек #{job_id}** в очереди, позиция: {position}."
+    receipt_job_stage = "**Чек #{job_id}:** {stage}..."
+    album_queued = "⏳ **Альбом #{job_id}** ({count} фото) в очереди, позиция: {position}."
+    album_recognized = "🧾 **Альбом #{job_id}: распознано {recognized} из {count}**\n\n{details}\n\nИтого: **{total:.2f}** руб."
+    album_failed = "❌ **Альбом #{job_id}: ни один чек не распознан**\n\n{details}\n\nПопробуйте ввести вручную: /new_transaction"
+    receipt_user_queue_full = "⏳ У вас уже много чеков в очереди. Дождитесь их обработки и отправьте остальные."
+    request_queued = "⏳ Запрос в очереди, позиция: {position}."
+    request_queue_full = "⏳ Сейчас слишком много запросов. Попробуйте через минуту."
+    receipt_queue_full = "❌ Сейчас обрабатывается слишком много чеков. Попробуйте отправить фото через минуту."
+    receipt_already_recorded = "ℹ️ Этот чек уже записан{details}. Повторно записывать его не нужно."
+    album_duplicates_skipped = "\n\nУже записанные чеки пропущены: {count}"
     
+    # Повторная обработка чеков
+    reprocess_started = "🔁 Повторно обрабатываю ваши сохраненные чеки..."
+    reprocess_report = "🔁 **Повторная обработка чеков{mode}**\n\nПроверено: {checked}\nИзменится категорий: {changed}\nИз них уже в Google Таблице (не изменяются): {synced}\nОшибок разбора: {failed}"
+    reprocess_dry_run_hint = "\n\nЧтобы применить изменения: /reprocess apply\nОбновятся только транзакции, еще не выгруженные в Google Таблицу."
+    reprocess_applied_hint = "\n\nКатегории обновлены у транзакций, еще не выгруженных в Google Таблицу. Уже выгруженные строки не изменены — поправьте их в таблице вручную при необходимости."
+    reprocess_error = "❌ Ошибка повторной обработки: {error}"
+
     # Undo
     undo_invalid_format = "❌ Неверный формат данных для удаления транзакции."
     undo_success = "✅ Транзакция от {date} {time} на сумму {amount} руб. успешно удалена."
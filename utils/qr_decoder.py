@@ -0,0 +1,85 @@
+# utils/qr_decoder.py
+"""
+Локальное распознавание QR-кода фискального чека.
+QR-код содержит все данные для запроса к API чеков (t, s, fn, i, fp, n), поэтому вместо
+загрузки изображения (до 5 МБ) достаточно отправить короткую строку qrraw.
+Декодирование выполняется OpenCV (необязательная зависимость opencv-python-headless)
+в пуле потоков; если OpenCV не установлен или код не найден, бот загружает изображение как раньше.
+"""
+import asyncio
+from typing import Dict, Optional
+from urllib.parse import parse_qsl
+
+from config import logger
+
+try:
+    import cv2
+    import numpy as np
+except ImportError:
+    cv2 = None
+    np = None
+
+# Обязательные поля фискального QR-кода (дата, сумма, ФН, номер документа, фискальный признак)
+FISCAL_QR_FIELDS = ("t", "s", "fn", "i", "fp")
+# Большие фото уменьшаются до этой стороны: детектор надежнее и быстрее работает на средних размерах
+QR_MAX_SIDE = 1600
+QR_DECODE_TIMEOUT = 5
+
+
+def parse_fiscal_qr(qrraw: str) -> Optional[Dict[str, str]]:
+    """Поля фискального QR-кода или None, если строка на него не похожа"""
+    if not qrraw:
+        return None
+    fields = dict(parse_qsl(qrraw.strip(), keep_blank_values=True))
+    if not all(fields.get(name) for name in FISCAL_QR_FIELDS):
+        return None
+    return fields
+
+
+def fiscal_receipt_key(fields: Dict[str, str]) -> str:
+    """
+    Стабильный идентификатор чека: номер ФН, номер документа и фискальный признак.
+    Номер документа и признак в QR-коде — строки (возможно, с ведущими нулями), в ответе API — числа,
+    поэтому они приводятся к одному виду.
+    """
+    def number(value) -> str:
+        value = str(value).strip()
+        return str(int(value)) if value.isdigit() else value
+
+    return f"{str(fields['fn']).strip()}:{number(fields['i'])}:{number(fields['fp'])}"
+
+
+def decode_qr(image_bytes: bytes) -> Optional[str]:
+    """Декодирует фискальный QR-код на изображении (блокирующий вызов)"""
+    if cv2 is None:
+        return None
+    try:
+        image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            return None
+
+        detector = cv2.QRCodeDetector()
+        candidates = [image]
+        height, width = image.shape[:2]
+        if max(height, width) > QR_MAX_SIDE:
+            scale = QR_MAX_SIDE / max(height, width)
+            candidates.insert(0, cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA))
+
+        for candidate in candidates:
+            qrraw, _, _ = detector.detectAndDecode(candidate)
+            if parse_fiscal_qr(qrraw):
+                return qrraw.strip()
+    except Exception as e:
+        logger.warning(f"⚠️ Ошибка локального распознавания QR-кода: {e}")
+    return None
+
+
+async def decode_qr_async(image_bytes: bytes) -> Optional[str]:
+    """Декодирует QR-код в пуле потоков, не блокируя event loop (OpenCV отпускает GIL)"""
+    if cv2 is None:
+        return None
+    try:
+        return await asyncio.wait_for(asyncio.to_thread(decode_qr, image_bytes), QR_DECODE_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning(f"⚠️ Распознавание QR-кода заняло больше {QR_DECODE_TIMEOUT} сек., загружаем изображение")
+        return None
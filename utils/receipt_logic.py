@@ -1,43 +1,55 @@
 # utils/receipt_logic.py
 import re
+import json
+import hashlib
 import aiohttp
 import asyncio
 from typing import Optional, List
 
 # Импорт из нашей структуры
 from config import CHECK_API_TOKEN, CHECK_API_URL, CHECK_API_TIMEOUT, CATEGORY_STORAGE, logger
-from utils.category_classifier import classifier
+from utils.category_classifier import get_classifier
+from utils.keyword_matcher import get_keyword_matcher
 
-from models.transaction import CheckData
+from models.transaction import CheckData, CheckItem
 from utils.exceptions import CheckApiTimeout, CheckApiRecognitionError
+from utils.qr_decoder import fiscal_receipt_key
 
-def map_category_by_keywords(search_string: str) -> str:
-    """Присваивает категорию на основе ключевых слов в строке поиска."""
-    # Используем новую систему KeywordDictionary для определения категории
-    result = classifier.get_category_by_keyword(search_string)
+def map_category_by_keywords(search_string: str, record_usage: bool = True) -> str:
+    """
+    Присваивает категорию на основе ключевых слов в строке поиска.
+    Все ключевые слова (CATEGORY_STORAGE и KeywordDictionary) ищутся за один проход
+    автоматом Ахо–Корасик, совпадения оцениваются вместе.
+    С record_usage=False поиск по словарю не меняет статистику использования ключевых слов.
+    """
+    classifier = get_classifier()
+    # Один снимок реестра на весь поиск: множество для проверок за O(1)
+    categories = CATEGORY_STORAGE.snapshot
+    allowed_categories = categories.expense_set
+    
+    matcher = get_keyword_matcher(getattr(classifier, 'keyword_dict', None))
+    result = matcher.match(search_string, allowed_categories)
+    if result:
+        return result[0]
+    
+    # Точных совпадений нет: пробуем поиск по леммам в KeywordDictionary
+    result = classifier.get_category_by_keyword(search_string, record_usage=record_usage)
     if result:
         category, confidence = result
         # Проверяем, что категория существует в списке расходов
-        if category in CATEGORY_STORAGE.expense:
+        if category in allowed_categories:
             return category
     
-    # Если новая система не дала результата, используем старую логику
-    normalized_comment = search_string.lower()
+    # Последняя попытка: поиск с опечатками по триграммному индексу ("малоко" -> "молоко")
+    keyword_dict = getattr(classifier, 'keyword_dict', None)
+    if hasattr(keyword_dict, 'find_fuzzy_category'):
+        result = keyword_dict.find_fuzzy_category(search_string)
+        if result and result[0] in allowed_categories:
+            return result[0]
     
-    # Ищем совпадения по ключевым словам в хранилище CATEGORY_STORAGE
-    for category, keywords in CATEGORY_STORAGE.keywords.items():
-        # Проверяем, что категория существует в списке расходов
-        if category in CATEGORY_STORAGE.expense:
-            for keyword in keywords:
-                if keyword in normalized_comment:
-                    return category # Возвращаем первое совпадение
-                
-    # Если совпадений нет, возвращаем последнюю категорию (обычно "Прочее Расход")
-    if CATEGORY_STORAGE.expense:
-        return CATEGORY_STORAGE.expense[-1]
-    else:
-        # Если список расходов пуст, возвращаем стандартную категорию
-        return "Прочее Расход"
+    # Если совпадений нет, возвращаем последнюю категорию (обычно "Прочее Расход"),
+    # а при пустом списке расходов — стандартную категорию
+    return categories.fallback_expense
 
 
 def extract_learnable_keywords(retailer_name: str, items_list_str: str) -> List[str]:
@@ -69,40 +81,140 @@ def extract_learnable_keywords(retailer_name: str, items_list_str: str) -> List[
     return list(set([k.lower() for k in keywords]))
 
 
-async def parse_check_from_api(image_data: bytes, session: Optional[aiohttp.ClientSession] = None) -> CheckData:
+def _build_check_form(image_data: Optional[bytes], qrraw: Optional[str] = None) -> aiohttp.FormData:
+    """Тело запроса к API чеков (FormData одноразовая, поэтому создается на каждую попытку)"""
+    data = aiohttp.FormData()
+    # CHECK_API_TOKEN берется из config.py
+    data.add_field('token', CHECK_API_TOKEN)
+    if qrraw:
+        # Строка из QR-кода, распознанного локально, вместо загрузки изображения
+        data.add_field('qrraw', qrraw)
+    else:
+        data.add_field(
+            'qrfile',
+            image_data,
+            filename='qrimage.jpg',
+            content_type='image/jpeg'
+        )
+    return data
+
+
+def raw_receipt_key(check_json: dict) -> str:
+    """
+    Ключ сырого ответа API: фискальные реквизиты чека (ФН, номер документа, фискальный признак),
+    а если их нет — хэш содержимого.
     """
-    Отправляет файл изображения чека в API Proverkacheka.com и возвращает Pydantic-модель CheckData.
+    fiscal = {
+        'fn': check_json.get('fiscalDriveNumber'),
+        'i': check_json.get('fiscalDocumentNumber'),
+        'fp': check_json.get('fiscalSign'),
+    }
+    if all(fiscal.values()):
+        return fiscal_receipt_key(fiscal)
+    canonical = json.dumps(check_json, ensure_ascii=False, sort_keys=True).encode('utf-8')
+    return f"sha256:{hashlib.sha256(canonical).hexdigest()}"
+
+
+def check_data_from_json(check_json: dict, record_usage: bool = True) -> CheckData:
+    """
+    Разбирает документ чека из ответа API (api_json['data']['json']) в CheckData.
+    Работает локально, поэтому используется и при повторной обработке сохраненных ответов
+    (с record_usage=False: старые чеки не учитываются в статистике ключевых слов).
+    """
+    try:
+        retailer = check_json.get('user', 'Неизвестный Продавец')
+        total_sum_kopecks = check_json.get('totalSum', 0)
+        amount = round(total_sum_kopecks / 100, 2)
+    
+        # Проверяем, что сумма положительная и не превышает разумный лимит
+        if amount <= 0:
+            raise CheckApiRecognitionError('Сумма в чеке должна быть положительной.')
+        if amount > 100000:  # Ограничение максимальной суммы
+            raise CheckApiRecognitionError('Сумма в чеке слишком велика.')
+
+        items = check_json.get('items', [])
+        item_names = [item['name'] for item in items]
+        items_list_str = " | ".join(item_names)
+    
+        # Парсим товары в объекты CheckItem
+        parsed_items = []
+        for item in items:
+            try:
+                parsed_items.append(CheckItem(
+                    name=item['name'],
+                    price=item.get('price', 0) / 100,
+                    quantity=item.get('quantity', 1),
+                    sum=item.get('sum', 0) / 100
+                ))
+            except Exception as e:
+                logger.warning(f"Ошибка парсинга товара чека: {item}. Error: {e}")
+
+        # Определение типа оплаты
+        if check_json.get('ecashTotalSum', 0) > 0:
+            payment_info = "Карта/Электронный платеж"
+        elif check_json.get('cashTotalSum', 0) > 0:
+             payment_info = "Наличные"
+        else:
+            payment_info = "Неизвестно"
+        
+        search_string = retailer.lower() + " " + items_list_str.lower()
+        auto_category = map_category_by_keywords(search_string, record_usage=record_usage)
+
+        # Создаем и возвращаем Pydantic модель
+        return CheckData(
+            category=auto_category,
+            amount=amount,
+            comment=items_list_str,
+            retailer_name=retailer,
+            items_list=items_list_str,
+            items=parsed_items,
+            payment_info=payment_info,
+            check_datetime_str=check_json.get('dateTime'),
+            receipt_key=raw_receipt_key(check_json)
+        )
+    except CheckApiRecognitionError:
+        raise
+    except Exception as e:
+        raise CheckApiRecognitionError(f'Некорректные данные чека: {e}') from e
+
+
+async def parse_check_from_api(
+    image_data: Optional[bytes], session: Optional[aiohttp.ClientSession] = None, qrraw: Optional[str] = None
+) -> CheckData:
+    """
+    Отправляет в API Proverkacheka.com строку QR-кода (qrraw) или файл изображения чека
+    и возвращает Pydantic-модель CheckData.
+    """
+    return check_data_from_json(await fetch_check_json(image_data, session=session, qrraw=qrraw))
+
+
+async def fetch_check_json(
+    image_data: Optional[bytes], session: Optional[aiohttp.ClientSession] = None, qrraw: Optional[str] = None
+) -> dict:
+    """
+    Отправляет в API Proverkacheka.com строку QR-кода (qrraw) или, если ее нет, файл изображения чека
+    и возвращает сырой документ чека (api_json['data']['json']).
     """
     if not CHECK_API_TOKEN:
         logger.error("⛔ CHECK_API_TOKEN не найден.")
         raise CheckApiRecognitionError('API ключ Proverkacheka.com отсутствует.')
 
-    # Подготовим данные для отправки
-    data = aiohttp.FormData()
-    # CHECK_API_TOKEN берется из config.py
-    data.add_field('token', CHECK_API_TOKEN)
-    data.add_field(
-        'qrfile',
-        image_data,
-        filename='qrimage.jpg',
-        content_type='image/jpeg'
-    )
-    
     # Максимальное количество попыток
     max_retries = 5
     retry_count = 0
     
-    while retry_count < max_retries:
-        try:
-            # Используем переданный сеанс или создаем новый
-            session_to_use = session if session is not None else aiohttp.ClientSession()
-            own_session = session is None  # Флаг для определения, нужно ли закрывать сеанс
-            
+    # Один сеанс на все попытки: переданный общий (с пулом соединений) или временный
+    own_session = session is None
+    if own_session:
+        session = aiohttp.ClientSession()
+    
+    try:
+        while retry_count < max_retries:
             try:
                 # CHECK_API_TIMEOUT берется из config.py
                 async with asyncio.timeout(CHECK_API_TIMEOUT):
-                    async with session_to_use.post(CHECK_API_URL, data=data) as response:
-                        
+                    async with session.post(CHECK_API_URL, data=_build_check_form(image_data, qrraw)) as response:
+                    
                         # Обработка специфических HTTP ошибок
                         if response.status == 400:
                             error_text = await response.text()
@@ -119,13 +231,13 @@ async def parse_check_from_api(image_data: bytes, session: Optional[aiohttp.Clie
                         elif response.status == 429:
                             error_text = await response.text()
                             logger.warning(f"⚠️ HTTP Error 429 (Too Many Requests): {error_text}. URL: {CHECK_API_URL}")
-                            
+                        
                             # Используем экспоненциальную задержку с jitter
                             import random
                             base_delay = 10  # базовая задержка в секундах
                             jitter = random.uniform(0, base_delay * 0.1)  # jitter 10% от базовой задержки
                             wait_time = base_delay * (2 ** retry_count) + jitter  # экспоненциальная задержка
-                            
+                        
                             logger.info(f"⚠️ Превышено количество запросов. Повторная попытка через {wait_time:.2f} секунд...")
                             await asyncio.sleep(wait_time)
                             retry_count += 1
@@ -133,13 +245,13 @@ async def parse_check_from_api(image_data: bytes, session: Optional[aiohttp.Clie
                         elif response.status == 500:
                             error_text = await response.text()
                             logger.error(f"❌ HTTP Error 500 (Internal Server Error): {error_text}. URL: {CHECK_API_URL}")
-                            
+                        
                             # Используем экспоненциальную задержку с jitter
                             import random
                             base_delay = 5  # базовая задержка в секундах
                             jitter = random.uniform(0, base_delay * 0.1)
                             wait_time = base_delay * (2 ** retry_count) + jitter
-                            
+                        
                             logger.info(f"⚠️ Внутренняя ошибка сервера. Повторная попытка через {wait_time:.2f} секунд...")
                             await asyncio.sleep(wait_time)
                             retry_count += 1
@@ -147,13 +259,13 @@ async def parse_check_from_api(image_data: bytes, session: Optional[aiohttp.Clie
                         elif response.status == 502:
                             error_text = await response.text()
                             logger.error(f"❌ HTTP Error 502 (Bad Gateway): {error_text}. URL: {CHECK_API_URL}")
-                            
+                        
                             # Используем экспоненциальную задержку с jitter
                             import random
                             base_delay = 5
                             jitter = random.uniform(0, base_delay * 0.1)
                             wait_time = base_delay * (2 ** retry_count) + jitter
-                            
+                        
                             logger.info(f"⚠️ Ошибка шлюза. Повторная попытка через {wait_time:.2f} секунд...")
                             await asyncio.sleep(wait_time)
                             retry_count += 1
@@ -161,13 +273,13 @@ async def parse_check_from_api(image_data: bytes, session: Optional[aiohttp.Clie
                         elif response.status == 503:
                             error_text = await response.text()
                             logger.error(f"❌ HTTP Error 503 (Service Unavailable): {error_text}. URL: {CHECK_API_URL}")
-                            
+                        
                             # Используем экспоненциальную задержку с jitter
                             import random
                             base_delay = 5
                             jitter = random.uniform(0, base_delay * 0.1)
                             wait_time = base_delay * (2 ** retry_count) + jitter
-                            
+                        
                             logger.info(f"⚠️ Сервис недоступен. Повторная попытка через {wait_time:.2f} секунд...")
                             await asyncio.sleep(wait_time)
                             retry_count += 1
@@ -179,60 +291,9 @@ async def parse_check_from_api(image_data: bytes, session: Optional[aiohttp.Clie
 
                         api_json = await response.json()
                         response_code = api_json.get('code')
-                        
+                    
                         if response_code == 1:
-                            check_data = api_json['data']['json']
-                            
-                            retailer = check_data.get('user', 'Неизвестный Продавец')
-                            total_sum_kopecks = check_data.get('totalSum', 0)
-                            amount = round(total_sum_kopecks / 100, 2)
-                            
-                            # Проверяем, что сумма положительная и не превышает разумный лимит
-                            if amount <= 0:
-                                raise CheckApiRecognitionError('Сумма в чеке должна быть положительной.')
-                            if amount > 100000:  # Ограничение максимальной суммы
-                                raise CheckApiRecognitionError('Сумма в чеке слишком велика.')
-
-                            items = check_data.get('items', [])
-                            item_names = [item['name'] for item in items]
-                            items_list_str = " | ".join(item_names)
-                            
-                            # Парсим товары в объекты CheckItem
-                            parsed_items = []
-                            from models.transaction import CheckItem
-                            for item in items:
-                                try:
-                                    parsed_items.append(CheckItem(
-                                        name=item['name'],
-                                        price=item.get('price', 0) / 100,
-                                        quantity=item.get('quantity', 1),
-                                        sum=item.get('sum', 0) / 100
-                                    ))
-                                except Exception as e:
-                                    logger.warning(f"Ошибка парсинга товара чека: {item}. Error: {e}")
-
-                            # Определение типа оплаты
-                            if check_data.get('ecashTotalSum', 0) > 0:
-                                payment_info = "Карта/Электронный платеж"
-                            elif check_data.get('cashTotalSum', 0) > 0:
-                                 payment_info = "Наличные"
-                            else:
-                                payment_info = "Неизвестно"
-                                
-                            search_string = retailer.lower() + " " + items_list_str.lower()
-                            auto_category = map_category_by_keywords(search_string)
-
-                            # Создаем и возвращаем Pydantic модель
-                            return CheckData(
-                                category=auto_category,
-                                amount=amount,
-                                comment=items_list_str,
-                                retailer_name=retailer,
-                                items_list=items_list_str,
-                                items=parsed_items,
-                                payment_info=payment_info,
-                                check_datetime_str=check_data.get('dateTime')
-                            )
+                            return api_json['data']['json']
 
                         else:
                             error_map = {0: "чек некорректен", 2: "данные чека пока не получены", 3: "превышено кол-во запросов", 4: "ожидание перед повторным запросом", 5: "прочее (данные не получены)"}
@@ -246,26 +307,26 @@ async def parse_check_from_api(image_data: bytes, session: Optional[aiohttp.Clie
                 raise # Перебрасываем нашу же ошибку
             except aiohttp.ClientConnectorError as e:
                 logger.error(f"❌ Ошибка подключения к API: {e}. URL: {CHECK_API_URL}")
-                
+            
                 # Используем экспоненциальную задержку с jitter
                 import random
                 base_delay = 5
                 jitter = random.uniform(0, base_delay * 0.1)
                 wait_time = base_delay * (2 ** retry_count) + jitter
-                
+            
                 logger.info(f"⚠️ Ошибка подключения. Повторная попытка через {wait_time:.2f} секунд...")
                 await asyncio.sleep(wait_time)
                 retry_count += 1
                 continue  # Повторная попытка
             except aiohttp.ClientOSError as e:
                 logger.error(f"❌ Сетевая ошибка при обращении к API: {e}. URL: {CHECK_API_URL}")
-                
+            
                 # Используем экспоненциальную задержку с jitter
                 import random
                 base_delay = 5
                 jitter = random.uniform(0, base_delay * 0.1)
                 wait_time = base_delay * (2 ** retry_count) + jitter
-                
+            
                 logger.info(f"⚠️ Сетевая ошибка. Повторная попытка через {wait_time:.2f} секунд...")
                 await asyncio.sleep(wait_time)
                 retry_count += 1
@@ -279,10 +340,10 @@ async def parse_check_from_api(image_data: bytes, session: Optional[aiohttp.Clie
                 import traceback
                 logger.debug(f"Стек вызова: {traceback.format_exc()}")
                 raise CheckApiRecognitionError(f'Критическая ошибка: {e}')
-        finally:
-            # Закрываем сеанс только если создали его сами
-            if own_session:
-                await session_to_use.close()
+    finally:
+        # Закрываем сеанс только если создали его сами
+        if own_session:
+            await session.close()
     
     # Если все попытки исчерпаны
     raise CheckApiRecognitionError(f'Не удалось выполнить запрос к API после {max_retries} попыток')
\ No newline at end of file
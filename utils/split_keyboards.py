@@ -1,34 +1,124 @@
+from collections import OrderedDict
+from typing import Iterator, List, Sequence, Tuple
 
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from models.transaction import CheckItem
+from utils.keyboards import get_category_inline_keyboard
 
-def get_items_keyboard(items: list[CheckItem], selected_indices: set[int]) -> InlineKeyboardMarkup:
-    """Генерирует клавиатуру для выбора товаров."""
-    buttons = []
-    for i, item in enumerate(items):
-        # Если товар уже выбран, ставим галочку
-        mark = "✅" if i in selected_indices else "⬜"
-        # Обрезаем название, если слишком длинное
-        name = item.name[:30] + "..." if len(item.name) > 30 else item.name
-        text = f"{mark} {name} - {item.sum:.2f}"
-        buttons.append([InlineKeyboardButton(text=text, callback_data=f"toggle_item_{i}")])
-    
-    # Кнопки управления
+# Товаров на одной странице интерфейса разделения (Telegram ограничивает размер клавиатуры)
+SPLIT_PAGE_SIZE = 10
+# Сколько собранных страниц держать в кэше
+SPLIT_PAGE_CACHE_SIZE = 256
+
+
+# --- Выбор товаров хранится битовыми масками (int): бит i — товар с индексом i ---
+
+def mask_indices(mask: int) -> Iterator[int]:
+    """Индексы установленных битов по возрастанию"""
+    index = 0
+    while mask:
+        if mask & 1:
+            yield index
+        mask >>= 1
+        index += 1
+
+
+def mask_count(mask: int) -> int:
+    return bin(mask).count("1")
+
+
+def full_mask(size: int) -> int:
+    return (1 << size) - 1
+
+
+def mask_sum(items: Sequence[dict], mask: int) -> float:
+    return sum(items[i]['sum'] for i in mask_indices(mask))
+
+
+def page_count(remaining_mask: int, page_size: int = SPLIT_PAGE_SIZE) -> int:
+    return max(1, -(-mask_count(remaining_mask) // page_size))
+
+
+def page_indices(remaining_mask: int, page: int, page_size: int = SPLIT_PAGE_SIZE) -> List[int]:
+    """Реальные индексы товаров, показанных на странице (только нераспределенные)"""
+    start = page * page_size
+    result = []
+    for position, index in enumerate(mask_indices(remaining_mask)):
+        if position >= start + page_size:
+            break
+        if position >= start:
+            result.append(index)
+    return result
+
+
+def _item_label(item: dict, selected: bool) -> str:
+    mark = "✅" if selected else "⬜"
+    name = item['name']
+    # Обрезаем название, если слишком длинное
+    name = name[:30] + "..." if len(name) > 30 else name
+    return f"{mark} {name} - {item['sum']:.2f}"
+
+
+_page_cache: "OrderedDict[Tuple, InlineKeyboardMarkup]" = OrderedDict()
+
+
+def get_items_page_keyboard(items: Sequence[dict], remaining_mask: int, selected_mask: int,
+                            page: int, session_id: str = "") -> InlineKeyboardMarkup:
+    """
+    Клавиатура одной страницы выбора товаров.
+    Callback товара содержит его реальный индекс в чеке, поэтому карта отображения не нужна.
+    Собранные страницы кэшируются по (сессия, страница, маски), повторное переключение берет готовую.
+    """
+    key = (session_id, page, remaining_mask, selected_mask)
+    if session_id:
+        cached = _page_cache.get(key)
+        if cached is not None:
+            _page_cache.move_to_end(key)
+            return cached
+
+    pages = page_count(remaining_mask)
+    page = min(max(page, 0), pages - 1)
+    buttons = [
+        [InlineKeyboardButton(text=_item_label(items[i], bool(selected_mask >> i & 1)), callback_data=f"toggle_item_{i}")]
+        for i in page_indices(remaining_mask, page)
+    ]
+
+    # Навигация по страницам
+    if pages > 1:
+        navigation = []
+        if page > 0:
+            navigation.append(InlineKeyboardButton(text="◀", callback_data=f"split_page_{page - 1}"))
+        navigation.append(InlineKeyboardButton(text=f"{page + 1}/{pages}", callback_data=f"split_page_{page}"))
+        if page < pages - 1:
+            navigation.append(InlineKeyboardButton(text="▶", callback_data=f"split_page_{page + 1}"))
+        buttons.append(navigation)
+
+    # Кнопки управления (сумма выбранного показывается здесь, чтобы при переключении менять только клавиатуру)
     controls = []
-    if selected_indices:
-        controls.append(InlineKeyboardButton(text=f"➡ Далее ({len(selected_indices)})", callback_data="split_next_step"))
-    
+    if selected_mask:
+        selected_sum = mask_sum(items, selected_mask)
+        controls.append(InlineKeyboardButton(
+            text=f"➡ Далее ({mask_count(selected_mask)} • {selected_sum:.2f})", callback_data="split_next_step"))
     controls.append(InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_check"))
     buttons.append(controls)
-    
-    return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-def get_categories_inline_keyboard(categories: list[str], prefix: str = "splitcat") -> InlineKeyboardMarkup:
-    """Кнопки категорий для сплита"""
-    buttons = [
-        InlineKeyboardButton(text=cat, callback_data=f"{prefix}_{cat}")
-        for cat in categories
-    ]
-    # Разбиваем на ряды по 2
-    rows = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
-    return InlineKeyboardMarkup(inline_keyboard=rows)
+    keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
+    if session_id:
+        _page_cache[key] = keyboard
+        if len(_page_cache) > SPLIT_PAGE_CACHE_SIZE:
+            _page_cache.popitem(last=False)
+    return keyboard
+
+
+def get_items_keyboard(items: list[CheckItem], selected_indices: set[int]) -> InlineKeyboardMarkup:
+    """Генерирует клавиатуру для выбора товаров (первая страница)."""
+    items_raw = [item.model_dump() if isinstance(item, CheckItem) else item for item in items]
+    selected_mask = 0
+    for index in selected_indices:
+        selected_mask |= 1 << index
+    return get_items_page_keyboard(items_raw, full_mask(len(items_raw)), selected_mask, page=0)
+
+
+def get_categories_inline_keyboard(transaction_type: str = "Расход", prefix: str = "splitcat") -> InlineKeyboardMarkup:
+    """Кнопки категорий для сплита (кэшируются по версии реестра категорий)"""
+    return get_category_inline_keyboard(transaction_type, prefix)
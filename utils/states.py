@@ -13,3 +13,4 @@ class TransactionStates(StatesGroup):
     waiting_for_category_selection = State()  # Состояние ожидания выбора категории
     splitting_items = State() # Выбор товаров для разделения
     splitting_choose_category = State() # Выбор категории для группы товаров
+    confirming_album = State() # Подтверждение всех чеков альбома
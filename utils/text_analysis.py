@@ -0,0 +1,85 @@
+"""
+Модуль для однократного анализа текста транзакции.
+AnalyzedText вычисляет токены, биграммы, леммы и ML-признаки один раз и передается
+во все этапы классификации (поиск по словарю ключевых слов и ML-предсказание).
+"""
+import re
+from functools import cached_property
+from typing import List, Union
+
+from utils.lemmatizer import get_lemmatizer
+
+WORD_PATTERN = re.compile(r'\b[а-яёa-z]+\b')
+
+
+class AnalyzedText:
+    """
+    Результат анализа текста. Тяжелые поля (леммы, признаки) вычисляются лениво
+    при первом обращении и затем переиспользуются всеми этапами классификации.
+    """
+
+    def __init__(self, text: str):
+        self.text = text or ""
+        # Нормализованный текст: нижний регистр, без пробелов по краям
+        self.normalized = self.text.strip().lower()
+        # Токены по пробелам (как в индексах KeywordDictionary)
+        self.words: List[str] = self.normalized.split()
+
+    @cached_property
+    def bigrams(self) -> List[str]:
+        """Биграммы из соседних токенов"""
+        return [f"{self.words[i]} {self.words[i + 1]}" for i in range(len(self.words) - 1)]
+
+    @cached_property
+    def alpha_words(self) -> List[str]:
+        """Слова, состоящие только из букв (без цифр и знаков)"""
+        return WORD_PATTERN.findall(self.text.lower())
+
+    @cached_property
+    def lemmas(self) -> List[str]:
+        """Леммы буквенных слов"""
+        return get_lemmatizer().lemmatize_many(self.alpha_words)
+
+    @cached_property
+    def lemmatized_text(self) -> str:
+        """Лемматизированный текст (эквивалент Lemmatizer.lemmatize_text)"""
+        if not get_lemmatizer().morph_analyzer:
+            return self.text.lower()
+        return ' '.join(self.lemmas)
+
+    @cached_property
+    def lemmatized_words(self) -> List[str]:
+        """Токены лемматизированного текста"""
+        return self.lemmatized_text.split()
+
+    @cached_property
+    def lemmatized_bigrams(self) -> List[str]:
+        """Биграммы лемматизированного текста"""
+        words = self.lemmatized_words
+        return [f"{words[i]} {words[i + 1]}" for i in range(len(words) - 1)]
+
+    @cached_property
+    def features(self) -> List[str]:
+        """
+        Признаки для ML-классификатора: леммы длиной от 3 символов и биграммы лемм
+        """
+        if get_lemmatizer().morph_analyzer:
+            # лемматизируем только слова длиной 2 символа и более
+            words = [lemma for word, lemma in zip(self.alpha_words, self.lemmas) if len(word) >= 2]
+        else:
+            words = self.alpha_words
+
+        features = [word for word in words if len(word) >= 3]
+        for i in range(len(words) - 1):
+            if len(words[i]) >= 2 and len(words[i + 1]) >= 2:
+                features.append(f"{words[i]}_{words[i + 1]}")
+
+        # Убираем дубликаты
+        return list(set(features))
+
+
+def analyze_text(text: Union[str, AnalyzedText]) -> AnalyzedText:
+    """Возвращает AnalyzedText для строки; готовый AnalyzedText возвращается как есть"""
+    if isinstance(text, AnalyzedText):
+        return text
+    return AnalyzedText(text)